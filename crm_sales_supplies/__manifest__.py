@@ -18,6 +18,7 @@
         'data/purchase_alert_data.xml',
         'data/leasing_data.xml',
         'security/ir.model.access.csv',
+        'data/notification_outbox_data.xml',
         'views/purchase_alert_views.xml',
         'views/crm_lead_views.xml',
         'views/sale_order_views.xml',
@@ -7,6 +7,8 @@ from . import purchase_order
 from . import purchase_alert
 from . import purchase_alert_line
 from . import purchase_alert_component_line
+from . import purchase_alert_planner
+from . import notification_outbox
 from . import stock_quant
 from . import stock_picking
 from . import stock_move
@@ -15,4 +17,4 @@ from . import leasing_contract
 from . import leasing_contract_template
 from . import product_template
 from . import product_product
-
+from . import res_users
@@ -253,13 +253,8 @@ class CrmLead(models.Model):
         # Obtener alertas existentes antes de crear nuevas
         existing_alert_ids = self.purchase_alert_ids.filtered(lambda a: a.state == 'pending').ids
         
-        # Verificar stock y crear alertas automáticamente para cada orden
-        for order in quotation_orders:
-            # Verificar stock y crear alertas si es necesario
-            if order.warehouse_id:
-                order._compute_stock_availability()
-                order.flush_recordset()
-                order.sudo()._create_purchase_alerts_automatically()
+        # Verificar stock y crear alertas automáticamente para todas las órdenes en un solo lote
+        quotation_orders.filtered('warehouse_id').sudo()._create_purchase_alerts_automatically()
         
         # Obtener alertas después de crear
         self.invalidate_recordset(['purchase_alert_ids'])
@@ -316,13 +311,8 @@ class CrmLead(models.Model):
         # Obtener alertas existentes antes de crear nuevas
         existing_alert_ids = self.purchase_alert_ids.filtered(lambda a: a.state == 'pending').ids
         
-        # Verificar stock y crear alertas automáticamente para cada orden confirmada
-        for order in confirmed_orders:
-            # Verificar stock y crear alertas si es necesario
-            if order.warehouse_id:
-                order._compute_stock_availability()
-                order.flush_recordset()
-                order.sudo()._create_purchase_alerts_automatically()
+        # Verificar stock y crear alertas automáticamente para todas las órdenes en un solo lote
+        confirmed_orders.filtered('warehouse_id').sudo()._create_purchase_alerts_automatically()
         
         # Obtener alertas después de crear
         self.invalidate_recordset(['purchase_alert_ids'])
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+from datetime import timedelta
+
+from odoo import api, fields, models
+from odoo.tools import split_every
+import logging
+
+_logger = logging.getLogger(__name__)
+
+OUTBOX_KEY = 'crm_sales_supplies.notification_outbox'
+DISPATCH_MODE_PARAM = 'crm_sales_supplies.notification_dispatch_mode'
+
+
+class PurchaseNotificationOutbox(models.AbstractModel):
+    """Bandeja de salida de actividades y mensajes de alertas y cotizaciones.
+
+    Las actividades y mensajes se acumulan durante la transacción, se deduplican
+    por (registro, usuario) y se crean en lote justo antes del commit. Con el
+    parámetro ``crm_sales_supplies.notification_dispatch_mode = cron`` se encolan
+    en ``purchase.notification.queue`` y los envía el cron.
+    """
+    _name = 'purchase.notification.outbox'
+    _description = 'Bandeja de Salida de Notificaciones de Compras'
+
+    @api.model
+    def _get_outbox(self):
+        """Devolver la bandeja de la transacción actual, registrando el vaciado previo al commit."""
+        data = self.env.cr.precommit.data
+        if OUTBOX_KEY not in data:
+            data[OUTBOX_KEY] = {'activities': {}, 'messages': {}}
+            env = self.env
+            self.env.cr.precommit.add(lambda: env['purchase.notification.outbox'].sudo()._flush_outbox())
+        return data[OUTBOX_KEY]
+
+    @api.model
+    def enqueue_activity(self, record, user_id, summary, note='', activity_type_id=False, date_deadline=False):
+        """Programar una actividad; la última programada por (registro, usuario, resumen) gana."""
+        key = (record._name, record.id, user_id, summary)
+        self._get_outbox()['activities'][key] = {
+            'res_model': record._name,
+            'res_id': record.id,
+            'user_id': user_id,
+            'summary': summary,
+            'note': note,
+            'activity_type_id': activity_type_id,
+            'date_deadline': fields.Date.to_string(date_deadline or fields.Date.today()),
+        }
+
+    @api.model
+    def enqueue_message(self, record, body, subject=False, partner_ids=None, message_type='comment'):
+        """Programar un mensaje en el chatter; los mensajes idénticos por registro se envían una vez."""
+        key = (record._name, record.id, str(body))
+        self._get_outbox()['messages'][key] = {
+            'res_model': record._name,
+            'res_id': record.id,
+            'body': str(body),
+            'subject': subject or False,
+            'partner_ids': sorted(set(partner_ids or [])),
+            'message_type': message_type,
+        }
+
+    @api.model
+    def _flush_outbox(self):
+        """Vaciar la bandeja de la transacción: despachar ahora o encolar para el cron."""
+        outbox = self.env.cr.precommit.data.pop(OUTBOX_KEY, None)
+        if not outbox:
+            return
+        activities = list(outbox['activities'].values())
+        messages = list(outbox['messages'].values())
+        if not activities and not messages:
+            return
+
+        mode = self.env['ir.config_parameter'].sudo().get_param(DISPATCH_MODE_PARAM, 'commit')
+        if mode == 'cron':
+            self.env['purchase.notification.queue'].sudo().create(
+                [{'kind': 'activity', 'payload': vals} for vals in activities]
+                + [{'kind': 'message', 'payload': vals} for vals in messages]
+            )
+        else:
+            self._dispatch(activities, messages)
+        # Los hooks precommit corren después del flush del cursor: escribir lo pendiente
+        # (recálculos de mail.activity, notificaciones) como hace mail en _track_finalize
+        self.env.flush_all()
+
+    @api.model
+    def _dispatch(self, activities, messages):
+        """Crear las actividades con un solo create y publicar los mensajes agrupados por registro."""
+        if activities:
+            activities = self._filter_recent_activities(activities)
+            model_ids = {
+                model: self.env['ir.model']._get_id(model)
+                for model in {vals['res_model'] for vals in activities}
+            }
+            self.env['mail.activity'].sudo().create([{
+                'res_model_id': model_ids[vals['res_model']],
+                'res_id': vals['res_id'],
+                'user_id': vals['user_id'],
+                'summary': vals['summary'],
+                'note': vals['note'],
+                'activity_type_id': vals['activity_type_id'],
+                'date_deadline': vals['date_deadline'],
+            } for vals in activities])
+
+        # Los mensajes sin destinatarios se registran en lote por cuerpo; el resto requiere message_post
+        logs = {}
+        for vals in messages:
+            record = self.env[vals['res_model']].browse(vals['res_id']).exists()
+            if not record:
+                continue
+            if vals['partner_ids']:
+                record.message_post(
+                    body=vals['body'],
+                    subject=vals['subject'],
+                    partner_ids=vals['partner_ids'],
+                    message_type=vals['message_type'],
+                )
+            else:
+                logs.setdefault((vals['res_model'], vals['body']), []).append(vals['res_id'])
+        for (model, body), res_ids in logs.items():
+            self.env[model].browse(res_ids)._message_log_batch(bodies=dict.fromkeys(res_ids, body))
+
+        _logger.info("Bandeja de notificaciones: %s actividades y %s mensajes despachados", len(activities), len(messages))
+
+    @api.model
+    def _filter_recent_activities(self, activities):
+        """Descartar actividades idénticas creadas en los últimos 5 minutos (una sola búsqueda)."""
+        five_minutes_ago = fields.Datetime.now() - timedelta(minutes=5)
+        recent = self.env['mail.activity'].sudo().search_read([
+            ('res_id', 'in', list({vals['res_id'] for vals in activities})),
+            ('res_model', 'in', list({vals['res_model'] for vals in activities})),
+            ('summary', 'in', list({vals['summary'] for vals in activities})),
+            ('create_date', '>=', five_minutes_ago),
+        ], ['res_model', 'res_id', 'user_id', 'summary'])
+        existing = {(a['res_model'], a['res_id'], a['user_id'][0], a['summary']) for a in recent if a['user_id']}
+        return [
+            vals for vals in activities
+            if (vals['res_model'], vals['res_id'], vals['user_id'], vals['summary']) not in existing
+        ]
+
+
+class PurchaseNotificationQueue(models.Model):
+    """Notificaciones pendientes de envío por el cron (modo ``cron`` de la bandeja)."""
+    _name = 'purchase.notification.queue'
+    _description = 'Cola de Notificaciones de Compras'
+    _order = 'id'
+
+    kind = fields.Selection([
+        ('activity', 'Actividad'),
+        ('message', 'Mensaje'),
+    ], string='Tipo', required=True)
+    payload = fields.Json(string='Datos', required=True)
+
+    @api.model
+    def _cron_dispatch_notifications(self, limit=1000, chunk_size=100):
+        """Despachar las notificaciones encoladas en lotes.
+
+        Cada lote se despacha dentro de un savepoint; si falla, se reintenta
+        elemento por elemento y los que siguen fallando se descartan con un
+        registro en el log, para que un dato inválido no bloquee la cola.
+        """
+        pending = self.search([], limit=limit)
+        if not pending:
+            return
+        Outbox = self.env['purchase.notification.outbox']
+        done = self.browse()
+        failed = self.browse()
+        for chunk in split_every(chunk_size, pending.ids, self.browse):
+            try:
+                with self.env.cr.savepoint():
+                    chunk._dispatch_items(Outbox)
+                done |= chunk
+                continue
+            except Exception:
+                _logger.warning("Cola de notificaciones: falló el lote %s, se reintenta por elemento", chunk.ids)
+            for item in chunk:
+                try:
+                    with self.env.cr.savepoint():
+                        item._dispatch_items(Outbox)
+                    done |= item
+                except Exception:
+                    _logger.exception("Cola de notificaciones: se descarta la notificación %s (%s): %s",
+                                      item.id, item.kind, item.payload)
+                    failed |= item
+        (done | failed).unlink()
+
+    def _dispatch_items(self, outbox):
+        outbox._dispatch(
+            [item.payload for item in self if item.kind == 'activity'],
+            [item.payload for item in self if item.kind == 'message'],
+        )
+        self.env.flush_all()
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError
+from odoo.tools import float_compare
 from datetime import datetime, timedelta
 import logging
 
@@ -64,21 +65,21 @@ class PurchaseAlert(models.Model):
     )
     quantity_requested = fields.Float(
         string='Cantidad Solicitada',
-        compute='_compute_total_quantities',
+        compute='_compute_quantity_requested',
         readonly=True,
-        store=False,
+        store=True,
         help='Cantidad total solicitada (suma de todas las líneas)',
     )
     quantity_available = fields.Float(
         string='Stock Disponible',
-        compute='_compute_total_quantities',
+        compute='_compute_stock_quantities',
         readonly=True,
         store=False,
         help='Stock disponible total (suma de todas las líneas)',
     )
     quantity_missing = fields.Float(
         string='Cantidad Faltante',
-        compute='_compute_total_quantities',
+        compute='_compute_stock_quantities',
         readonly=True,
         store=False,
         help='Cantidad faltante total (suma de todas las líneas)',
@@ -105,17 +106,15 @@ class PurchaseAlert(models.Model):
     
     @api.model
     def _compute_user_has_crm_access(self):
-        """Calcular si el usuario tiene acceso de CRM."""
-        user = self.env.user
-        # Verificar si el usuario tiene acceso de ventas/CRM pero NO solo de compras
-        has_sales_access = user.has_group('sales_team.group_sale_manager') or user.has_group('sales_team.group_sale_salesman')
-        has_only_purchase = user.has_group('purchase.group_purchase_user') and not has_sales_access
-        return not has_only_purchase
+        """Calcular si el usuario tiene acceso de CRM (en caché por usuario)."""
+        return self.env['res.users']._purchase_alert_has_crm_access()
     
+    @api.depends_context('uid')
     def _compute_user_has_crm_access_instance(self):
-        """Calcular si el usuario tiene acceso de CRM (método de instancia)."""
+        """Asignar el mismo valor por usuario a todas las alertas, sin revisar grupos por fila."""
+        has_access = self._compute_user_has_crm_access()
         for alert in self:
-            alert.user_has_crm_access = self._compute_user_has_crm_access()
+            alert.user_has_crm_access = has_access
     
     @api.depends('alert_line_ids')
     def _compute_has_multiple_products(self):
@@ -123,17 +122,26 @@ class PurchaseAlert(models.Model):
         for alert in self:
             alert.has_multiple_products = len(alert.alert_line_ids) > 1
     
-    @api.depends('alert_line_ids.quantity_requested', 'alert_line_ids.quantity_available', 'alert_line_ids.quantity_missing')
-    def _compute_total_quantities(self):
-        """Calcular totales de cantidad solicitada, disponible y faltante."""
+    @api.depends('alert_line_ids.quantity_requested', 'product_id')
+    def _compute_quantity_requested(self):
+        """Calcular la cantidad total solicitada (almacenada para ordenar y agrupar en SQL)."""
         for alert in self:
             if alert.alert_line_ids:
                 alert.quantity_requested = sum(alert.alert_line_ids.mapped('quantity_requested'))
-                alert.quantity_available = sum(alert.alert_line_ids.mapped('quantity_available'))
-                alert.quantity_missing = sum(alert.alert_line_ids.mapped('quantity_missing'))
             else:
                 # Si no hay líneas, usar valores del producto principal (compatibilidad hacia atrás)
                 alert.quantity_requested = alert.product_id and 1.0 or 0.0
+
+    @api.depends('alert_line_ids.quantity_available', 'alert_line_ids.quantity_missing', 'quantity_requested')
+    def _compute_stock_quantities(self):
+        """Calcular stock disponible y faltante (dependen del stock actual, no se almacenan)."""
+        # Calcular el stock de las líneas de todas las alertas a la vez
+        self.alert_line_ids.mapped('quantity_available')
+        for alert in self:
+            if alert.alert_line_ids:
+                alert.quantity_available = sum(alert.alert_line_ids.mapped('quantity_available'))
+                alert.quantity_missing = sum(alert.alert_line_ids.mapped('quantity_missing'))
+            else:
                 alert.quantity_available = 0.0
                 alert.quantity_missing = alert.quantity_requested
     purchase_order_id = fields.Many2one(
@@ -167,6 +175,7 @@ class PurchaseAlert(models.Model):
         string='Número de Cotizaciones',
         compute='_compute_purchase_order_count',
         readonly=True,
+        store=True,
         help='Número de cotizaciones creadas para esta alerta',
     )
     
@@ -248,37 +257,37 @@ class PurchaseAlert(models.Model):
         help='Todos los componentes, periféricos y complementos unificados',
     )
     
-    @api.model
-    def create(self, vals):
-        """Crear líneas de componentes al crear la alerta."""
-        # Generar nombre automático para la alerta
-        if not vals.get('name') or vals.get('name') == _('Nueva Alerta'):
-            try:
-                seq = self.env['ir.sequence'].next_by_code('purchase.alert') or _('Nueva Alerta')
-            except Exception:
-                seq = _('Nueva Alerta')
-            vals['name'] = seq
-        
-        # Asignar partner_id desde lead_id si no está definido
-        if not vals.get('partner_id') and vals.get('lead_id'):
-            lead = self.env['crm.lead'].browse(vals['lead_id'])
-            if lead and lead.partner_id:
-                vals['partner_id'] = lead.partner_id.id
-        
-        # Asignar lead_id desde sale_order_id si no está definido
-        if not vals.get('lead_id') and vals.get('sale_order_id'):
-            sale_order = self.env['sale.order'].browse(vals['sale_order_id'])
-            if sale_order and sale_order.opportunity_id:
-                vals['lead_id'] = sale_order.opportunity_id.id
-        
-        # Crear la alerta
-        alert = super().create(vals)
-        
-        # Actualizar líneas después de crear (necesitamos el ID)
-        if alert.alert_line_ids or alert.product_id:
-            alert._update_component_lines()
-        
-        return alert
+    @api.model_create_multi
+    def create(self, vals_list):
+        """Crear líneas de componentes al crear las alertas."""
+        for vals in vals_list:
+            # Generar nombre automático para la alerta
+            if not vals.get('name') or vals.get('name') == _('Nueva Alerta'):
+                try:
+                    seq = self.env['ir.sequence'].next_by_code('purchase.alert') or _('Nueva Alerta')
+                except Exception:
+                    seq = _('Nueva Alerta')
+                vals['name'] = seq
+
+            # Asignar partner_id desde lead_id si no está definido
+            if not vals.get('partner_id') and vals.get('lead_id'):
+                lead = self.env['crm.lead'].browse(vals['lead_id'])
+                if lead and lead.partner_id:
+                    vals['partner_id'] = lead.partner_id.id
+
+            # Asignar lead_id desde sale_order_id si no está definido
+            if not vals.get('lead_id') and vals.get('sale_order_id'):
+                sale_order = self.env['sale.order'].browse(vals['sale_order_id'])
+                if sale_order and sale_order.opportunity_id:
+                    vals['lead_id'] = sale_order.opportunity_id.id
+
+        # Crear las alertas
+        alerts = super().create(vals_list)
+
+        # Actualizar líneas después de crear (necesitamos los IDs), todas en un solo lote
+        alerts.filtered(lambda a: a.alert_line_ids or a.product_id)._update_component_lines()
+
+        return alerts
     
     
     def _delete_existing_component_lines(self):
@@ -293,17 +302,9 @@ class PurchaseAlert(models.Model):
         ])
         if existing_lines:
             _logger.info("Eliminando %s líneas existentes para alerta %s", len(existing_lines), self.id)
-            existing_lines.unlink()
+            existing_lines.with_context(purchase_alert_sync_lines=True).unlink()
             # NO invalidar cache aquí para evitar bucles infinitos
     
-    @api.model
-    def _search(self, domain, offset=0, limit=None, order=None):
-        """Sobrescribir search - NO crear líneas automáticamente para evitar duplicados."""
-        result = super()._search(domain, offset=offset, limit=limit, order=order)
-        # NO crear líneas automáticamente aquí - solo se crearán en create() o write()
-        # Esto evita duplicados cuando se valida o se accede a una alerta existente
-        return result
-    
     def write(self, vals):
         """Actualizar líneas de componentes cuando cambia el producto, cantidad o alert_line_ids."""
         # Actualizar líneas si cambia el producto, cantidad o alert_line_ids
@@ -312,18 +313,10 @@ class PurchaseAlert(models.Model):
         result = super().write(vals)
         
         if should_update_lines:
-            for alert in self:
-                if alert.id and (alert.alert_line_ids or alert.product_id):
-                    alert._update_component_lines()
+            self.filtered(lambda a: a.alert_line_ids or a.product_id)._update_component_lines()
         
         return result
     
-    @api.model
-    def read_group(self, domain, fields, groupby, offset=0, limit=None, orderby=False, lazy=True):
-        """Sobrescribir para asegurar que las líneas se carguen."""
-        result = super().read_group(domain, fields, groupby, offset=offset, limit=limit, orderby=orderby, lazy=lazy)
-        return result
-    
     def action_refresh_component_lines(self):
         """Acción para refrescar manualmente las líneas de componentes."""
         self.ensure_one()
@@ -383,9 +376,10 @@ class PurchaseAlert(models.Model):
             dict(self._fields['state'].selection).get(self.state, self.state)
         )
         
-        # Enviar mensaje
-        self.message_post(
-            body=message_body,
+        # Enviar mensaje (se despacha en lote al confirmar la transacción)
+        self.env['purchase.notification.outbox'].enqueue_message(
+            self,
+            message_body,
             subject=_('Notificación: %s') % self.name,
             partner_ids=purchase_users.partner_id.ids,
             message_type='notification',
@@ -474,18 +468,14 @@ class PurchaseAlert(models.Model):
                 ('name', '=', 'To Do')
             ], limit=1)
         
-        # Crear la actividad
-        activity_vals = {
-            'res_id': self.id,
-            'res_model_id': self.env['ir.model']._get_id('purchase.alert'),
-            'activity_type_id': activity_type.id if activity_type else False,
-            'user_id': self.create_uid.id,
-            'summary': _('Cotizaciones listas para validar - Alerta %s') % self.name,
-            'note': message,
-            'date_deadline': fields.Date.today(),
-        }
-        
-        activity = self.env['mail.activity'].create(activity_vals)
+        # Programar la actividad (se crea en lote al confirmar la transacción)
+        self.env['purchase.notification.outbox'].enqueue_activity(
+            self,
+            self.create_uid.id,
+            _('Cotizaciones listas para validar - Alerta %s') % self.name,
+            note=message,
+            activity_type_id=activity_type.id if activity_type else False,
+        )
         
         return {
             'type': 'ir.actions.client',
@@ -550,164 +540,67 @@ class PurchaseAlert(models.Model):
             }
         }
     
+    def _get_component_line_sources(self):
+        """Devolver [(alerta, producto padre, cantidad)] a expandir para cada alerta."""
+        sources = []
+        for alert in self:
+            # Con múltiples productos se expanden todas las líneas; si no, el producto principal
+            if len(alert.alert_line_ids) > 1:
+                for alert_line in alert.alert_line_ids:
+                    if alert_line.product_id:
+                        sources.append((alert, alert_line.product_id, alert_line.quantity_requested or 1.0))
+            elif alert.product_id:
+                qty_multiplier = alert.alert_line_ids[:1].quantity_requested or alert.quantity_requested or 1.0
+                sources.append((alert, alert.product_id, qty_multiplier))
+        return sources
+
     def _update_component_lines(self):
-        """Actualizar las líneas de componentes, periféricos y complementos."""
-        self.ensure_one()
-        
-        _logger.info("_update_component_lines llamado para alerta %s", self.id)
-        
-        # Si no hay ID, no hacer nada
-        if not self.id:
-            return
-        
-        # SIEMPRE eliminar líneas existentes ANTES de crear nuevas para evitar duplicados
-        self._delete_existing_component_lines()
-        
-        # Si hay múltiples productos, mostrar componentes de todos los productos
-        # Verificar directamente si hay más de una línea en lugar de depender del campo computed
-        has_multiple = len(self.alert_line_ids) > 1
-        if has_multiple and self.alert_line_ids:
-            _logger.info("Alerta tiene múltiples productos, mostrando componentes de todos")
-            ComponentLine = self.env['purchase.alert.component.line'].sudo()
-            component_lines = []
-            peripheral_lines = []
-            complement_lines = []
-            
-            # Recopilar componentes de todos los productos
-            for alert_line in self.alert_line_ids:
-                if not alert_line.product_id:
-                    continue
-                
-                parent_product = alert_line.product_id
-                template = parent_product.product_tmpl_id
-                qty_multiplier = alert_line.quantity_requested or 1.0
-                
-                # Componentes
-                for comp_line in template.composite_line_ids:
-                    if comp_line.component_product_id:
-                        component_lines.append({
-                            'alert_id': self.id,
-                            'product_id': comp_line.component_product_id.id,
-                            'quantity': comp_line.component_qty * qty_multiplier,
-                            'uom_id': comp_line.component_product_id.uom_id.id,
-                            'item_type': 'component',
-                            'parent_product_id': parent_product.id,
-                        })
-                
-                # Periféricos
-                for per_line in template.peripheral_line_ids:
-                    if per_line.peripheral_product_id:
-                        peripheral_lines.append({
-                            'alert_id': self.id,
-                            'product_id': per_line.peripheral_product_id.id,
-                            'quantity': per_line.peripheral_qty * qty_multiplier,
-                            'uom_id': per_line.peripheral_product_id.uom_id.id,
-                            'item_type': 'peripheral',
-                            'parent_product_id': parent_product.id,
-                        })
-                
-                # Complementos
-                for comp_line in template.complement_line_ids:
-                    if comp_line.complement_product_id:
-                        complement_lines.append({
-                            'alert_id': self.id,
-                            'product_id': comp_line.complement_product_id.id,
-                            'quantity': comp_line.complement_qty * qty_multiplier,
-                            'uom_id': comp_line.complement_product_id.uom_id.id,
-                            'item_type': 'complement',
-                            'parent_product_id': parent_product.id,
-                        })
-            
-            # Crear todas las líneas
-            if component_lines:
-                ComponentLine.create(component_lines)
-            if peripheral_lines:
-                ComponentLine.create(peripheral_lines)
-            if complement_lines:
-                ComponentLine.create(complement_lines)
-            
-            _logger.info("Creadas %s líneas de componentes, %s de periféricos, %s de complementos",
-                        len(component_lines), len(peripheral_lines), len(complement_lines))
-            return
-        
-        # Si hay un solo producto principal
-        if not self.product_id:
-            _logger.info("No hay producto principal definido")
+        """Actualizar las líneas de componentes, periféricos y complementos de las alertas.
+
+        Usa la tabla de expansión precalculada de las plantillas (product_suppiles),
+        procesa todas las alertas del recordset a la vez y solo reemplaza las líneas
+        que realmente cambiaron.
+        """
+        alerts = self.filtered('id')
+        if not alerts:
             return
-        
-        template = self.product_id.product_tmpl_id
-        # Usar cantidad del producto principal o de la primera línea
-        if self.alert_line_ids:
-            qty_multiplier = self.alert_line_ids[0].quantity_requested or 1.0
-        else:
-            qty_multiplier = self.quantity_requested or 1.0
-        
-        _logger.info("Template: %s, Componentes: %s, Periféricos: %s, Complementos: %s", 
-                    template.name,
-                    len(template.composite_line_ids),
-                    len(template.peripheral_line_ids),
-                    len(template.complement_line_ids))
-        
+
+        sources = alerts._get_component_line_sources()
+        templates = self.env['product.product'].browse([product.id for _alert, product, _qty in sources]).product_tmpl_id
+        expansion = templates._get_expansion_map()
+
+        # Líneas deseadas: (alerta, tipo, producto, padre, unidad) -> cantidad
+        desired = {}
+        for alert, parent_product, qty_multiplier in sources:
+            for row in expansion.get(parent_product.product_tmpl_id.id, []):
+                key = (alert.id, row['item_type'], row['product_id'], parent_product.id, row['uom_id'])
+                desired[key] = desired.get(key, 0.0) + row['quantity'] * qty_multiplier
+
         ComponentLine = self.env['purchase.alert.component.line'].sudo()
-        
-        # Componentes
-        component_lines = []
-        for comp_line in template.composite_line_ids:
-            if comp_line.component_product_id:
-                component_lines.append({
-                    'alert_id': self.id,
-                    'product_id': comp_line.component_product_id.id,
-                    'quantity': comp_line.component_qty * qty_multiplier,
-                    'uom_id': comp_line.component_uom_id.id or comp_line.component_product_id.uom_id.id,
-                    'item_type': 'component',
-                    'parent_product_id': self.product_id.id,
-                })
-        if component_lines:
-            _logger.info("Creando %s líneas de componentes", len(component_lines))
-            created = ComponentLine.create(component_lines)
-            _logger.info("Líneas de componentes creadas: %s", created.ids)
-        else:
-            _logger.info("No hay componentes para crear")
-        
-        # Periféricos
-        peripheral_lines = []
-        for peri_line in template.peripheral_line_ids:
-            if peri_line.peripheral_product_id:
-                peripheral_lines.append({
-                    'alert_id': self.id,
-                    'product_id': peri_line.peripheral_product_id.id,
-                    'quantity': peri_line.peripheral_qty * qty_multiplier,
-                    'uom_id': peri_line.peripheral_uom_id.id or peri_line.peripheral_product_id.uom_id.id,
-                    'item_type': 'peripheral',
-                    'parent_product_id': self.product_id.id,
-                })
-        if peripheral_lines:
-            _logger.info("Creando %s líneas de periféricos", len(peripheral_lines))
-            created = ComponentLine.create(peripheral_lines)
-            _logger.info("Líneas de periféricos creadas: %s", created.ids)
-        else:
-            _logger.info("No hay periféricos para crear")
-        
-        # Complementos
-        complement_lines = []
-        for compl_line in template.complement_line_ids:
-            if compl_line.complement_product_id:
-                complement_lines.append({
-                    'alert_id': self.id,
-                    'product_id': compl_line.complement_product_id.id,
-                    'quantity': compl_line.complement_qty * qty_multiplier,
-                    'uom_id': compl_line.complement_uom_id.id or compl_line.complement_product_id.uom_id.id,
-                    'item_type': 'complement',
-                    'parent_product_id': self.product_id.id,
-                })
-        if complement_lines:
-            _logger.info("Creando %s líneas de complementos", len(complement_lines))
-            created = ComponentLine.create(complement_lines)
-            _logger.info("Líneas de complementos creadas: %s", created.ids)
-        else:
-            _logger.info("No hay complementos para crear")
-        
-        # NO invalidar cache para evitar bucles infinitos
+        to_unlink = ComponentLine
+        for line in ComponentLine.search([('alert_id', 'in', alerts.ids)]):
+            key = (line.alert_id.id, line.item_type, line.product_id.id, line.parent_product_id.id, line.uom_id.id)
+            if key not in desired:
+                to_unlink |= line
+                continue
+            quantity = desired.pop(key)
+            if float_compare(line.quantity, quantity, precision_digits=4) != 0:
+                line.write({'quantity': quantity})
+
+        if to_unlink:
+            to_unlink.with_context(purchase_alert_sync_lines=True).unlink()
+        if desired:
+            ComponentLine.create([{
+                'alert_id': alert_id,
+                'item_type': item_type,
+                'product_id': product_id,
+                'parent_product_id': parent_product_id,
+                'uom_id': uom_id,
+                'quantity': quantity,
+            } for (alert_id, item_type, product_id, parent_product_id, uom_id), quantity in desired.items()])
+
+        _logger.info("Líneas de componentes sincronizadas para %s alerta(s): %s eliminadas, %s creadas",
+                     len(alerts), len(to_unlink), len(desired))
 
 
     @api.model
@@ -947,64 +840,51 @@ class PurchaseAlert(models.Model):
                 note_content += _('<li>Rechazadas: %s de %s</li>') % (rejected_count, total_count)
                 note_content += '</ul>'
         
-        # Verificar si ya existe una actividad reciente similar para evitar duplicados
-        # Buscar actividades creadas en los últimos 5 minutos con el mismo resumen
-        five_minutes_ago = fields.Datetime.to_datetime(fields.Datetime.now()) - timedelta(minutes=5)
-        recent_activities = self.env['mail.activity'].search([
-            ('res_id', '=', self.id),
-            ('res_model', '=', 'purchase.alert'),
-            ('summary', '=', summary),
-            ('create_date', '>=', fields.Datetime.to_string(five_minutes_ago)),
-        ])
-        
-        if recent_activities:
-            _logger.info("Ya existe una actividad reciente para alerta %s con resumen '%s'. No se creará duplicado.", 
-                        self.name, summary)
-            return
-        
-        # Crear una actividad por cada comprador único
-        activity_type = self.env['mail.activity.type'].search([
-            ('name', 'ilike', 'aprobar' if action_type == 'approved' else 'rechazar'),
-            ('res_model', '=', 'purchase.alert'),
-        ], limit=1)
+        # Buscar el tipo de actividad (en caché por transacción para aprobaciones masivas)
+        activity_type_id = self._get_approval_activity_type_id(action_type)
         
-        if not activity_type:
-            activity_type = self.env['mail.activity.type'].search([
-                ('res_model', '=', 'purchase.alert'),
-            ], limit=1)
-        
-        if not activity_type:
-            activity_type = self.env['mail.activity.type'].search([
-                ('name', '=', 'To Do'),
-            ], limit=1)
-        
-        # Crear actividad para cada comprador único
+        # Programar una actividad por comprador único; la bandeja de salida las deduplica
+        # (también contra las creadas en los últimos 5 minutos) y las crea en un solo lote
+        outbox = self.env['purchase.notification.outbox']
         for buyer in buyers:
-            try:
-                activity_vals = {
-                    'res_id': self.id,
-                    'res_model_id': self.env['ir.model']._get_id('purchase.alert'),
-                    'activity_type_id': activity_type.id if activity_type else False,
-                    'summary': summary,
-                    'note': note_content,
-                    'user_id': buyer.id,
-                    'date_deadline': fields.Date.today(),
-                }
-                
-                activity = self.env['mail.activity'].create(activity_vals)
-                _logger.info("Actividad consolidada creada para alerta %s, comprador %s: ID=%s", 
-                           self.name, buyer.name, activity.id)
-            except Exception as e:
-                _logger.error("Error creando actividad consolidada para alerta %s, comprador %s: %s", 
-                            self.name, buyer.name, str(e), exc_info=True)
+            outbox.enqueue_activity(
+                self,
+                buyer.id,
+                summary,
+                note=note_content,
+                activity_type_id=activity_type_id,
+            )
         
         # Agregar mensaje en la alerta
         if action_type == 'approved':
-            self.message_post(
-                body=_('✅ Actividades de notificación creadas para los compradores sobre la aprobación de cotizaciones.'),
+            outbox.enqueue_message(
+                self,
+                _('✅ Actividades de notificación creadas para los compradores sobre la aprobación de cotizaciones.'),
             )
         else:
-            self.message_post(
-                body=_('❌ Actividades de notificación creadas para los compradores sobre el rechazo de cotizaciones.'),
+            outbox.enqueue_message(
+                self,
+                _('❌ Actividades de notificación creadas para los compradores sobre el rechazo de cotizaciones.'),
             )
 
+    @api.model
+    def _get_approval_activity_type_id(self, action_type):
+        """Tipo de actividad para notificar aprobaciones o rechazos, resuelto una vez por transacción."""
+        cache = self.env.cr.cache.setdefault('crm_sales_supplies.approval_activity_type', {})
+        if action_type not in cache:
+            activity_type = self.env['mail.activity.type'].search([
+                ('name', 'ilike', 'aprobar' if action_type == 'approved' else 'rechazar'),
+                ('res_model', '=', 'purchase.alert'),
+            ], limit=1)
+            
+            if not activity_type:
+                activity_type = self.env['mail.activity.type'].search([
+                    ('res_model', '=', 'purchase.alert'),
+                ], limit=1)
+            
+            if not activity_type:
+                activity_type = self.env['mail.activity.type'].search([
+                    ('name', '=', 'To Do'),
+                ], limit=1)
+            cache[action_type] = activity_type.id or False
+        return cache[action_type]
@@ -63,5 +63,7 @@ class PurchaseAlertComponentLine(models.Model):
     
     def unlink(self):
         """No permitir eliminar líneas manualmente - se eliminan automáticamente al actualizar."""
+        if self.env.context.get('purchase_alert_sync_lines'):
+            return super().unlink()
         raise UserError(_('No se pueden eliminar manualmente los componentes, periféricos o complementos. Use el botón "Actualizar Componentes" para refrescar la información.'))
 
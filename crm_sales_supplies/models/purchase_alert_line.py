@@ -69,34 +69,20 @@ class PurchaseAlertLine(models.Model):
 
     @api.depends('product_id', 'quantity_requested', 'alert_id.warehouse_id')
     def _compute_stock_info(self):
-        """Calcular stock disponible y cantidad faltante."""
+        """Calcular stock disponible y cantidad faltante (una consulta agrupada por almacén)."""
+        products_by_warehouse = {}
+        for line in self:
+            if line.product_id and line.alert_id.warehouse_id:
+                products_by_warehouse.setdefault(line.alert_id.warehouse_id, set()).add(line.product_id.id)
+        available = self.env['purchase.alert.planner']._get_available_quantities(products_by_warehouse)
+
         for line in self:
             if not line.product_id or not line.alert_id.warehouse_id:
                 line.quantity_available = 0.0
                 line.quantity_missing = line.quantity_requested or 0.0
                 continue
 
-            location = line.alert_id.warehouse_id.lot_stock_id
-            try:
-                # Usar sudo() para _gather y luego filtrar solo los accesibles
-                all_quants = self.env['stock.quant'].sudo()._gather(
-                    line.product_id,
-                    location,
-                )
-                # Filtrar solo los quants que el usuario actual puede leer
-                accessible_quants = self.env['stock.quant']
-                for quant in all_quants:
-                    try:
-                        quant_check = self.env['stock.quant'].browse(quant.id)
-                        if quant_check.exists():
-                            accessible_quants |= quant_check
-                    except Exception:
-                        continue
-                quantity_available = sum(accessible_quants.mapped('quantity'))
-                line.quantity_available = quantity_available
-            except Exception:
-                line.quantity_available = line.product_id.qty_available or 0.0
-
+            line.quantity_available = available.get((line.alert_id.warehouse_id.id, line.product_id.id), 0.0)
             missing = max(0.0, (line.quantity_requested or 0.0) - line.quantity_available)
             line.quantity_missing = missing
 
@@ -105,18 +91,10 @@ class PurchaseAlertLine(models.Model):
         """Sobrescribir creación para actualizar componentes de la alerta cuando hay múltiples productos."""
         lines = super().create(vals_list)
         
-        # Agrupar por alerta para actualizar una vez por alerta
-        alerts_to_update = {}
-        for line in lines:
-            if line.alert_id and line.alert_id.id not in alerts_to_update:
-                alerts_to_update[line.alert_id.id] = line.alert_id
-        
-        # Actualizar componentes para cada alerta que tenga múltiples productos
-        for alert in alerts_to_update.values():
-            if len(alert.alert_line_ids) > 1:
-                # Invalidar cache para asegurar que se leen las líneas actualizadas
-                alert.invalidate_recordset(['alert_line_ids'])
-                alert._update_component_lines()
+        # Actualizar componentes de todas las alertas con múltiples productos en un solo lote
+        alerts = lines.alert_id
+        alerts.invalidate_recordset(['alert_line_ids'])
+        alerts.filtered(lambda a: len(a.alert_line_ids) > 1)._update_component_lines()
         
         return lines
 
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+from collections import defaultdict
+
+from markupsafe import Markup
+
+from odoo import api, fields, models, _
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class PurchaseAlertPlanner(models.AbstractModel):
+    """Planificador de alertas por cotización para un lote de órdenes de venta.
+
+    Calcula los faltantes de stock de todas las órdenes con una consulta agrupada
+    por almacén y crea alertas, líneas y actividades con creaciones en lote.
+    """
+    _name = 'purchase.alert.planner'
+    _description = 'Planificador de Alertas Por Cotización'
+
+    @api.model
+    def _get_available_quantities(self, products_by_warehouse):
+        """Devolver {(almacén, producto): cantidad} con un read_group por almacén."""
+        available = {}
+        Quant = self.env['stock.quant'].sudo()
+        for warehouse, product_ids in products_by_warehouse.items():
+            groups = Quant._read_group(
+                [
+                    ('product_id', 'in', list(product_ids)),
+                    ('location_id', 'child_of', warehouse.lot_stock_id.id),
+                ],
+                ['product_id'],
+                ['quantity:sum'],
+            )
+            for product, quantity in groups:
+                available[(warehouse.id, product.id)] = quantity or 0.0
+        return available
+
+    @api.model
+    def _get_eligible_orders(self, orders):
+        """Filtrar las órdenes para las que se deben crear alertas automáticas."""
+        orders = orders.filtered(lambda o: o.opportunity_id and o.warehouse_id)
+        if not orders:
+            return orders
+
+        pending_alerts = self.env['purchase.alert'].search([
+            ('sale_order_id', 'in', orders.ids),
+            ('state', '=', 'pending'),
+        ])
+        if self.env.context.get('from_wizard'):
+            # Si viene del wizard con productos, no duplicar alertas pendientes
+            skip = pending_alerts.sale_order_id
+        else:
+            # Una alerta manual (sin productos) evita las alertas automáticas
+            skip = pending_alerts.filtered(
+                lambda a: not a.product_id and not a.alert_line_ids
+            ).sale_order_id
+        if skip:
+            _logger.debug("Órdenes %s - Ya tienen alerta pendiente, saltando creación automática", skip.mapped('name'))
+        return orders - skip
+
+    @api.model
+    def _compute_shortages(self, orders):
+        """Devolver {orden: [(línea de venta, cantidad necesaria)]} con las líneas sin stock suficiente."""
+        candidate_lines = orders.order_line.filtered(
+            lambda l: l.product_id and l.product_id.product_tmpl_id.type in ('product', 'consu')
+        )
+        products_by_warehouse = defaultdict(set)
+        for line in candidate_lines:
+            products_by_warehouse[line.order_id.warehouse_id].add(line.product_id.id)
+        available = self._get_available_quantities(products_by_warehouse)
+
+        shortages = defaultdict(list)
+        for line in candidate_lines:
+            qty_available = available.get((line.order_id.warehouse_id.id, line.product_id.id), 0.0)
+            if qty_available < line.product_uom_qty:
+                shortages[line.order_id].append((line, line.product_uom_qty))
+        return shortages
+
+    @api.model
+    def plan(self, orders, notify_purchase_team=False):
+        """Crear las alertas por cotización que faltan para un recordset de órdenes.
+
+        :param orders: recordset de ``sale.order``
+        :param notify_purchase_team: crear actividades para el equipo de compras
+            (una por usuario, no una por alerta)
+        :return: diccionario con el resumen de lo creado
+        """
+        summary = {
+            'alert_ids': [],
+            'updated_alert_ids': [],
+            'line_count': 0,
+            'activity_count': 0,
+            'shortage_order_ids': [],
+        }
+        if self.env.context.get('skip_auto_create_alerts'):
+            return summary
+
+        orders = self._get_eligible_orders(orders)
+        if not orders:
+            return summary
+
+        shortages = self._compute_shortages(orders)
+        summary['shortage_order_ids'] = [order.id for order in shortages]
+        if not shortages:
+            return summary
+
+        Alert = self.env['purchase.alert']
+        pending_alerts = Alert.search([
+            ('sale_order_id', 'in', [order.id for order in shortages]),
+            ('state', '=', 'pending'),
+        ], order='id')
+        alert_by_order = {}
+        for alert in pending_alerts:
+            alert_by_order.setdefault(alert.sale_order_id.id, alert)
+        alerted_so_line_ids = set(pending_alerts.alert_line_ids.sale_order_line_id.ids)
+
+        new_alert_vals = []
+        new_alert_lines = []
+        line_vals = []
+        for order, order_shortages in shortages.items():
+            lines_data = [{
+                'sale_order_line_id': line.id,
+                'product_id': line.product_id.id,
+                'quantity_requested': qty_needed,
+            } for line, qty_needed in order_shortages if line.id not in alerted_so_line_ids]
+            if not lines_data:
+                continue
+
+            existing_alert = alert_by_order.get(order.id)
+            if existing_alert:
+                line_vals.extend(dict(data, alert_id=existing_alert.id) for data in lines_data)
+                summary['updated_alert_ids'].append(existing_alert.id)
+                continue
+
+            notes = _('Creado automáticamente desde CRM Lead: %s') % order.opportunity_id.name
+            if len(lines_data) > 1:
+                notes += _('\n\nEsta alerta contiene %s productos que necesitan ser cotizados.') % len(lines_data)
+            new_alert_vals.append({
+                'sale_order_id': order.id,
+                'product_id': lines_data[0]['product_id'] if len(lines_data) == 1 else False,
+                'state': 'pending',
+                'warehouse_id': order.warehouse_id.id,
+                'lead_id': order.opportunity_id.id,
+                'partner_id': order.partner_id.id or order.opportunity_id.partner_id.id or False,
+                'notes': notes,
+            })
+            new_alert_lines.append(lines_data)
+
+        alerts = Alert.create(new_alert_vals) if new_alert_vals else Alert
+        for alert, lines_data in zip(alerts, new_alert_lines):
+            line_vals.extend(dict(data, alert_id=alert.id) for data in lines_data)
+        if line_vals:
+            # La creación de líneas actualiza componentes/periféricos/complementos en lote
+            self.env['purchase.alert.line'].create(line_vals)
+
+        summary['alert_ids'] = alerts.ids
+        summary['line_count'] = len(line_vals)
+
+        for alert in alerts:
+            alert.sale_order_id.message_post(
+                body=_('✅ Se creó automáticamente la alerta de compra %s desde el CRM Lead.') % alert.name,
+            )
+
+        if notify_purchase_team and alerts:
+            summary['activity_count'] = self._create_purchase_team_activities(alerts)
+
+        _logger.info("Planificador de alertas: %s órdenes con faltantes, %s alertas nuevas, %s alertas actualizadas, %s líneas",
+                     len(shortages), len(alerts), len(summary['updated_alert_ids']), len(line_vals))
+        return summary
+
+    @api.model
+    def _create_purchase_team_activities(self, alerts):
+        """Crear una actividad por usuario de compras que resume todas las alertas nuevas."""
+        purchase_group = self.env.ref('purchase.group_purchase_user', raise_if_not_found=False)
+        users = purchase_group.users.filtered(lambda u: not u.share) if purchase_group else self.env['res.users']
+        if not users:
+            return 0
+
+        activity_type = self.env.ref('mail.mail_activity_data_todo', raise_if_not_found=False)
+        # Markup escapa los nombres interpolados
+        items = Markup('').join(
+            Markup(_('<li><strong>%s</strong> - Orden: %s - Cliente: %s</li>')) % (
+                alert.name or '',
+                alert.sale_order_id.name or '',
+                alert.partner_id.display_name or 'N/A',
+            )
+            for alert in alerts
+        )
+        note = Markup(_('<p>Se crearon %s alerta(s) por cotización por falta de stock:</p><ul>%s</ul>')) % (
+            len(alerts), items,
+        )
+
+        # La actividad se ancla a la primera alerta; la nota lista todas las demás
+        res_model_id = self.env['ir.model']._get_id('purchase.alert')
+        self.env['mail.activity'].sudo().create([{
+            'res_id': alerts[0].id,
+            'res_model_id': res_model_id,
+            'activity_type_id': activity_type.id if activity_type else False,
+            'summary': _('%s alerta(s) por cotización pendientes') % len(alerts),
+            'note': note,
+            'user_id': user.id,
+            'date_deadline': fields.Date.today(),
+        } for user in users])
+        return len(users)
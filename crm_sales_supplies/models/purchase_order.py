@@ -79,10 +79,20 @@ class PurchaseOrder(models.Model):
         string='Alertas Por Cotización',
         readonly=True,
     )
+    purchase_alert_order_ids = fields.Many2many(
+        'purchase.alert',
+        'purchase_alert_purchase_order_rel',
+        'purchase_order_id',
+        'alert_id',
+        string='Alertas Relacionadas',
+        readonly=True,
+        help='Alertas por cotización que solicitaron esta orden (inverso de purchase_order_ids)',
+    )
     purchase_alert_count = fields.Integer(
         string='Número de Alertas',
         compute='_compute_purchase_alert_count',
         readonly=True,
+        store=True,
     )
     approved_by_crm = fields.Boolean(
         string='Aprobada por CRM',
@@ -134,6 +144,7 @@ class PurchaseOrder(models.Model):
         string='Referencias de Alertas',
         compute='_compute_purchase_alert_references',
         readonly=True,
+        store=True,
         help='Referencias de las alertas relacionadas con esta orden de compra',
     )
     is_alert_validated = fields.Boolean(
@@ -154,19 +165,15 @@ class PurchaseOrder(models.Model):
         help='Estado de validación por CRM de esta cotización',
     )
     
-    @api.depends('purchase_alert_ids.validated_by_crm')
+    @api.depends('purchase_alert_order_ids.validated_by_crm')
     def _compute_is_alert_validated(self):
         """Calcular si alguna alerta relacionada está validada."""
         for order in self:
             if not order.id:
                 order.is_alert_validated = False
                 continue
-            # Buscar alertas relacionadas a través de purchase_order_ids (Many2many)
-            alerts = self.env['purchase.alert'].search([
-                ('purchase_order_ids', 'in', [order.id]),
-                ('validated_by_crm', '=', True),
-            ], limit=1)
-            order.is_alert_validated = bool(alerts)
+            # Alertas relacionadas a través de purchase_order_ids (Many2many)
+            order.is_alert_validated = any(order.purchase_alert_order_ids.mapped('validated_by_crm'))
     
     @api.depends('approved_by_crm', 'rejected_by_crm', 'is_alert_validated')
     def _compute_crm_validation_status(self):
@@ -263,9 +270,7 @@ class PurchaseOrder(models.Model):
             'domain': [('purchase_order_ids', 'in', [self.id])],
             'context': {'default_purchase_order_ids': [(4, self.id)]},
         }
-        alerts = self.env['purchase.alert'].search([
-            ('purchase_order_ids', 'in', [self.id])
-        ])
+        alerts = self.purchase_alert_order_ids
         if len(alerts) == 1:
             action.update({
                 'view_mode': 'form',
@@ -325,33 +330,17 @@ class PurchaseOrder(models.Model):
             self.leasing_brand_id = False
             self.leasing_contract_id = False
 
-    @api.depends()
+    @api.depends('purchase_alert_order_ids')
     def _compute_purchase_alert_count(self):
         """Calcular número de alertas relacionadas."""
         for order in self:
-            if order.id:
-                alerts = self.env['purchase.alert'].search_count([
-                    ('purchase_order_ids', 'in', [order.id])
-                ])
-                order.purchase_alert_count = alerts
-            else:
-                order.purchase_alert_count = 0
+            order.purchase_alert_count = len(order.purchase_alert_order_ids)
 
-    @api.depends()
+    @api.depends('purchase_alert_order_ids.name')
     def _compute_purchase_alert_references(self):
         """Calcular referencias de alertas relacionadas."""
         for order in self:
-            if order.id:
-                alerts = self.env['purchase.alert'].search([
-                    ('purchase_order_ids', 'in', [order.id])
-                ])
-                if alerts:
-                    references = ', '.join(alerts.mapped('name'))
-                    order.purchase_alert_references = references
-                else:
-                    order.purchase_alert_references = ''
-            else:
-                order.purchase_alert_references = ''
+            order.purchase_alert_references = ', '.join(order.purchase_alert_order_ids.mapped('name'))
 
     def _update_name_prefix(self, prefix='COT'):
         """Actualizar el prefijo del nombre de la orden."""
@@ -501,31 +490,18 @@ class PurchaseOrder(models.Model):
         if not orders:
             return
         
-        # Agrupar órdenes por alerta
-        alerts_dict = {}  # {alert_id: [order_ids]}
-        
-        for order in orders:
-            # Buscar alertas relacionadas
-            alerts = self.env['purchase.alert'].search([
-                ('purchase_order_ids', 'in', [order.id])
-            ])
-            
-            for alert in alerts:
-                if alert.id not in alerts_dict:
-                    alerts_dict[alert.id] = []
-                alerts_dict[alert.id].append(order.id)
+        # Agrupar órdenes por alerta con una sola búsqueda
+        alerts = self.env['purchase.alert'].search([
+            ('purchase_order_ids', 'in', orders.ids)
+        ])
         
-        # Crear una actividad por cada alerta
-        for alert_id, order_ids in alerts_dict.items():
+        # Programar una actividad por cada alerta (la bandeja de salida las crea en lote)
+        for alert in alerts:
             try:
-                alert = self.env['purchase.alert'].browse(alert_id)
-                if not alert.exists():
-                    continue
-                
-                orders_in_alert = self.env['purchase.order'].browse(order_ids)
+                orders_in_alert = alert.purchase_order_ids & orders
                 alert._create_approval_activity_for_alert(orders_in_alert, 'approved')
             except Exception as e:
-                _logger.error("Error creando actividad agrupada de aprobación para alerta %s: %s", alert_id, str(e), exc_info=True)
+                _logger.error("Error creando actividad agrupada de aprobación para alerta %s: %s", alert.id, str(e), exc_info=True)
     
     @api.model
     def _create_rejection_activities_grouped(self, orders):
@@ -533,31 +509,18 @@ class PurchaseOrder(models.Model):
         if not orders:
             return
         
-        # Agrupar órdenes por alerta
-        alerts_dict = {}  # {alert_id: [order_ids]}
-        
-        for order in orders:
-            # Buscar alertas relacionadas
-            alerts = self.env['purchase.alert'].search([
-                ('purchase_order_ids', 'in', [order.id])
-            ])
-            
-            for alert in alerts:
-                if alert.id not in alerts_dict:
-                    alerts_dict[alert.id] = []
-                alerts_dict[alert.id].append(order.id)
+        # Agrupar órdenes por alerta con una sola búsqueda
+        alerts = self.env['purchase.alert'].search([
+            ('purchase_order_ids', 'in', orders.ids)
+        ])
         
-        # Crear una actividad por cada alerta
-        for alert_id, order_ids in alerts_dict.items():
+        # Programar una actividad por cada alerta (la bandeja de salida las crea en lote)
+        for alert in alerts:
             try:
-                alert = self.env['purchase.alert'].browse(alert_id)
-                if not alert.exists():
-                    continue
-                
-                orders_in_alert = self.env['purchase.order'].browse(order_ids)
+                orders_in_alert = alert.purchase_order_ids & orders
                 alert._create_approval_activity_for_alert(orders_in_alert, 'rejected')
             except Exception as e:
-                _logger.error("Error creando actividad agrupada de rechazo para alerta %s: %s", alert_id, str(e), exc_info=True)
+                _logger.error("Error creando actividad agrupada de rechazo para alerta %s: %s", alert.id, str(e), exc_info=True)
     
     def button_confirm(self):
         """Sobrescribir confirmación para actualizar estado de alertas y cambiar nombre a COM."""
@@ -574,17 +537,19 @@ class PurchaseOrder(models.Model):
         result = super().button_confirm()
         
         # Actualizar estado de alertas relacionadas a "Orden Enviada" cuando se confirma la orden
-        for order in self:
-            # Buscar alertas relacionadas a través de purchase_order_ids (many2many)
-            alerts = self.env['purchase.alert'].search([
-                ('purchase_order_ids', 'in', [order.id]),
-                ('state', 'in', ('pending', 'purchase_created')),
-            ])
-            if alerts:
-                alerts.write({'state': 'sent'})
-                for alert in alerts:
-                    alert.message_post(
-                        body=_('Orden de compra %s confirmada. Alerta marcada como Orden Enviada.') % order.name
+        # (una búsqueda y una escritura para todas las órdenes; los mensajes van a la bandeja de salida)
+        alerts = self.env['purchase.alert'].search([
+            ('purchase_order_ids', 'in', self.ids),
+            ('state', 'in', ('pending', 'purchase_created')),
+        ])
+        if alerts:
+            alerts.write({'state': 'sent'})
+            outbox = self.env['purchase.notification.outbox']
+            for alert in alerts:
+                for order in alert.purchase_order_ids & self:
+                    outbox.enqueue_message(
+                        alert,
+                        _('Orden de compra %s confirmada. Alerta marcada como Orden Enviada.') % order.name,
                     )
         
         return result
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from odoo import api, models, tools
+
+
+class ResUsers(models.Model):
+    _inherit = 'res.users'
+
+    @api.model
+    @tools.ormcache('self.env.uid')
+    def _purchase_alert_has_crm_access(self):
+        """Indicar si el usuario actual tiene acceso de CRM (no solo de compras).
+
+        Se calcula una vez por usuario; la caché se limpia cuando cambian los
+        grupos del usuario (res.users/res.groups limpian la caché del registro).
+        """
+        user = self.env.user
+        has_sales_access = user.has_group('sales_team.group_sale_manager') or user.has_group('sales_team.group_sale_salesman')
+        has_only_purchase = user.has_group('purchase.group_purchase_user') and not has_sales_access
+        return not has_only_purchase
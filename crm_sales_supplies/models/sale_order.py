@@ -226,30 +226,14 @@ class SaleOrder(models.Model):
         """Sobrescribir creación para verificar stock automáticamente cuando se crea desde CRM Lead."""
         orders = super().create(vals_list)
         
-        # Ejecutar automáticamente después de crear
-        for i, order in enumerate(orders):
-            # Verificar si tiene opportunity_id
-            has_opportunity = False
-            if order.opportunity_id:
-                has_opportunity = True
-            elif i < len(vals_list) and vals_list[i].get('opportunity_id'):
-                has_opportunity = True
-            
-            if has_opportunity:
-                _logger.info("Orden %s creada desde Lead %s - Ejecutando verificación automática", 
-                           order.name, order.opportunity_id.name if order.opportunity_id else 'N/A')
-                
-                try:
-                    # Forzar flush y recálculo
-                    order.flush_recordset()
-                    order._compute_stock_availability()
-                    order.flush_recordset()
-                    
-                    # Crear alertas automáticamente
-                    order.sudo()._create_purchase_alerts_automatically()
-                except Exception as e:
-                    _logger.error("Error en creación automática de alertas para orden %s: %s", 
-                                order.name, str(e), exc_info=True)
+        # Ejecutar automáticamente después de crear, para todas las órdenes desde Lead a la vez
+        orders_from_lead = orders.filtered('opportunity_id')
+        if orders_from_lead:
+            try:
+                orders_from_lead.sudo()._create_purchase_alerts_automatically()
+            except Exception as e:
+                _logger.error("Error en creación automática de alertas para órdenes %s: %s", 
+                            orders_from_lead.mapped('name'), str(e), exc_info=True)
         
         return orders
     
@@ -259,216 +243,23 @@ class SaleOrder(models.Model):
         
         # Si se modificaron las líneas y hay opportunity_id, verificar
         if 'order_line' in vals:
-            for order in self:
-                if order.opportunity_id and order.state == 'draft':
-                    try:
-                        order._compute_stock_availability()
-                        order.flush_recordset()
-                        order.sudo()._create_purchase_alerts_automatically()
-                    except Exception as e:
-                        _logger.error("Error en verificación automática para orden %s: %s", 
-                                    order.name, str(e))
+            orders = self.filtered(lambda o: o.opportunity_id and o.state == 'draft')
+            if orders:
+                try:
+                    orders.sudo()._create_purchase_alerts_automatically()
+                except Exception as e:
+                    _logger.error("Error en verificación automática para órdenes %s: %s", 
+                                orders.mapped('name'), str(e))
         
         return result
     
-    def _create_purchase_alerts_automatically(self):
-        """Crear alertas por cotización automáticamente cuando se crea orden desde Lead."""
-        self.ensure_one()
-        
-        # Si se está creando una alerta manualmente desde el wizard (sin productos), no crear alertas automáticas
-        if self.env.context.get('skip_auto_create_alerts'):
-            _logger.debug("Orden %s - Saltando creación automática (skip_auto_create_alerts=True)", self.name)
-            return
-        
-        if not self.opportunity_id or not self.warehouse_id:
-            _logger.debug("Orden %s no tiene Lead o almacén - Saltando creación automática", self.name)
-            return
-        
-        # Si viene del wizard con productos, verificar duplicados antes de crear
-        if self.env.context.get('from_wizard'):
-            # Verificar si ya existe una alerta pendiente para esta orden
-            existing_alert = self.env['purchase.alert'].search([
-                ('sale_order_id', '=', self.id),
-                ('state', '=', 'pending'),
-            ], limit=1)
-            
-            if existing_alert:
-                _logger.debug("Orden %s - Ya existe alerta pendiente (ID: %s), saltando creación automática", 
-                             self.name, existing_alert.id)
-                return
-        
-        # Verificar si ya existe una alerta manual (sin productos) para esta orden
-        # Si existe y NO viene del wizard, no crear alertas automáticas para evitar duplicados
-        if not self.env.context.get('from_wizard'):
-            existing_manual_alert = self.env['purchase.alert'].search([
-                ('sale_order_id', '=', self.id),
-                ('state', '=', 'pending'),
-                ('product_id', '=', False),  # Alerta manual sin producto específico
-                ('alert_line_ids', '=', False),  # Sin líneas de productos
-            ], limit=1)
-            
-            if existing_manual_alert:
-                _logger.debug("Orden %s - Ya existe alerta manual (ID: %s), saltando creación automática", 
-                             self.name, existing_manual_alert.id)
-                return
-        
-        _logger.info("Creando alertas automáticas para orden %s (Lead: %s)", 
-                    self.name, self.opportunity_id.name)
-        
-        location = self.warehouse_id.lot_stock_id
-        
-        # Inicializar lista de alertas creadas
-        alerts_created = []
-        
-        # Agrupar todas las líneas que necesitan stock en una sola alerta
-        lines_needing_stock = []
-        
-        # Verificar cada línea de producto tipo 'product'
-        for line in self.order_line:
-            if not line.product_id:
-                continue
-            
-            # Verificar tipo de producto - LEER DESDE TEMPLATE
-            ptype = None
-            if line.product_id.product_tmpl_id:
-                ptype = line.product_id.product_tmpl_id.type
-            else:
-                ptype = line.product_id.type
-            
-            _logger.debug("Verificando línea %s - Producto %s (ID: %s) - Tipo desde template: %s", 
-                         line.id, line.product_id.display_name, line.product_id.id, ptype)
-            
-            # Verificar stock para productos tipo 'product' o 'consu' (tratamos consu como product)
-            if ptype not in ('product', 'consu'):
-                _logger.debug("Línea %s saltada - No es tipo 'product' o 'consu' (tipo: %s)", line.id, ptype)
-                continue
-            
-            try:
-                # Verificar stock
-                # Usar sudo() para _gather y luego filtrar solo los accesibles
-                all_quants = self.env['stock.quant'].sudo()._gather(line.product_id, location)
-                # Filtrar solo los quants que el usuario actual puede leer
-                accessible_quants = self.env['stock.quant']
-                for quant in all_quants:
-                    try:
-                        quant_check = self.env['stock.quant'].browse(quant.id)
-                        if quant_check.exists():
-                            accessible_quants |= quant_check
-                    except Exception:
-                        continue
-                qty_available = sum(accessible_quants.mapped('quantity'))
-                qty_needed = line.product_uom_qty
-                
-                _logger.debug("Línea %s - Stock disponible: %s, Necesita: %s", 
-                             line.id, qty_available, qty_needed)
-                
-                # Si falta stock, agregar a la lista
-                if qty_available < qty_needed:
-                    # Verificar si ya existe una alerta para esta línea
-                    existing = self.env['purchase.alert'].search([
-                        ('sale_order_id', '=', self.id),
-                        ('alert_line_ids.sale_order_line_id', '=', line.id),
-                        ('state', '=', 'pending'),
-                    ], limit=1)
-                    
-                    if not existing:
-                        lines_needing_stock.append({
-                            'sale_order_line_id': line.id,
-                            'product_id': line.product_id.id,
-                            'quantity_requested': qty_needed,
-                        })
-            except Exception as e:
-                _logger.error("Error verificando stock para línea %s: %s", line.id, str(e))
-                continue
-        
-        # Crear una sola alerta con todas las líneas que necesitan stock
-        if lines_needing_stock:
-            # Verificar si ya existe una alerta pendiente para esta orden
-            existing_alert = self.env['purchase.alert'].search([
-                ('sale_order_id', '=', self.id),
-                ('state', '=', 'pending'),
-            ], limit=1)
-            
-            if existing_alert:
-                # Agregar líneas nuevas a la alerta existente
-                for line_data in lines_needing_stock:
-                    # Verificar si la línea ya existe
-                    existing_line = existing_alert.alert_line_ids.filtered(
-                        lambda l: l.sale_order_line_id.id == line_data['sale_order_line_id']
-                    )
-                    if not existing_line:
-                        self.env['purchase.alert.line'].create({
-                            'alert_id': existing_alert.id,
-                            'sale_order_line_id': line_data['sale_order_line_id'],
-                            'product_id': line_data['product_id'],
-                            'quantity_requested': line_data['quantity_requested'],
-                        })
-                
-                # Forzar actualización de componentes, periféricos y complementos después de agregar líneas
-                existing_alert.invalidate_recordset(['alert_line_ids'])
-                if len(existing_alert.alert_line_ids) > 1:
-                    _logger.info("Alerta existente %s ahora tiene %s productos, actualizando componentes/periféricos/complementos", 
-                               existing_alert.name, len(existing_alert.alert_line_ids))
-                    existing_alert._update_component_lines()
-            else:
-                # Crear nueva alerta con todas las líneas
-                alert_vals = {
-                    'sale_order_id': self.id,
-                    'product_id': lines_needing_stock[0]['product_id'] if len(lines_needing_stock) == 1 else False,
-                    'state': 'pending',
-                    'warehouse_id': self.warehouse_id.id,
-                    'lead_id': self.opportunity_id.id,
-                }
-                
-                # Agregar partner_id si existe
-                if self.partner_id:
-                    alert_vals['partner_id'] = self.partner_id.id
-                elif self.opportunity_id and self.opportunity_id.partner_id:
-                    alert_vals['partner_id'] = self.opportunity_id.partner_id.id
-                
-                alert = self.env['purchase.alert'].create(alert_vals)
-                
-                # Crear las líneas de la alerta
-                for line_data in lines_needing_stock:
-                    self.env['purchase.alert.line'].create({
-                        'alert_id': alert.id,
-                        'sale_order_line_id': line_data['sale_order_line_id'],
-                        'product_id': line_data['product_id'],
-                        'quantity_requested': line_data['quantity_requested'],
-                    })
-                
-                # Forzar actualización de componentes, periféricos y complementos después de crear todas las líneas
-                # Esto es necesario porque cuando hay múltiples productos, las líneas se crean después de la alerta
-                alert.invalidate_recordset(['alert_line_ids'])
-                if len(alert.alert_line_ids) > 1:
-                    _logger.info("Alerta %s tiene %s productos, actualizando componentes/periféricos/complementos", 
-                               alert.name, len(alert.alert_line_ids))
-                    alert._update_component_lines()
-                
-                alerts_created.append(alert.id)
-                _logger.info("Alerta %s creada con %s líneas de productos", alert.name, len(lines_needing_stock))
-        
-        # Si se creó una alerta con múltiples líneas, agregar nota
-        if alerts_created:
-            alert_count = len(alerts_created)
-            if alert_count == 1:
-                alert = self.env['purchase.alert'].browse(alerts_created[0])
-                if len(alert.alert_line_ids) > 1:
-                    alert.write({
-                        'notes': _('Creado automáticamente desde CRM Lead: %s\n\nEsta alerta contiene %s productos que necesitan ser cotizados.') % (
-                            self.opportunity_id.name, len(alert.alert_line_ids)
-                        )
-                    })
-                else:
-                    alert.write({
-                        'notes': _('Creado automáticamente desde CRM Lead: %s') % self.opportunity_id.name
-                    })
-            
-            self.message_post(
-                body=_('✅ Se creó automáticamente %s alerta(s) de compra desde el CRM Lead.') % alert_count,
-            )
-            _logger.info("Total de alertas creadas automáticamente para orden %s: %s", 
-                        self.name, alert_count)
+    def _create_purchase_alerts_automatically(self, notify_purchase_team=False):
+        """Crear alertas por cotización automáticamente para las órdenes creadas desde Lead.
+
+        Todo el recordset se procesa en lote con ``purchase.alert.planner``;
+        devuelve el resumen del planificador.
+        """
+        return self.env['purchase.alert.planner'].plan(self, notify_purchase_team=notify_purchase_team)
     
 
     def action_confirm(self):
@@ -482,13 +273,19 @@ class SaleOrder(models.Model):
             _logger.info(">>> Opportunity: %s (ID: %s)", order.opportunity_id.name if order.opportunity_id else 'N/A', order.opportunity_id.id if order.opportunity_id else 'N/A')
             _logger.info(">>> Picking IDs antes de confirmar: %s", order.picking_ids.mapped('name'))
         
-        if self.has_stock_issues:
-            _logger.warning(">>> Orden(es) %s tiene(n) problemas de stock", self.mapped('name'))
-            self.message_post(
-                body=_('⚠️ ADVERTENCIA: Esta orden tiene productos sin stock suficiente. '
-                      'Considera crear alertas por cotización antes de confirmar.'),
-                subject=_('Verificación de Stock'),
-            )
+        # Calcular faltantes de todas las órdenes a la vez (una consulta agrupada por almacén)
+        shortages = self.env['purchase.alert.planner']._compute_shortages(
+            self.filtered(lambda o: o.warehouse_id)
+        )
+        orders_with_issues = self.browse([order.id for order in shortages])
+        if orders_with_issues:
+            _logger.warning(">>> Orden(es) %s tiene(n) problemas de stock", orders_with_issues.mapped('name'))
+            for order in orders_with_issues:
+                order.message_post(
+                    body=_('⚠️ ADVERTENCIA: Esta orden tiene productos sin stock suficiente. '
+                          'Considera crear alertas por cotización antes de confirmar.'),
+                    subject=_('Verificación de Stock'),
+                )
         
         # Guardar si viene de un Lead con suscripción antes de confirmar
         lead = self.opportunity_id
@@ -521,6 +318,17 @@ class SaleOrder(models.Model):
         if not self.generate_accounting:
             pass
         
+        # Crear las alertas por cotización de las órdenes con faltantes en un solo lote;
+        # el equipo de compras recibe una actividad por usuario
+        if orders_with_issues:
+            try:
+                with self.env.cr.savepoint():
+                    summary = orders_with_issues.sudo()._create_purchase_alerts_automatically(notify_purchase_team=True)
+                _logger.info(">>> Alertas creadas al confirmar: %s", summary)
+            except Exception as e:
+                _logger.error(">>> ERROR creando alertas por cotización al confirmar %s: %s",
+                              orders_with_issues.mapped('name'), str(e), exc_info=True)
+        
         # Crear suscripción automáticamente después de confirmar la orden
         if should_create_subscription:
             _logger.info(">>> Iniciando creación de suscripción para orden %s", self.name)
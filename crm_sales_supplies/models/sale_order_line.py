@@ -14,18 +14,13 @@ class SaleOrderLine(models.Model):
         """Sobrescribir creación para verificar stock cuando se agregan productos."""
         lines = super().create(vals_list)
         
-        # Verificar si la orden viene de un Lead y crear alertas automáticamente
-        for line in lines:
-            if line.order_id and line.order_id.opportunity_id and line.order_id.state == 'draft':
-                try:
-                    # Forzar recálculo del stock en la orden
-                    line.order_id._compute_stock_availability()
-                    line.order_id.flush_recordset()
-                    
-                    # Crear alertas automáticamente
-                    line.order_id._create_purchase_alerts_automatically()
-                except Exception as e:
-                    _logger.error("Error en verificación automática para línea %s: %s", line.id, str(e))
+        # Verificar si las órdenes vienen de un Lead y crear alertas automáticamente, todas a la vez
+        orders = lines.order_id.filtered(lambda o: o.opportunity_id and o.state == 'draft')
+        if orders:
+            try:
+                orders._create_purchase_alerts_automatically()
+            except Exception as e:
+                _logger.error("Error en verificación automática para líneas %s: %s", lines.ids, str(e))
         
         return lines
     
@@ -35,14 +30,12 @@ class SaleOrderLine(models.Model):
         
         # Si se modificó el producto o la cantidad, verificar stock
         if 'product_id' in vals or 'product_uom_qty' in vals:
-            for line in self:
-                if line.order_id and line.order_id.opportunity_id and line.order_id.state == 'draft':
-                    try:
-                        line.order_id._compute_stock_availability()
-                        line.order_id.flush_recordset()
-                        line.order_id._create_purchase_alerts_automatically()
-                    except Exception as e:
-                        _logger.error("Error en verificación automática para línea %s: %s", line.id, str(e))
+            orders = self.order_id.filtered(lambda o: o.opportunity_id and o.state == 'draft')
+            if orders:
+                try:
+                    orders._create_purchase_alerts_automatically()
+                except Exception as e:
+                    _logger.error("Error en verificación automática para líneas %s: %s", self.ids, str(e))
         
         return result
 
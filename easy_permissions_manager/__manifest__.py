@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 {
     'name': 'Gestor Fácil de Permisos',
-    'version': '18.0.1.0.0',
+    'version': '18.0.1.1.0',
     'category': 'Tools',
     'summary': 'Gestión simplificada de permisos y roles de usuarios',
     'description': """
@@ -20,6 +20,7 @@
         'security/ir.model.access.csv',
         'views/permission_manager_views.xml',
         'views/permission_views.xml',
+        'views/permission_diagnostic_views.xml',
         'views/menuitems.xml',
         'data/permission_roles_data.xml',
     ],
@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+"""
+Colapsa los grupos "Blocked: [Módulo] - User [ID]" y sus reglas ir.rule por
+usuario en un grupo de bloqueo compartido por módulo y una regla por
+(módulo, modelo). Los usuarios bloqueados pasan a ser miembros del grupo.
+"""
+import logging
+
+from odoo import api, SUPERUSER_ID
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    summary = env['permission.plan']._consolidate_block_rules()
+    _logger.info("easy_permissions_manager: bloqueos consolidados %s", summary)
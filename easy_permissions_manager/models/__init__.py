@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
+from . import permission_module_index
+from . import permission_plan
 from . import permission_manager
+from . import permission_diagnostic
 from . import permission_manager_module_line
 from . import permission_manager_group_line
 from . import permission_role
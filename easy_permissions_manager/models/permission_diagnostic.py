@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+from odoo import api, fields, models, _
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Umbral para señalar usuarios con muchos grupos en común (posibles duplicados)
+SIMILAR_MIN_COMMON_GROUPS = 3
+SIMILAR_MIN_RATIO = 0.7
+SIMILAR_LIMIT = 5
+
+
+class PermissionDiagnosticLine(models.TransientModel):
+    """Reporte paginado de diagnóstico de permisos.
+
+    Cada consulta de diagnóstico (usuarios que comparten login, email o contacto,
+    usuarios con grupos muy parecidos, diferencia de grupos entre dos usuarios y
+    reglas ir.rule que aplican a un usuario) se resuelve con una consulta SQL
+    agrupada, y su resultado se guarda como líneas de este modelo con una sola
+    creación. El debug de grupos (tipo de usuario, grupos de módulos y rol, y
+    grupos finales simulados con ``permission.plan``) usa las mismas líneas.
+    La vista de lista las pagina y las agrupa por sección.
+    """
+    _name = 'permission.diagnostic.line'
+    _description = 'Línea de Diagnóstico de Permisos'
+    _order = 'section, sequence, id'
+
+    manager_id = fields.Many2one(
+        'permission.manager',
+        string='Gestor',
+        required=True,
+        ondelete='cascade',
+    )
+    section = fields.Selection([
+        ('shared_login', 'Mismo Login'),
+        ('shared_email', 'Mismo Email'),
+        ('shared_partner', 'Mismo Contacto'),
+        ('similar_groups', 'Muchos Grupos en Común'),
+        ('group_only_user', 'Grupos Solo del Usuario'),
+        ('group_only_other', 'Grupos Solo del Otro Usuario'),
+        ('rule', 'Reglas que Aplican'),
+        ('user_type', 'Tipo de Usuario'),
+        ('module_group', 'Grupos de Módulos Permitidos'),
+        ('role_group', 'Grupos del Rol'),
+        ('final_group', 'Grupos Finales Simulados'),
+    ], string='Sección', required=True)
+    sequence = fields.Integer(string='Secuencia', default=10)
+    user_id = fields.Many2one('res.users', string='Usuario')
+    other_user_id = fields.Many2one('res.users', string='Otro Usuario')
+    group_id = fields.Many2one('res.groups', string='Grupo')
+    rule_id = fields.Many2one('ir.rule', string='Regla')
+    model_id = fields.Many2one('ir.model', string='Modelo')
+    detail = fields.Char(string='Detalle')
+
+    # ------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------
+
+    @api.model
+    def _get_user_group_relation(self):
+        field = self.env['res.users']._fields['groups_id']
+        return field.relation, field.column1, field.column2
+
+    @api.model
+    def _find_shared_identity(self, user):
+        """Usuarios que comparten login, email o contacto con ``user``, en una consulta.
+
+        :return: [(sección, id del otro usuario, valor compartido)]
+        """
+        self.env['res.users'].flush_model(['login', 'partner_id'])
+        self.env['res.partner'].flush_model(['email'])
+        self.env.cr.execute("""
+            SELECT 'shared_login', u.id, u.login
+              FROM res_users u
+             WHERE lower(u.login) = lower(%(login)s)
+               AND u.id != %(user_id)s
+            UNION ALL
+            SELECT 'shared_email', u.id, p.email
+              FROM res_users u
+              JOIN res_partner p ON p.id = u.partner_id
+             WHERE %(email)s IS NOT NULL
+               AND lower(p.email) = lower(%(email)s)
+               AND u.id != %(user_id)s
+            UNION ALL
+            SELECT 'shared_partner', u.id, u.partner_id::text
+              FROM res_users u
+             WHERE u.partner_id = %(partner_id)s
+               AND u.id != %(user_id)s
+          ORDER BY 1, 2
+        """, {
+            'user_id': user.id,
+            'login': user.login or '',
+            'email': user.partner_id.email or None,
+            'partner_id': user.partner_id.id or 0,
+        })
+        return self.env.cr.fetchall()
+
+    @api.model
+    def _find_similar_users(self, user):
+        """Usuarios con muchos grupos en común con ``user`` (posibles duplicados), agrupando en SQL.
+
+        :return: [(id del otro usuario, grupos en común, similitud)]
+        """
+        relation, user_col, group_col = self._get_user_group_relation()
+        self.env['res.users'].flush_model(['groups_id'])
+        self.env.cr.execute(f"""
+            WITH mine AS (
+                SELECT {group_col} AS gid FROM {relation} WHERE {user_col} = %(user_id)s
+            )
+            SELECT r.{user_col}, count(*) AS common,
+                   count(*)::float / (SELECT count(*) FROM mine) AS similarity
+              FROM {relation} r
+              JOIN mine ON mine.gid = r.{group_col}
+             WHERE r.{user_col} != %(user_id)s
+          GROUP BY r.{user_col}
+            HAVING count(*) > %(min_common)s
+               AND count(*)::float / (SELECT count(*) FROM mine) > %(min_ratio)s
+          ORDER BY similarity DESC, r.{user_col}
+             LIMIT %(limit)s
+        """, {
+            'user_id': user.id,
+            'min_common': SIMILAR_MIN_COMMON_GROUPS,
+            'min_ratio': SIMILAR_MIN_RATIO,
+            'limit': SIMILAR_LIMIT,
+        })
+        return self.env.cr.fetchall()
+
+    @api.model
+    def get_group_diff(self, user, other_user):
+        """Diferencia de grupos entre dos usuarios en una consulta (FULL JOIN).
+
+        :return: (ids solo de ``user``, ids solo de ``other_user``)
+        """
+        relation, user_col, group_col = self._get_user_group_relation()
+        self.env['res.users'].flush_model(['groups_id'])
+        self.env.cr.execute(f"""
+            SELECT a.gid, b.gid
+              FROM (SELECT {group_col} AS gid FROM {relation} WHERE {user_col} = %(user_id)s) a
+         FULL JOIN (SELECT {group_col} AS gid FROM {relation} WHERE {user_col} = %(other_id)s) b
+                ON a.gid = b.gid
+             WHERE a.gid IS NULL OR b.gid IS NULL
+        """, {'user_id': user.id, 'other_id': other_user.id})
+        only_user, only_other = [], []
+        for user_gid, other_gid in self.env.cr.fetchall():
+            if other_gid is None:
+                only_user.append(user_gid)
+            else:
+                only_other.append(other_gid)
+        return sorted(only_user), sorted(only_other)
+
+    @api.model
+    def _find_user_rules(self, user):
+        """Reglas ir.rule activas que aplican a ``user``: globales o de alguno de sus grupos.
+
+        :return: [(id de la regla, id del modelo, es global)]
+        """
+        relation, user_col, group_col = self._get_user_group_relation()
+        rule_field = self.env['ir.rule']._fields['groups']
+        self.env['ir.rule'].flush_model(['active', 'global', 'model_id', 'groups'])
+        self.env['res.users'].flush_model(['groups_id'])
+        self.env.cr.execute(f"""
+            SELECT r.id, r.model_id, r.global
+              FROM ir_rule r
+             WHERE r.active
+               AND (r.global OR EXISTS (
+                    SELECT 1
+                      FROM {rule_field.relation} rg
+                      JOIN {relation} ug ON ug.{group_col} = rg.{rule_field.column2}
+                     WHERE rg.{rule_field.column1} = r.id
+                       AND ug.{user_col} = %(user_id)s
+               ))
+          ORDER BY r.model_id, r.global DESC, r.id
+        """, {'user_id': user.id})
+        return self.env.cr.fetchall()
+
+    # ------------------------------------------------------------
+    # Reporte
+    # ------------------------------------------------------------
+
+    @api.model
+    def build_report(self, manager, user, other_user=None):
+        """Regenerar las líneas de diagnóstico de ``manager`` para ``user``.
+
+        :param other_user: si se indica, agrega la diferencia de grupos entre ambos
+        :return: número de líneas creadas
+        """
+        self.search([('manager_id', '=', manager.id)]).unlink()
+        vals_list = []
+
+        for sequence, (section, other_id, value) in enumerate(self._find_shared_identity(user)):
+            vals_list.append({
+                'section': section,
+                'sequence': sequence,
+                'user_id': user.id,
+                'other_user_id': other_id,
+                'detail': value,
+            })
+
+        for sequence, (other_id, common, similarity) in enumerate(self._find_similar_users(user)):
+            vals_list.append({
+                'section': 'similar_groups',
+                'sequence': sequence,
+                'user_id': user.id,
+                'other_user_id': other_id,
+                'detail': _('%d grupos en común (%d%% similitud)') % (common, int(similarity * 100)),
+            })
+
+        if other_user:
+            only_user, only_other = self.get_group_diff(user, other_user)
+            vals_list += [{
+                'section': 'group_only_user',
+                'user_id': user.id,
+                'other_user_id': other_user.id,
+                'group_id': group_id,
+            } for group_id in only_user]
+            vals_list += [{
+                'section': 'group_only_other',
+                'user_id': user.id,
+                'other_user_id': other_user.id,
+                'group_id': group_id,
+            } for group_id in only_other]
+
+        vals_list += [{
+            'section': 'rule',
+            'user_id': user.id,
+            'rule_id': rule_id,
+            'model_id': model_id,
+            'detail': _('Global') if is_global else _('Por grupo'),
+        } for rule_id, model_id, is_global in self._find_user_rules(user)]
+
+        return self._create_report_lines(manager, user, vals_list)
+
+    @api.model
+    def build_group_debug_report(self, manager, user, spec):
+        """Regenerar las líneas de debug de grupos de ``manager`` para ``user``.
+
+        Secciones: usuarios que comparten login, email o contacto (que impedirían
+        aplicar), grupos de tipo de usuario actuales, grupos que aportan los módulos
+        permitidos y el rol, y grupos finales simulados con ``permission.plan.compile``
+        (sin escribir nada ni verificar la unicidad, para poder diagnosticar duplicados).
+
+        :param spec: configuración a aplicar (ver ``permission.plan``)
+        :return: número de líneas creadas
+        """
+        self.search([('manager_id', '=', manager.id)]).unlink()
+        Plan = self.env['permission.plan']
+        type_group_ids = {group.id for group in Plan._get_user_type_groups().values() if group}
+        current_ids = set(user.groups_id.ids)
+        vals_list = [{
+            'section': section,
+            'sequence': sequence,
+            'user_id': user.id,
+            'other_user_id': other_id,
+            'detail': value,
+        } for sequence, (section, other_id, value) in enumerate(self._find_shared_identity(user))]
+
+        current_type_ids = sorted(current_ids & type_group_ids)
+        if not current_type_ids:
+            vals_list.append({
+                'section': 'user_type',
+                'user_id': user.id,
+                'detail': _('Sin tipo de usuario: se agregará Internal User al aplicar'),
+            })
+        vals_list += [{
+            'section': 'user_type',
+            'user_id': user.id,
+            'group_id': group_id,
+            'detail': _('Conflicto: más de un tipo de usuario') if len(current_type_ids) > 1 else _('Actual'),
+        } for group_id in current_type_ids]
+
+        def type_note(group_id, detail):
+            return _('%s (tipo de usuario: se ignora al aplicar)') % detail if group_id in type_group_ids else detail
+
+        if spec['restriction_mode'] == 'allow_list' and spec['allowed_modules']:
+            module_groups = self.env['permission.module.index'].get_groups_for_modules(spec['allowed_modules'])
+            vals_list += [{
+                'section': 'module_group',
+                'user_id': user.id,
+                'group_id': group_id,
+                'detail': type_note(group_id, _('Módulo permitido')),
+            } for group_id in module_groups.ids]
+
+        role_groups_to_add, role_groups_to_remove = manager._get_role_groups()
+        if manager.role_id:
+            vals_list += [{
+                'section': 'role_group',
+                'user_id': user.id,
+                'group_id': group_id,
+                'detail': type_note(group_id, _('Agregar')),
+            } for group_id in role_groups_to_add.ids]
+            vals_list += [{
+                'section': 'role_group',
+                'user_id': user.id,
+                'group_id': group_id,
+                'detail': type_note(group_id, _('Quitar')),
+            } for group_id in role_groups_to_remove.ids]
+
+        final_ids = Plan.compile(user, spec, check_unique=False)['users'][user.id]['final']
+        vals_list += [{
+            'section': 'final_group',
+            'sequence': 0 if group_id not in current_ids else 10,
+            'user_id': user.id,
+            'group_id': group_id,
+            'detail': _('Se agrega') if group_id not in current_ids else _('Se mantiene'),
+        } for group_id in sorted(final_ids)]
+        vals_list += [{
+            'section': 'final_group',
+            'sequence': 5,
+            'user_id': user.id,
+            'group_id': group_id,
+            'detail': _('Se quita'),
+        } for group_id in sorted(current_ids - final_ids)]
+
+        return self._create_report_lines(manager, user, vals_list)
+
+    @api.model
+    def _create_report_lines(self, manager, user, vals_list):
+        for vals in vals_list:
+            vals['manager_id'] = manager.id
+        self.create(vals_list)
+        _logger.info("Diagnóstico de permisos del usuario %s (ID: %s): %d líneas", user.name, user.id, len(vals_list))
+        return len(vals_list)
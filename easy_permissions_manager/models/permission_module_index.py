@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+from collections import defaultdict
+
+from odoo import api, models, tools
+from odoo.tools import frozendict
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Palabras clave para ubicar los modelos de un módulo a partir de su nombre técnico
+MODULE_MODEL_KEYWORDS = (
+    (('license', 'subscription'), ('license', 'trm', 'subscription.license')),
+    (('sale',), ('sale',)),
+    (('purchase',), ('purchase',)),
+    (('stock', 'inventory'), ('stock', 'inventory')),
+)
+
+# Modelos conocidos de los módulos propios (no siguen el nombre técnico del módulo)
+MODULE_KNOWN_MODELS = {
+    'subscription_licenses': (
+        'license.trm', 'license.template', 'license.assignment',
+        'license.equipment', 'subscription.license.assignment',
+        'product.license.type', 'exchange.rate.monthly',
+        'license.trm.recalculate.wizard', 'license.partner.summary',
+        'license.report.wizard',
+    ),
+    'calculadora_costos': (
+        'calculadora.costos', 'calculadora.parametros.financieros',
+        'calculadora.equipo', 'calculadora.renting', 'apu.servicio',
+    ),
+    'mesa_ayuda_inventario': (
+        'maintenance.order', 'stock.lot.maintenance',
+        'maintenance.component.change', 'repair.component.change',
+        'customer.own.inventory', 'maintenance.dashboard',
+        'mesa_ayuda.debug.log', 'maintenance.technician.performance',
+        'maintenance.client.summary', 'maintenance.monthly.trend',
+        'maintenance.type.distribution', 'maintenance.weekday.activity',
+        'maintenance.avg.resolution.time', 'maintenance.problematic.equipment',
+        'maintenance.visit.by.technician', 'maintenance.visit.by.type',
+        'maintenance.visit.monthly.trend', 'maintenance.order.technician.signature',
+    ),
+}
+
+
+class PermissionModuleIndex(models.AbstractModel):
+    """Índice en caché de módulos, grupos y menús.
+
+    Se construye una vez por carga del registro (``tools.ormcache``) y se
+    invalida con ``registry.clear_cache()``, que Odoo ya llama al modificar
+    grupos, menús, permisos de acceso o al instalar módulos. Así aplicar,
+    previsualizar o copiar permisos se resuelve con búsquedas en diccionarios.
+    """
+    _name = 'permission.module.index'
+    _description = 'Índice de Módulos, Grupos y Menús'
+
+    # ------------------------------------------------------------
+    # Índices base (una consulta por índice y carga del registro)
+    # ------------------------------------------------------------
+
+    @api.model
+    @tools.ormcache()
+    def _get_group_index(self):
+        """Grupos por módulo según ir.model.data, y su inverso.
+
+        :return: frozendict con 'module_groups' ({módulo: frozenset(ids)}) y
+            'group_modules' ({grupo: frozenset(módulos)})
+        """
+        module_groups = defaultdict(set)
+        group_modules = defaultdict(set)
+        for data in self.env['ir.model.data'].sudo().search_read(
+            [('model', '=', 'res.groups'), ('res_id', '!=', False)], ['module', 'res_id'],
+        ):
+            module_groups[data['module']].add(data['res_id'])
+            group_modules[data['res_id']].add(data['module'])
+        return frozendict({
+            'module_groups': frozendict({key: frozenset(ids) for key, ids in module_groups.items()}),
+            'group_modules': frozendict({key: frozenset(names) for key, names in group_modules.items()}),
+        })
+
+    @api.model
+    @tools.ormcache()
+    def _get_access_index(self):
+        """Permisos de acceso con grupo: ((nombre, modelo, grupo, lectura), ...)."""
+        self.env['ir.model.access'].flush_model(['name', 'model_id', 'group_id', 'perm_read', 'active'])
+        self.env.cr.execute("""
+            SELECT a.name, m.model, a.group_id, a.perm_read
+              FROM ir_model_access a
+              JOIN ir_model m ON m.id = a.model_id
+             WHERE a.active
+               AND a.group_id IS NOT NULL
+        """)
+        return tuple(self.env.cr.fetchall())
+
+    @api.model
+    @tools.ormcache()
+    def _get_model_names(self):
+        """Nombres técnicos de todos los modelos registrados en ir.model."""
+        return frozenset(self.env['ir.model'].sudo().search([]).mapped('model'))
+
+    @api.model
+    @tools.ormcache('self.env.lang')
+    def _get_group_names(self):
+        """((id, nombre, nombre completo), ...) de los grupos, en el idioma del contexto."""
+        return tuple(
+            (group['id'], group['name'] or '', group['full_name'] or '')
+            for group in self.env['res.groups'].sudo().search_read([], ['name', 'full_name'])
+        )
+
+    @api.model
+    @tools.ormcache()
+    def _get_menu_index(self):
+        """Menús por módulo (con todos sus descendientes vía parent_path) y xml_id por menú.
+
+        :return: frozendict con 'module_menus' ({módulo: frozenset(ids)}) y
+            'menu_xmlids' ({menú: 'módulo.nombre'})
+        """
+        menu_modules = defaultdict(set)
+        menu_xmlids = {}
+        for data in self.env['ir.model.data'].sudo().search_read(
+            [('model', '=', 'ir.ui.menu'), ('res_id', '!=', False)], ['module', 'name', 'res_id'], order='id',
+        ):
+            menu_modules[data['res_id']].add(data['module'])
+            menu_xmlids.setdefault(data['res_id'], '%s.%s' % (data['module'], data['name']))
+
+        module_menus = defaultdict(set)
+        menus = self.env['ir.ui.menu'].sudo().with_context(active_test=False).search_read([], ['parent_path'])
+        for menu in menus:
+            # parent_path = "raíz/.../padre/menú/": el menú pertenece a los módulos de todos sus ancestros
+            for ancestor_id in filter(None, (menu['parent_path'] or '').split('/')):
+                for module_name in menu_modules.get(int(ancestor_id), ()):
+                    module_menus[module_name].add(menu['id'])
+        return frozendict({
+            'module_menus': frozendict({key: frozenset(ids) for key, ids in module_menus.items()}),
+            'menu_xmlids': frozendict(menu_xmlids),
+        })
+
+    @api.model
+    @tools.ormcache()
+    def _get_installed_module_ids(self):
+        """{nombre técnico: id} de los módulos instalados."""
+        return frozendict(
+            (module['name'], module['id'])
+            for module in self.env['ir.module.module'].sudo().search_read([('state', '=', 'installed')], ['name'])
+        )
+
+    # ------------------------------------------------------------
+    # Consultas derivadas
+    # ------------------------------------------------------------
+
+    @api.model
+    def _get_module_models(self, module_name):
+        """Modelos existentes asociados a un módulo (palabras clave y modelos conocidos)."""
+        all_models = self._get_model_names()
+        lower_name = module_name.lower()
+        model_names = []
+        for module_words, model_keywords in MODULE_MODEL_KEYWORDS:
+            if any(word in lower_name for word in module_words):
+                model_names = sorted(
+                    model for model in all_models
+                    if any(keyword in model.lower() for keyword in model_keywords)
+                )
+                break
+        for known_module, known_models in MODULE_KNOWN_MODELS.items():
+            if known_module in module_name:
+                model_names += [model for model in known_models if model in all_models and model not in model_names]
+        return model_names
+
+    @api.model
+    def _get_module_rule_models(self, module_name):
+        """Modelos existentes sobre los que se crean las reglas de bloqueo de un módulo.
+
+        Para los módulos propios se usan sus modelos conocidos; para el resto, los
+        modelos cuyo nombre contiene alguna palabra (de más de 3 letras) del módulo.
+        """
+        all_models = self._get_model_names()
+        for known_module, known_models in MODULE_KNOWN_MODELS.items():
+            if known_module in module_name:
+                return [model for model in known_models if model in all_models]
+        words = [word.lower() for word in module_name.replace('_', ' ').split() if len(word) > 3]
+        return sorted(model for model in all_models if any(word in model.lower() for word in words))
+
+    @api.model
+    @tools.ormcache('module_name', 'shortdesc', 'self.env.lang')
+    def _get_module_group_ids(self, module_name, shortdesc):
+        """Grupos relacionados con un módulo, por tres vías:
+
+        1. xml_id del grupo en ir.model.data
+        2. grupos de los permisos de acceso cuyo nombre contiene el módulo, o de
+           lectura sobre los modelos del módulo
+        3. grupos cuyo nombre contiene el nombre técnico del módulo (y su
+           descripción, si es distinta)
+        """
+        group_ids = set(self._get_group_index()['module_groups'].get(module_name, ()))
+
+        model_names = set(self._get_module_models(module_name))
+        group_ids.update(
+            group_id for name, model, group_id, perm_read in self._get_access_index()
+            if module_name in (name or '') or (perm_read and model in model_names)
+        )
+
+        if module_name:
+            term = module_name.lower()
+            extra = shortdesc.lower() if shortdesc and shortdesc != module_name else None
+            group_ids.update(
+                group_id for group_id, name, full_name in self._get_group_names()
+                if term in name.lower()
+                and (not extra or extra in name.lower() or extra in full_name.lower())
+            )
+        return frozenset(group_ids)
+
+    @api.model
+    def get_groups_for_modules(self, modules):
+        """Grupos relacionados con un recordset de ir.module.module."""
+        group_ids = set()
+        for module in modules:
+            module_name = module.name or ''
+            group_ids |= self._get_module_group_ids(module_name, module.shortdesc or module_name)
+        return self.env['res.groups'].sudo().browse(sorted(group_ids)).exists()
+
+    @api.model
+    def get_modules_for_groups(self, groups):
+        """Módulos instalados que definen (por xml_id) alguno de los grupos indicados."""
+        group_modules = self._get_group_index()['group_modules']
+        installed = self._get_installed_module_ids()
+        module_ids = {
+            installed[module_name]
+            for group_id in groups.ids
+            for module_name in group_modules.get(group_id, ())
+            if module_name in installed
+        }
+        return self.env['ir.module.module'].browse(sorted(module_ids))
+
+    @api.model
+    def get_user_snapshot(self, user):
+        """Grupos y módulos actuales de un usuario, en caché.
+
+        La clave incluye el write_date del usuario (cambia al escribir sus grupos);
+        los cambios hechos desde res.groups limpian la caché del registro.
+
+        :return: frozendict con 'group_ids' y 'module_ids' (frozensets)
+        """
+        if not user:
+            return frozendict({'group_ids': frozenset(), 'module_ids': frozenset()})
+        return self._get_user_snapshot(user.id, user.write_date)
+
+    @api.model
+    @tools.ormcache('user_id', 'write_date')
+    def _get_user_snapshot(self, user_id, write_date):
+        groups = self.env['res.users'].sudo().browse(user_id).groups_id
+        return frozendict({
+            'group_ids': frozenset(groups.ids),
+            'module_ids': frozenset(self.get_modules_for_groups(groups).ids),
+        })
+
+    @api.model
+    def get_menus_for_modules(self, modules, exclude_xmlids=()):
+        """Menús de los módulos indicados con todos sus descendientes.
+
+        :param exclude_xmlids: xml_ids de menús que se deben omitir
+        :return: (menús, xml_ids omitidos)
+        """
+        index = self._get_menu_index()
+        menu_ids = set()
+        for module in modules:
+            menu_ids |= index['module_menus'].get(module.name or '', frozenset())
+        excluded = {menu_id for menu_id in menu_ids if index['menu_xmlids'].get(menu_id) in exclude_xmlids}
+        return (
+            self.env['ir.ui.menu'].sudo().browse(sorted(menu_ids - excluded)),
+            sorted(index['menu_xmlids'][menu_id] for menu_id in excluded),
+        )
@@ -0,0 +1,445 @@
+# -*- coding: utf-8 -*-
+import re
+from collections import defaultdict
+
+from odoo import api, models, _
+from odoo.exceptions import UserError
+from odoo.osv import expression
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Grupos de tipo de usuario: un usuario debe tener exactamente uno
+USER_TYPE_GROUPS = (
+    ('internal', 'base.group_user'),
+    ('portal', 'base.group_portal'),
+    ('public', 'base.group_public'),
+)
+
+# Dominio de las reglas de bloqueo: siempre falso = sin acceso
+BLOCK_RULE_DOMAIN = '[(0, "=", 1)]'
+
+# Grupos de bloqueo por usuario del esquema anterior: "Blocked: módulo - User id"
+LEGACY_BLOCK_GROUP_RE = re.compile(r'^Blocked: (?P<module>.+) - User (?P<user_id>\d+)$')
+
+
+class PermissionPlan(models.AbstractModel):
+    """Compilador de planes de permisos.
+
+    ``compile`` calcula de una sola vez, para uno o muchos usuarios, el conjunto
+    final de grupos de cada uno y los grupos y reglas de bloqueo que faltan.
+    ``apply`` ejecuta el plan con una creación de grupos, una creación de reglas,
+    una escritura de grupos por conjunto final distinto y una sola limpieza de
+    cachés al final.
+
+    El bloqueo de módulos usa un grupo compartido por módulo ("Blocked: módulo")
+    y una regla por (módulo, modelo) sobre ese grupo: bloquear o desbloquear a un
+    usuario solo cambia su pertenencia al grupo, y el número de reglas no crece
+    con el número de usuarios.
+
+    La configuración a aplicar (``spec``) es un diccionario con las claves:
+
+    - ``restriction_mode``: 'allow_list', 'block_list' o False (solo agregar
+      los grupos de ``allowed_modules`` y quitar los de ``blocked_modules``)
+    - ``operation_mode``: 'add' o 'replace' (solo en 'allow_list')
+    - ``allowed_modules`` / ``blocked_modules``: recordsets de ir.module.module
+    - ``groups_to_add`` / ``groups_to_remove``: grupos explícitos (rol, líneas)
+    - ``groups_to_exclude``: grupos que se quitan siempre (control fino)
+    """
+    _name = 'permission.plan'
+    _description = 'Compilador de Planes de Permisos'
+
+    # ------------------------------------------------------------
+    # Datos compartidos
+    # ------------------------------------------------------------
+
+    @api.model
+    def _get_user_type_groups(self):
+        """{código de tipo: grupo} de los tipos de usuario."""
+        Groups = self.env['res.groups'].sudo()
+        return {
+            code: self.env.ref(xml_id, raise_if_not_found=False) or Groups
+            for code, xml_id in USER_TYPE_GROUPS
+        }
+
+    @api.model
+    def _get_essential_shared_groups(self, user_type_groups):
+        """Grupos compartidos que nunca se quitan al bloquear módulos.
+
+        Son usados por varios módulos y quitarlos afectaría todo el acceso del
+        usuario; el bloqueo de esos módulos se hace con reglas ir.rule.
+        """
+        shared = self.env['res.groups'].sudo().search([('category_id.name', '=', 'Inventory / Stock')])
+        for group in user_type_groups.values():
+            shared |= group
+        return shared
+
+    @api.model
+    def _get_block_group_name(self, module_name):
+        """Grupo de bloqueo compartido de un módulo; los usuarios bloqueados son sus miembros."""
+        return f'Blocked: {module_name}'
+
+    @api.model
+    def _get_block_rule_name(self, module_name, model_name):
+        return f'Block {module_name} - {model_name}'
+
+    @api.model
+    def _search_groups_by_module_name(self, modules):
+        """Búsqueda amplia (por nombre y categoría) de grupos para varios módulos en una consulta."""
+        domains = []
+        for module in modules:
+            if module.name:
+                domains += [[('name', 'ilike', module.name)], [('category_id.name', 'ilike', module.name)]]
+            if module.shortdesc:
+                domains.append([('category_id.name', 'ilike', module.shortdesc)])
+        if not domains:
+            return self.env['res.groups'].sudo()
+        return self.env['res.groups'].sudo().search(expression.OR(domains))
+
+    @api.model
+    def _check_unique_users(self, users):
+        """Verificar con dos consultas agrupadas que ningún usuario destino comparte
+        contacto o login con otro usuario (los permisos se replicarían)."""
+        Users = self.env['res.users'].sudo().with_context(active_test=False)
+        shared_partners = [
+            partner for partner, count in Users._read_group(
+                [('partner_id', 'in', users.partner_id.ids)], ['partner_id'], ['__count'],
+            ) if count > 1
+        ]
+        if shared_partners:
+            sharing = Users.search([('partner_id', 'in', [p.id for p in shared_partners])], order='partner_id, id')
+            raise UserError(_(
+                'Error: Se encontraron usuarios que comparten el mismo contacto (partner_id).\n\n'
+                'Usuarios encontrados:\n%s\n\n'
+                'Esto puede causar que los permisos se apliquen a múltiples usuarios.\n'
+                'Por favor, corrija los usuarios duplicados antes de continuar.'
+            ) % '\n'.join(f'- {u.name} (ID: {u.id}, Login: {u.login}, Partner ID: {u.partner_id.id})' for u in sharing))
+
+        shared_logins = [
+            login for login, count in Users._read_group(
+                [('login', 'in', [login for login in users.mapped('login') if login])], ['login'], ['__count'],
+            ) if count > 1
+        ]
+        if shared_logins:
+            sharing = Users.search([('login', 'in', shared_logins)], order='login, id')
+            raise UserError(_(
+                'Error: Se encontraron usuarios que comparten el mismo login.\n\n'
+                'Usuarios encontrados:\n%s\n\n'
+                'Esto puede causar que los permisos se apliquen a múltiples usuarios.\n'
+                'Por favor, corrija los usuarios duplicados antes de continuar.'
+            ) % '\n'.join(f'- {u.name} (ID: {u.id}, Login: {u.login})' for u in sharing))
+
+    # ------------------------------------------------------------
+    # Compilación
+    # ------------------------------------------------------------
+
+    @api.model
+    def _compile_shared_groups(self, spec, essential_shared):
+        """Grupos a agregar y quitar comunes a todos los usuarios del plan."""
+        Groups = self.env['res.groups'].sudo()
+        Module = self.env['ir.module.module']
+        Index = self.env['permission.module.index']
+        restriction_mode = spec.get('restriction_mode')
+        allowed = spec.get('allowed_modules') or Module
+        blocked = spec.get('blocked_modules') or Module
+        excluded = spec.get('groups_to_exclude') or Groups
+
+        groups_to_add = spec.get('groups_to_add') or Groups
+        groups_to_remove = (spec.get('groups_to_remove') or Groups) | excluded
+        modules_to_block = Module
+        modules_to_unblock = Module
+
+        if restriction_mode == 'allow_list' and allowed:
+            groups_to_add |= Index.get_groups_for_modules(allowed) - excluded
+            modules_to_unblock = allowed
+            if (spec.get('operation_mode') or 'replace') == 'replace':
+                # Quitar los grupos de todos los demás módulos instalados
+                modules_to_block = Module.search([('state', '=', 'installed')]) - allowed
+                groups_to_remove |= Index.get_groups_for_modules(modules_to_block) - essential_shared
+        elif restriction_mode == 'block_list' and blocked:
+            modules_to_block = blocked
+            blocked_groups = Index.get_groups_for_modules(blocked) - essential_shared
+            if not blocked_groups:
+                _logger.warning('No se encontraron grupos específicos para los módulos bloqueados. Intentando búsqueda más amplia...')
+                blocked_groups = self._search_groups_by_module_name(blocked) - essential_shared
+            groups_to_remove |= blocked_groups
+        elif not restriction_mode:
+            if allowed:
+                groups_to_add |= Index.get_groups_for_modules(allowed)
+            if blocked:
+                groups_to_remove |= Index.get_groups_for_modules(blocked)
+
+        return groups_to_add, groups_to_remove, modules_to_block, modules_to_unblock
+
+    @api.model
+    def compile(self, users, spec, check_unique=True):
+        """Calcular el plan de permisos de los usuarios indicados, sin escribir nada.
+
+        :param users: recordset de res.users
+        :param spec: configuración a aplicar (ver docstring del modelo)
+        :param check_unique: verificar que ningún usuario comparta contacto o login;
+            solo se omite para simular (p. ej. el debug de grupos), nunca antes de ``apply``
+        :return: diccionario del plan, listo para ``apply``
+        """
+        users = users.sudo().exists()
+        if not users:
+            raise UserError(_('Debe seleccionar al menos un usuario.'))
+        if check_unique:
+            self._check_unique_users(users)
+
+        user_type_groups = self._get_user_type_groups()
+        all_type_groups = self.env['res.groups'].sudo()
+        for group in user_type_groups.values():
+            all_type_groups |= group
+        essential_shared = self._get_essential_shared_groups(user_type_groups)
+        groups_to_add, groups_to_remove, modules_to_block, modules_to_unblock = \
+            self._compile_shared_groups(spec, essential_shared)
+
+        # Los tipos de usuario nunca se agregan ni se quitan desde módulos o roles
+        groups_to_add -= all_type_groups
+        groups_to_remove -= all_type_groups
+
+        create_block_rules = spec.get('restriction_mode') == 'block_list'
+        block_module_names = modules_to_block.mapped('name') if create_block_rules else []
+        unblock_module_names = modules_to_unblock.mapped('name')
+
+        # Grupos de bloqueo compartidos (uno por módulo) en una búsqueda
+        block_group_ids = self._get_block_group_ids(block_module_names + unblock_module_names)
+        block_rules_to_create = self._get_missing_block_rules(block_module_names, block_group_ids)
+
+        hidden_category = self.env.ref('base.module_category_hidden', raise_if_not_found=False)
+        plan = {
+            'users': {},
+            'block_groups_to_create': [{
+                'name': self._get_block_group_name(module_name),
+                'category_id': hidden_category.id if hidden_category else False,
+                'comment': f'Grupo compartido para bloquear acceso al módulo {module_name}. '
+                           f'Los usuarios bloqueados son miembros de este grupo.',
+            } for module_name in block_module_names if module_name not in block_group_ids],
+            'block_group_ids': {
+                self._get_block_group_name(module_name): group_id
+                for module_name, group_id in block_group_ids.items()
+            },
+            'rules_to_create': block_rules_to_create,
+            'unblock_group_ids': [],
+            'modules_to_block': modules_to_block.ids,
+            'modules_to_unblock': modules_to_unblock.ids,
+            'block_rules': create_block_rules,
+        }
+        unblock_group_ids = {block_group_ids[name] for name in unblock_module_names if name in block_group_ids}
+        plan['unblock_group_ids'] = sorted(unblock_group_ids)
+        block_group_names = [self._get_block_group_name(module_name) for module_name in block_module_names]
+        for user in users:
+            current = user.groups_id
+            user_type = next((code for code, group in user_type_groups.items() if group and current & group), None)
+            if not user_type:
+                _logger.warning('Usuario %s (ID: %s) sin tipo de usuario. Se agregará Internal User.', user.name, user.id)
+            type_group = user_type_groups[user_type or 'internal']
+
+            # Mantener solo el tipo de usuario actual (o Internal User si no tiene)
+            final = ((current | groups_to_add) - groups_to_remove - all_type_groups) | type_group
+            plan['users'][user.id] = {
+                'current': set(current.ids),
+                # Desbloquear = salir del grupo de bloqueo compartido; las reglas se mantienen
+                'final': set(final.ids) - unblock_group_ids,
+                'block_group_names': block_group_names,
+            }
+        return plan
+
+    @api.model
+    def _get_block_group_ids(self, module_names):
+        """{módulo: id del grupo de bloqueo compartido} de los grupos que ya existen."""
+        names = {self._get_block_group_name(module_name): module_name for module_name in module_names}
+        result = {}
+        if names:
+            for group in self.env['res.groups'].sudo().search([('name', 'in', list(names))], order='id'):
+                result.setdefault(names[group.name], group.id)
+        return result
+
+    @api.model
+    def _get_missing_block_rules(self, module_names, block_group_ids):
+        """Reglas de bloqueo que faltan, una por (módulo, modelo) sobre el grupo compartido.
+
+        :return: [(nombre del grupo de bloqueo, valores de la regla)]
+        """
+        Index = self.env['permission.module.index']
+        rule_models = {module_name: Index._get_module_rule_models(module_name) for module_name in module_names}
+        model_names = sorted({model for models_ in rule_models.values() for model in models_})
+        if not model_names:
+            return []
+        model_ids = {
+            model['model']: model['id']
+            for model in self.env['ir.model'].sudo().search_read([('model', 'in', model_names)], ['model'])
+        }
+        existing = set()
+        group_ids = [block_group_ids[name] for name in module_names if name in block_group_ids]
+        if group_ids:
+            for rule in self.env['ir.rule'].sudo().with_context(active_test=False).search([('groups', 'in', group_ids)]):
+                existing.update((group.id, rule.model_id.id) for group in rule.groups)
+
+        rules = []
+        for module_name, models_ in rule_models.items():
+            group_id = block_group_ids.get(module_name)
+            for model_name in models_:
+                if model_name not in model_ids or (group_id, model_ids[model_name]) in existing:
+                    continue
+                rules.append((self._get_block_group_name(module_name), {
+                    'name': self._get_block_rule_name(module_name, model_name),
+                    'model_id': model_ids[model_name],
+                    'domain_force': BLOCK_RULE_DOMAIN,
+                    'global': False,
+                    'active': True,
+                }))
+        return rules
+
+    # ------------------------------------------------------------
+    # Aplicación
+    # ------------------------------------------------------------
+
+    @api.model
+    def apply(self, plan):
+        """Ejecutar un plan compilado con escrituras en lote.
+
+        :return: resumen con las cantidades aplicadas y, por usuario, los ids de
+            grupos agregados y quitados
+        """
+        Groups = self.env['res.groups'].sudo()
+        Rule = self.env['ir.rule'].sudo()
+        Users = self.env['res.users'].sudo()
+
+        group_ids = dict(plan['block_group_ids'])
+        if plan['block_groups_to_create']:
+            created = Groups.create(plan['block_groups_to_create'])
+            group_ids.update(zip([vals['name'] for vals in plan['block_groups_to_create']], created.ids))
+
+        if plan['rules_to_create']:
+            Rule.create([
+                dict(vals, groups=[(6, 0, [group_ids[group_name]])])
+                for group_name, vals in plan['rules_to_create']
+            ])
+
+        summary = {
+            'users': len(plan['users']),
+            'changed_users': 0,
+            'group_writes': 0,
+            'block_groups_created': len(plan['block_groups_to_create']),
+            'rules_created': len(plan['rules_to_create']),
+            'unblocked': 0,
+            'added': {},
+            'removed': {},
+        }
+        unblock_group_ids = set(plan['unblock_group_ids'])
+        users_by_final = defaultdict(list)
+        for user_id, entry in plan['users'].items():
+            summary['unblocked'] += len(entry['current'] & unblock_group_ids)
+            final = entry['final'] | {group_ids[name] for name in entry['block_group_names']}
+            summary['added'][user_id] = sorted(final - entry['current'])
+            summary['removed'][user_id] = sorted(entry['current'] - final)
+            if final != entry['current']:
+                users_by_final[frozenset(final)].append(user_id)
+
+        # Una escritura por conjunto final de grupos (los usuarios con el mismo conjunto comparten la escritura)
+        for final, user_ids in users_by_final.items():
+            Users.browse(user_ids).write({'groups_id': [(6, 0, sorted(final))]})
+            summary['changed_users'] += len(user_ids)
+            summary['group_writes'] += 1
+
+        Users.browse(list(plan['users'])).invalidate_recordset(['groups_id'])
+        self.env.registry.clear_cache()
+        _logger.info(
+            "Plan de permisos aplicado: %s usuarios (%s modificados, %s escrituras), %s grupos de bloqueo, "
+            "%s reglas creadas, %s desbloqueos",
+            summary['users'], summary['changed_users'], summary['group_writes'],
+            summary['block_groups_created'], summary['rules_created'], summary['unblocked'],
+        )
+        return summary
+
+    @api.model
+    def compile_and_apply(self, users, spec):
+        return self.apply(self.compile(users, spec))
+
+    # ------------------------------------------------------------
+    # Consolidación del esquema anterior
+    # ------------------------------------------------------------
+
+    @api.model
+    def _consolidate_block_rules(self):
+        """Colapsar los grupos y reglas de bloqueo por usuario en el esquema compartido.
+
+        Cada "Blocked: módulo - User id" se reemplaza por el grupo "Blocked: módulo":
+        sus usuarios pasan a ser miembros del grupo compartido, se crea (si falta)
+        una regla por (módulo, modelo) y se eliminan las reglas y grupos por usuario.
+
+        :return: resumen con los grupos y reglas eliminados y creados
+        """
+        Groups = self.env['res.groups'].sudo().with_context(active_test=False)
+        Rule = self.env['ir.rule'].sudo().with_context(active_test=False)
+        summary = {'legacy_groups': 0, 'legacy_rules': 0, 'block_groups_created': 0, 'rules_created': 0}
+
+        legacy_by_module = defaultdict(lambda: Groups)
+        for group in Groups.search([('name', '=like', 'Blocked: % - User %')]):
+            match = LEGACY_BLOCK_GROUP_RE.match(group.name or '')
+            if match:
+                legacy_by_module[match['module']] |= group
+        if not legacy_by_module:
+            return summary
+
+        module_names = sorted(legacy_by_module)
+        block_group_ids = self._get_block_group_ids(module_names)
+        hidden_category = self.env.ref('base.module_category_hidden', raise_if_not_found=False)
+        missing = [module_name for module_name in module_names if module_name not in block_group_ids]
+        if missing:
+            created = Groups.create([{
+                'name': self._get_block_group_name(module_name),
+                'category_id': hidden_category.id if hidden_category else False,
+                'comment': f'Grupo compartido para bloquear acceso al módulo {module_name}. '
+                           f'Los usuarios bloqueados son miembros de este grupo.',
+            } for module_name in missing])
+            block_group_ids.update(zip(missing, created.ids))
+            summary['block_groups_created'] = len(created)
+
+        # Una regla por (módulo, modelo) a partir de los modelos que ya estaban bloqueados
+        legacy_groups = Groups.browse([g.id for groups in legacy_by_module.values() for g in groups])
+        legacy_rules = Rule.search([('groups', 'in', legacy_groups.ids)])
+        existing = {
+            (group.id, rule.model_id.id)
+            for rule in Rule.search([('groups', 'in', list(block_group_ids.values()))])
+            for group in rule.groups
+        }
+        rule_vals = {}
+        for module_name, groups in legacy_by_module.items():
+            group_id = block_group_ids[module_name]
+            for rule in legacy_rules.filtered(lambda r: r.groups & groups):
+                key = (group_id, rule.model_id.id)
+                if key in existing or key in rule_vals:
+                    continue
+                rule_vals[key] = {
+                    'name': self._get_block_rule_name(module_name, rule.model_id.model),
+                    'model_id': rule.model_id.id,
+                    'domain_force': BLOCK_RULE_DOMAIN,
+                    'global': False,
+                    'active': True,
+                    'groups': [(6, 0, [group_id])],
+                }
+        if rule_vals:
+            Rule.create(list(rule_vals.values()))
+            summary['rules_created'] = len(rule_vals)
+
+        # Pasar los usuarios al grupo compartido: una escritura por módulo
+        for module_name, groups in legacy_by_module.items():
+            if groups.users:
+                Groups.browse(block_group_ids[module_name]).write({
+                    'users': [(4, user_id) for user_id in groups.users.ids],
+                })
+
+        summary['legacy_rules'] = len(legacy_rules)
+        summary['legacy_groups'] = len(legacy_groups)
+        legacy_rules.unlink()
+        legacy_groups.unlink()
+        self.env.registry.clear_cache()
+        _logger.info(
+            "Consolidación de bloqueos: %s grupos y %s reglas por usuario reemplazados por %s grupos "
+            "compartidos nuevos y %s reglas",
+            summary['legacy_groups'], summary['legacy_rules'], summary['block_groups_created'], summary['rules_created'],
+        )
+        return summary
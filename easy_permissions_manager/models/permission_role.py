@@ -52,3 +52,16 @@ class PermissionRole(models.Model):
         default=True,
         help='Si está desactivado, este rol no aparecerá en las opciones'
     )
+
+    def apply_to_users(self, users):
+        """Aplicar el rol a varios usuarios con un solo plan de permisos.
+
+        :param users: recordset de res.users
+        :return: resumen de ``permission.plan.apply``
+        """
+        self.ensure_one()
+        return self.env['permission.plan'].compile_and_apply(users, {
+            'restriction_mode': False,
+            'groups_to_add': self.group_ids,
+            'groups_to_remove': self.excluded_group_ids,
+        })
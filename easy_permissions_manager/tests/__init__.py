@@ -0,0 +1,2 @@
+from . import test_permission_plan
+from . import test_block_rules
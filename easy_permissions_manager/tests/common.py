@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from odoo.tests import common
+
+
+class PermissionPlanCommon(common.TransactionCase):
+    """Base de las pruebas de permission.plan: un módulo de prueba y una spec vacía."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.Plan = cls.env['permission.plan']
+        cls.Module = cls.env['ir.module.module']
+        cls.Groups = cls.env['res.groups']
+        cls.Rule = cls.env['ir.rule']
+        # Módulo sin grupos propios cuyas reglas de bloqueo caen sobre res.partner*
+        cls.module = cls.Module.create({'name': 'partner_plan_block', 'state': 'installed'})
+        cls.block_group_name = cls.Plan._get_block_group_name(cls.module.name)
+        cls.rule_models = cls.env['permission.module.index']._get_module_rule_models(cls.module.name)
+
+    @classmethod
+    def _spec(cls, **values):
+        spec = {
+            'restriction_mode': False,
+            'operation_mode': 'add',
+            'allowed_modules': cls.Module,
+            'blocked_modules': cls.Module,
+            'groups_to_add': cls.Groups,
+            'groups_to_remove': cls.Groups,
+            'groups_to_exclude': cls.Groups,
+        }
+        spec.update(values)
+        return spec
+
+    def _block_group(self):
+        return self.Groups.search([('name', '=', self.block_group_name)])
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+import logging
+import time
+
+from odoo.tests import new_test_user, tagged
+
+from .common import PermissionPlanCommon
+
+_logger = logging.getLogger(__name__)
+
+BENCHMARK_USERS = 100
+
+
+@tagged('post_install', '-at_install')
+class TestBlockRules(PermissionPlanCommon):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.spec = cls._spec(restriction_mode='block_list', blocked_modules=cls.module)
+
+    def _create_legacy_blocks(self, users, module_name, models):
+        """Esquema anterior: un grupo "Blocked: módulo - User id" y una regla por modelo para cada usuario."""
+        legacy_groups = self.Groups.create([{
+            'name': f'Blocked: {module_name} - User {user.id}',
+            'users': [(4, user.id)],
+        } for user in users])
+        legacy_rules = self.Rule.create([{
+            'name': f'Block {module_name} - {model.model} - User {group.id}',
+            'model_id': model.id,
+            'domain_force': '[(0, "=", 1)]',
+            'groups': [(6, 0, group.ids)],
+        } for group in legacy_groups for model in models])
+        return legacy_groups, legacy_rules
+
+    def _search_query_count(self, user):
+        """Consultas de un search() en frío (sin caché de reglas) de un usuario bloqueado."""
+        self.env.registry.clear_cache()
+        self.env.invalidate_all()
+        Partner = self.env['res.partner'].with_user(user)
+        start_count, start_time = self.env.cr.sql_log_count, time.perf_counter()
+        Partner.search([], limit=80)
+        return self.env.cr.sql_log_count - start_count, time.perf_counter() - start_time
+
+    def test_benchmark_search_overhead(self):
+        users = self.env['res.users'].browse([
+            new_test_user(self.env, login=f'bench_block_{index}').id for index in range(BENCHMARK_USERS)
+        ])
+        first = users[0]
+        models = self.env['ir.model'].search([('model', 'in', self.rule_models)])
+        self.assertTrue(models)
+
+        # Esquema anterior: las reglas crecen con el número de usuarios bloqueados
+        legacy_groups, legacy_rules = self._create_legacy_blocks(users, self.module.name, models)
+        self.assertEqual(len(legacy_rules), BENCHMARK_USERS * len(models))
+        legacy_queries, legacy_elapsed = self._search_query_count(first)
+
+        # Esquema compartido: un grupo por módulo y una regla por (módulo, modelo)
+        self.Plan._consolidate_block_rules()
+        self.assertFalse(legacy_groups.exists())
+        block_group = self._block_group()
+        self.assertEqual(block_group.users & users, users)
+        rule_count = self.Rule.search_count([('groups', 'in', block_group.ids)])
+        self.assertEqual(rule_count, len(models))
+        shared_queries, shared_elapsed = self._search_query_count(first)
+
+        # El esquema compartido no es peor que el anterior
+        self.assertLessEqual(rule_count, len(legacy_rules))
+        self.assertLessEqual(shared_queries, legacy_queries)
+        _logger.info(
+            "Benchmark de bloqueo (%s usuarios): esquema por usuario %s reglas, search() %s consultas (%.1f ms); "
+            "esquema compartido %s reglas, search() %s consultas (%.1f ms)",
+            BENCHMARK_USERS, len(legacy_rules), legacy_queries, legacy_elapsed * 1000,
+            rule_count, shared_queries, shared_elapsed * 1000,
+        )
+
+        # Volver a bloquear a los mismos usuarios no crea grupos ni reglas
+        summary = self.Plan.compile_and_apply(users, self.spec)
+        self.assertEqual(summary['block_groups_created'], 0)
+        self.assertEqual(summary['rules_created'], 0)
+        self.assertEqual(summary['group_writes'], 0)
+        self.assertEqual(self.Groups.search_count([('name', '=like', f'{self.block_group_name}%')]), 1)
+
+    def test_consolidate_legacy_block_rules(self):
+        users = new_test_user(self.env, login='legacy_block_1') | new_test_user(self.env, login='legacy_block_2')
+        models = self.env['ir.model'].search([('model', 'in', ('res.partner', 'res.partner.category'))])
+        legacy_groups, legacy_rules = self._create_legacy_blocks(users, 'partner_legacy_block', models)
+
+        summary = self.Plan._consolidate_block_rules()
+        self.assertEqual(summary['legacy_groups'], 2)
+        self.assertEqual(summary['legacy_rules'], 4)
+        self.assertEqual(summary['block_groups_created'], 1)
+        self.assertEqual(summary['rules_created'], 2)
+        self.assertFalse(legacy_groups.exists())
+        self.assertFalse(legacy_rules.exists())
+
+        block_group = self.Groups.search([('name', '=', 'Blocked: partner_legacy_block')])
+        self.assertEqual(len(block_group), 1)
+        self.assertEqual(block_group.users & users, users)
+        rules = self.Rule.search([('groups', 'in', block_group.ids)])
+        self.assertEqual(rules.model_id, models)
+        self.assertEqual(len(rules), 2)
+
+        # Una segunda ejecución (p. ej. la migración repetida) no cambia nada
+        summary = self.Plan._consolidate_block_rules()
+        self.assertEqual(summary['legacy_groups'], 0)
+        self.assertEqual(self.Rule.search_count([('groups', 'in', block_group.ids)]), 2)
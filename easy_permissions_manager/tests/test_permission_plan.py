@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+from odoo.tests import new_test_user, tagged
+
+from .common import PermissionPlanCommon
+
+
+@tagged('post_install', '-at_install')
+class TestPermissionPlan(PermissionPlanCommon):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.group_user = cls.env.ref('base.group_user')
+        cls.group_portal = cls.env.ref('base.group_portal')
+        cls.type_groups = cls.group_user | cls.group_portal | cls.env.ref('base.group_public')
+        cls.extra_group = cls.env.ref('base.group_partner_manager')
+
+    def test_allow_list_replace_keeps_one_user_type(self):
+        internal = new_test_user(self.env, login='plan_internal', groups='base.group_user,base.group_partner_manager')
+        portal = new_test_user(self.env, login='plan_portal', groups='base.group_portal')
+        spec = self._spec(
+            restriction_mode='allow_list',
+            operation_mode='replace',
+            allowed_modules=self.module,
+            # Un tipo de usuario pedido explícitamente nunca se agrega
+            groups_to_add=self.group_portal,
+        )
+        self.Plan.compile_and_apply(internal | portal, spec)
+        self.assertEqual(internal.groups_id & self.type_groups, self.group_user)
+        self.assertEqual(portal.groups_id & self.type_groups, self.group_portal)
+
+    def test_block_list_shared_group_is_idempotent(self):
+        users = new_test_user(self.env, login='plan_block_1') | new_test_user(self.env, login='plan_block_2')
+        spec = self._spec(restriction_mode='block_list', blocked_modules=self.module)
+        self.assertTrue(self.rule_models)
+
+        summary = self.Plan.compile_and_apply(users, spec)
+        block_group = self._block_group()
+        self.assertEqual(len(block_group), 1)
+        self.assertEqual(summary['block_groups_created'], 1)
+        self.assertEqual(summary['rules_created'], len(self.rule_models))
+        self.assertEqual(self.Rule.search_count([('groups', 'in', block_group.ids)]), len(self.rule_models))
+        self.assertEqual(block_group.users & users, users)
+
+        summary = self.Plan.compile_and_apply(users, spec)
+        self.assertEqual(summary['block_groups_created'], 0)
+        self.assertEqual(summary['rules_created'], 0)
+        self.assertEqual(summary['group_writes'], 0)
+        self.assertEqual(self.Groups.search_count([('name', '=', self.block_group_name)]), 1)
+        self.assertEqual(self.Rule.search_count([('groups', 'in', block_group.ids)]), len(self.rule_models))
+
+    def test_bulk_identical_final_sets_share_one_write(self):
+        users = self.env['res.users'].browse([
+            new_test_user(self.env, login=f'plan_bulk_{index}').id for index in range(3)
+        ])
+        other = new_test_user(self.env, login='plan_bulk_other', groups='base.group_user,base.group_multi_currency')
+        spec = self._spec(groups_to_add=self.extra_group)
+
+        summary = self.Plan.compile_and_apply(users | other, spec)
+        self.assertEqual(summary['changed_users'], 4)
+        self.assertEqual(summary['group_writes'], 2)
+        for user in users | other:
+            self.assertIn(self.extra_group, user.groups_id)
+        self.assertEqual(len(set(map(frozenset, (user.groups_id.ids for user in users)))), 1)
+
+    def test_apply_membership_matches_summary(self):
+        multi_currency = self.env.ref('base.group_multi_currency')
+        user = new_test_user(self.env, login='plan_membership', groups='base.group_user,base.group_multi_currency')
+        before = user.groups_id
+        spec = self._spec(groups_to_add=self.extra_group, groups_to_remove=multi_currency)
+
+        summary = self.Plan.compile_and_apply(user, spec)
+        self.assertIn(self.extra_group, user.groups_id)
+        self.assertNotIn(multi_currency, user.groups_id)
+        self.assertEqual(user.groups_id & self.type_groups, self.group_user)
+        # El resumen describe exactamente la diferencia escrita
+        self.assertEqual(set(summary['added'][user.id]), set((user.groups_id - before).ids))
+        self.assertEqual(set(summary['removed'][user.id]), set((before - user.groups_id).ids))
+
+    def test_unblock_only_changes_membership(self):
+        blocked, other = (new_test_user(self.env, login='plan_unblock_1'),
+                          new_test_user(self.env, login='plan_unblock_2'))
+        self.Plan.compile_and_apply(blocked | other, self._spec(restriction_mode='block_list', blocked_modules=self.module))
+        block_group = self._block_group()
+        rules = self.Rule.search([('groups', 'in', block_group.ids)])
+
+        summary = self.Plan.compile_and_apply(blocked, self._spec(
+            restriction_mode='allow_list', operation_mode='add', allowed_modules=self.module,
+        ))
+        self.assertEqual(summary['unblocked'], 1)
+        self.assertNotIn(block_group, blocked.groups_id)
+        # El grupo compartido y sus reglas siguen bloqueando a los demás
+        self.assertIn(block_group, other.groups_id)
+        self.assertTrue(block_group.exists())
+        self.assertEqual(self.Rule.search([('groups', 'in', block_group.ids)]), rules)
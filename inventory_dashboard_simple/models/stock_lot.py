@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 from odoo import api, fields, models, _
+from odoo.osv import expression
 from odoo.exceptions import UserError
 import logging
 
@@ -415,14 +416,13 @@ class StockLot(models.Model):
                     lot.ref = False
 
     @api.model
-    def _name_search(self, name='', args=None, operator='ilike', limit=100, order=None):
+    def _name_search(self, name, domain=None, operator='ilike', limit=None, order=None):
         """Permitir búsqueda por número de serie y placa de inventario, con filtro de ubicación según el contexto.
         
-        Basado en la implementación de mesa_ayuda_inventario/models/customer_inventory_lot.py
+        La búsqueda por texto usa la implementación indexada y ordenada de product_suppiles
+        (search_key); aquí solo se agrega el filtro de ubicación y la búsqueda por contacto.
         """
-        if args is None:
-            args = []
-        
+        domain = list(domain or [])
         # Verificar si se debe filtrar por ubicación desde el contexto
         filter_by_location = self.env.context.get('filter_by_location', False)
         operation_type = self.env.context.get('wizard_operation_type', False)
@@ -494,62 +494,21 @@ class StockLot(models.Model):
                     _logger.debug("No hay lotes disponibles en la ubicación seleccionada")
                     return []
         
-        # Si hay un término de búsqueda, buscar en múltiples campos
-        # Buscar en: inventory_plate, name (número de serie), y display_contact_id (contacto)
-        if name and name.strip():
-            search_term = name.strip()
-            
-            # Búsqueda normal: buscar en múltiples campos
-            # Buscar contactos que coincidan con el término de búsqueda
-            partner_ids = []
-            try:
-                partners = self.env['res.partner'].search([
-                    '|',
-                    ('name', operator, search_term),
-                    ('display_name', operator, search_term)
-                ], limit=100)
-                partner_ids = partners.ids
-            except Exception:
-                pass
-            
-            # Construir dominio de búsqueda: inventory_plate, name, o display_contact_id
-            search_domain = [
-                '|', '|',
-                ('inventory_plate', operator, search_term),  # Buscar en placa de inventario
-                ('name', operator, search_term),  # Buscar en número de serie
-            ]
-            
-            # Si se encontraron contactos, agregar búsqueda por contacto
-            if partner_ids:
-                search_domain.append(('display_contact_id', 'in', partner_ids))
-            else:
-                # Si no se encontraron contactos, aún buscar por display_contact_id.name
-                search_domain.append(('display_contact_id.name', operator, search_term))
-            
-            # Si hay filtro de ubicación, aplicarlo directamente
-            if available_lot_ids is not None:
-                location_filter = [('id', 'in', available_lot_ids)]
-                domain = ['&'] + search_domain + location_filter
-            else:
-                # Si no hay filtro de ubicación, usar args si existen
-                if args:
-                    domain = ['&'] + search_domain + args
-                else:
-                    domain = search_domain
-            
-            _logger.debug("Búsqueda de lotes - name: %s, operation_type: %s, available_lots: %d, partners: %d", 
-                         name, operation_type, len(available_lot_ids) if available_lot_ids else 0, len(partner_ids))
-            
-            # Llamar al método padre con name='' porque ya construimos el dominio completo
-            return super(StockLot, self)._name_search(name='', args=domain, operator=operator, limit=limit, order=order)
-        
-        # Si no hay término de búsqueda, aplicar solo filtros de ubicación
         if available_lot_ids is not None:
-            domain = [('id', 'in', available_lot_ids)]
-            return super(StockLot, self)._name_search(name='', args=domain, operator=operator, limit=limit, order=order)
-        
-        # Si no hay filtro de ubicación ni búsqueda, usar método padre normal
-        return super(StockLot, self)._name_search(name=name, args=args, operator=operator, limit=limit, order=order)
+            domain = expression.AND([domain, [('id', 'in', available_lot_ids)]])
+
+        lot_ids = list(super(StockLot, self)._name_search(name, domain, operator, limit=limit, order=order))
+
+        # Completar con los lotes cuyo contacto coincide con el término de búsqueda
+        search_term = (name or '').strip()
+        if search_term and operator in ('ilike', 'like', '=ilike', '=like') and (not limit or len(lot_ids) < limit):
+            partners = self.env['res.partner'].search([('name', operator, search_term)], limit=100)
+            if partners:
+                lot_ids += list(self._search(
+                    expression.AND([domain, [('display_contact_id', 'in', partners.ids), ('id', 'not in', lot_ids)]]),
+                    limit=limit and limit - len(lot_ids), order=order,
+                ))
+        return lot_ids
     
     def action_open_quant_editor(self):
         """Abrir wizard para actualizar cantidad de inventario con este lote."""
@@ -1 +1,2 @@
+from . import route_assignment
 from . import product_template
\ No newline at end of file
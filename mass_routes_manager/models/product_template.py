@@ -28,18 +28,16 @@ class ProductTemplate(models.Model):
                 }
             }
         
-        # Aplicar rutas a los productos
-        count = 0
-        for record in self:
-            record.route_ids = [(6, 0, all_routes.ids)]
-            count += 1
+        # Aplicar rutas a los productos (solo los pares que faltan o sobran)
+        result = self.env['product.route.assignment'].assign(self, all_routes, mode='set')
         
         return {
             'type': 'ir.actions.client',
             'tag': 'display_notification',
             'params': {
                 'title': '✓ Rutas Aplicadas',
-                'message': f'Se seleccionaron {len(all_routes)} ruta(s) en {count} producto(s)',
+                'message': f'Se seleccionaron {len(all_routes)} ruta(s) en {result["products"]} producto(s) '
+                           f'({result["inserted"]} asignaciones nuevas, {result["deleted"]} eliminadas)',
                 'type': 'success',
                 'sticky': False,
             }
@@ -50,17 +48,15 @@ class ProductTemplate(models.Model):
         Elimina todas las rutas de los productos seleccionados.
         Si no hay productos seleccionados, aplica a todos los productos.
         """
-        count = 0
-        for record in self:
-            record.route_ids = [(5, 0, 0)]
-            count += 1
+        result = self.env['product.route.assignment'].assign(self, self.env['stock.route'], mode='set')
         
         return {
             'type': 'ir.actions.client',
             'tag': 'display_notification',
             'params': {
                 'title': '✗ Rutas Eliminadas',
-                'message': f'Se eliminaron todas las rutas de {count} producto(s)',
+                'message': f'Se eliminaron todas las rutas de {result["products"]} producto(s) '
+                           f'({result["deleted"]} asignaciones eliminadas)',
                 'type': 'info',
                 'sticky': False,
             }
@@ -0,0 +1,113 @@
+# models/route_assignment.py
+import logging
+
+from odoo import models, api
+from odoo.tools import split_every
+
+_logger = logging.getLogger(__name__)
+
+
+class ProductRouteAssignment(models.AbstractModel):
+    """
+    Servicio de asignación masiva de rutas a plantillas de producto.
+
+    Calcula la diferencia sobre la tabla de relación product.template ↔ stock.route
+    (solo los pares que faltan o sobran) y la aplica con un INSERT y un DELETE
+    por lote de productos, en lugar de reescribir route_ids producto por producto.
+    Como una escritura (6, 0, ids) del ORM, solo se quitan rutas que el usuario
+    puede ver (activas y de sus compañías). A los productos modificados se les
+    actualiza write_date y la caché se invalida una sola vez al final.
+    """
+    _name = 'product.route.assignment'
+    _description = 'Asignación Masiva de Rutas a Productos'
+
+    @api.model
+    def _get_route_relation(self):
+        field = self.env['product.template']._fields['route_ids']
+        return field.relation, field.column1, field.column2
+
+    @api.model
+    def assign(self, products, routes, mode='set', chunk_size=5000, dry_run=False):
+        """
+        Asigna rutas a un conjunto de productos con operaciones por conjuntos.
+
+        :param products: recordset de product.template
+        :param routes: recordset de stock.route
+        :param mode: 'set' (los productos quedan exactamente con `routes`),
+            'add' (agrega las que faltan) o 'remove' (quita `routes`)
+        :param chunk_size: número de productos por lote
+        :param dry_run: solo cuenta los pares que se insertarían o eliminarían
+        :return: {'products': n, 'inserted': n, 'deleted': n}
+        """
+        assert mode in ('set', 'add', 'remove'), mode
+        result = {'products': len(products), 'inserted': 0, 'deleted': 0}
+        if not products:
+            return result
+        if not dry_run:
+            products.check_access('write')
+
+        ProductTemplate = self.env['product.template']
+        ProductTemplate.flush_model(['route_ids'])
+        relation, product_col, route_col = self._get_route_relation()
+        route_ids = list(routes.ids)
+        # Rutas visibles (activas y de las compañías permitidas): las demás no se tocan
+        visible_route_ids = self.env['stock.route'].search([]).ids
+        cr = self.env.cr
+        changed_product_ids = set()
+
+        for product_ids in split_every(chunk_size, products.ids, list):
+            if mode in ('set', 'add') and route_ids:
+                missing = f"""
+                    FROM unnest(%(product_ids)s) AS p(id)
+                    CROSS JOIN unnest(%(route_ids)s) AS r(id)
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM {relation} x
+                         WHERE x.{product_col} = p.id AND x.{route_col} = r.id
+                    )
+                """
+                params = {'product_ids': product_ids, 'route_ids': route_ids}
+                if dry_run:
+                    cr.execute(f"SELECT count(*) {missing}", params)
+                    result['inserted'] += cr.fetchone()[0]
+                else:
+                    cr.execute(f"""
+                        INSERT INTO {relation} ({product_col}, {route_col}) SELECT p.id, r.id {missing}
+                        RETURNING {product_col}
+                    """, params)
+                    rows = cr.fetchall()
+                    result['inserted'] += len(rows)
+                    changed_product_ids.update(row[0] for row in rows)
+
+            if mode == 'add' or (mode == 'remove' and not route_ids):
+                continue
+            if mode == 'set':
+                # Sobran las rutas visibles asignadas que no están en `routes`
+                where = (f"{product_col} = ANY(%(product_ids)s) AND {route_col} = ANY(%(visible_route_ids)s)"
+                         f" AND NOT ({route_col} = ANY(%(route_ids)s))")
+            else:
+                where = f"{product_col} = ANY(%(product_ids)s) AND {route_col} = ANY(%(route_ids)s)"
+            params = {'product_ids': product_ids, 'route_ids': route_ids, 'visible_route_ids': visible_route_ids}
+            if dry_run:
+                cr.execute(f"SELECT count(*) FROM {relation} WHERE {where}", params)
+                result['deleted'] += cr.fetchone()[0]
+            else:
+                cr.execute(f"DELETE FROM {relation} WHERE {where} RETURNING {product_col}", params)
+                rows = cr.fetchall()
+                result['deleted'] += len(rows)
+                changed_product_ids.update(row[0] for row in rows)
+
+        if changed_product_ids:
+            changed = ProductTemplate.browse(sorted(changed_product_ids))
+            changed.flush_recordset(['write_date', 'write_uid'])
+            cr.execute(f"""
+                UPDATE {ProductTemplate._table}
+                   SET write_date = now() at time zone 'UTC', write_uid = %s
+                 WHERE id = ANY(%s)
+            """, (self.env.uid, changed.ids))
+            changed.invalidate_recordset(['route_ids', 'write_date', 'write_uid'])
+            self.env['stock.route'].invalidate_model(['product_ids'])
+        _logger.info(
+            "Asignación de rutas (%s%s): %s productos, %s pares insertados, %s eliminados",
+            mode, ', simulación' if dry_run else '', result['products'], result['inserted'], result['deleted'],
+        )
+        return result
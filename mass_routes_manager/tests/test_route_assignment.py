@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+from odoo.tests import common
+
+
+class TestRouteAssignment(common.TransactionCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.Assignment = cls.env['product.route.assignment']
+        cls.route_a, cls.route_b, cls.route_c = cls.env['stock.route'].create([
+            {'name': name, 'product_selectable': True}
+            for name in ('Ruta Prueba A', 'Ruta Prueba B', 'Ruta Prueba C')
+        ])
+        cls.products = cls.env['product.template'].create([
+            {'name': f'Producto Rutas {index}'}
+            for index in range(3)
+        ])
+        # Sin rutas por defecto (p. ej. la de compra) para contar solo los pares de la prueba
+        cls.products.route_ids = False
+
+    def test_set_mode(self):
+        self.products[0].route_ids = self.route_c
+        result = self.Assignment.assign(self.products, self.route_a | self.route_b, mode='set')
+        self.assertEqual(result, {'products': 3, 'inserted': 6, 'deleted': 1})
+        for product in self.products:
+            self.assertEqual(product.route_ids, self.route_a | self.route_b)
+
+        # Repetir no cambia nada
+        result = self.Assignment.assign(self.products, self.route_a | self.route_b, mode='set')
+        self.assertEqual((result['inserted'], result['deleted']), (0, 0))
+
+    def test_add_mode(self):
+        self.products[0].route_ids = self.route_a | self.route_c
+        result = self.Assignment.assign(self.products, self.route_a, mode='add')
+        self.assertEqual((result['inserted'], result['deleted']), (2, 0))
+        self.assertEqual(self.products[0].route_ids, self.route_a | self.route_c)
+        self.assertEqual(self.products[1].route_ids, self.route_a)
+
+    def test_remove_mode(self):
+        self.products.route_ids = self.route_a | self.route_b
+        result = self.Assignment.assign(self.products[:2], self.route_a, mode='remove')
+        self.assertEqual((result['inserted'], result['deleted']), (0, 2))
+        self.assertEqual(self.products[0].route_ids, self.route_b)
+        self.assertEqual(self.products[2].route_ids, self.route_a | self.route_b)
+
+        # Sin rutas no se elimina nada
+        result = self.Assignment.assign(self.products, self.env['stock.route'], mode='remove')
+        self.assertEqual(result['deleted'], 0)
+
+    def test_dry_run_counts(self):
+        self.products[0].route_ids = self.route_a | self.route_c
+        expected = {'products': 3, 'inserted': 5, 'deleted': 1}
+        result = self.Assignment.assign(self.products, self.route_a | self.route_b, mode='set', dry_run=True)
+        self.assertEqual(result, expected)
+        # La simulación no escribe
+        self.assertEqual(self.products[0].route_ids, self.route_a | self.route_c)
+        self.assertFalse(self.products[1].route_ids)
+
+        self.assertEqual(self.Assignment.assign(self.products, self.route_a | self.route_b, mode='set'), expected)
+
+    def test_cache_after_write(self):
+        # Cargar route_ids y product_ids en caché antes de escribir por SQL
+        self.assertFalse(self.products.route_ids)
+        self.assertFalse(self.route_a.product_ids & self.products)
+
+        self.Assignment.assign(self.products, self.route_a, mode='add')
+        for product in self.products:
+            self.assertEqual(product.route_ids, self.route_a)
+        self.assertEqual(self.route_a.product_ids & self.products, self.products)
+
+        self.Assignment.assign(self.products, self.env['stock.route'], mode='set')
+        self.assertFalse(self.products.route_ids)
+        self.assertFalse(self.route_a.product_ids & self.products)
+
+    def test_set_keeps_archived_routes(self):
+        archived = self.env['stock.route'].create({'name': 'Ruta Prueba Archivada', 'product_selectable': True})
+        self.products[0].route_ids = self.route_a | archived
+        archived.active = False
+
+        result = self.Assignment.assign(self.products[0], self.route_b, mode='set')
+        self.assertEqual((result['inserted'], result['deleted']), (1, 1))
+        self.assertEqual(
+            self.products[0].with_context(active_test=False).route_ids,
+            self.route_b | archived,
+        )
+
+    def test_write_date_bumped(self):
+        self.env.flush_all()
+        self.env.cr.execute(
+            "UPDATE product_template SET write_date = '2000-01-01' WHERE id = ANY(%s)", (self.products.ids,)
+        )
+        self.products.invalidate_recordset(['write_date'])
+
+        self.Assignment.assign(self.products[:2], self.route_a, mode='add')
+        self.assertGreater(self.products[0].write_date.year, 2000)
+        self.assertGreater(self.products[1].write_date.year, 2000)
+        self.assertEqual(self.products[2].write_date.year, 2000)
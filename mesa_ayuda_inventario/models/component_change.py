@@ -402,9 +402,14 @@ class MaintenanceComponentChange(models.Model):
                 if not self.new_component_lot_id:
                     old_supply_line.unlink()
                 elif old_supply_line.related_lot_id.id != self.new_component_lot_id.id:
-                    old_supply_line.write({
-                        'related_lot_id': self.new_component_lot_id.id,
-                    })
+                    # Un serial solo puede estar asociado a una línea: si el nuevo componente
+                    # ya quedó en otra línea del lote, la del componente retirado sobra
+                    if supply_line and supply_line.related_lot_id == self.new_component_lot_id:
+                        old_supply_line.unlink()
+                    else:
+                        old_supply_line.write({
+                            'related_lot_id': self.new_component_lot_id.id,
+                        })
     
     def _create_automatic_ticket(self):
         """Crear ticket automático para cambio de componentes."""
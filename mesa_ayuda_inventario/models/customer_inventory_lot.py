@@ -1058,124 +1058,16 @@ class StockLotCustomerInventory(models.Model):
 
     @api.model
     def _search(self, domain, offset=0, limit=None, order=None):
-        """Sobrescribe la búsqueda para que cuando se busque por 'name' (número de serie),
-        también busque automáticamente en 'inventory_plate' (placa de inventario).
-        También excluye automáticamente los componentes asociados a productos principales."""
+        """Aplica el alcance por cliente del contexto ``customer_inventory_allowed_lot_ids``.
+
+        La búsqueda por número de serie o placa la resuelve el campo indexado
+        ``search_key`` de product_suppiles (ver las vistas de búsqueda)."""
         # Blindaje de alcance por cliente (evita que filtros con OR rompan el dominio)
         allowed_ids = self.env.context.get('customer_inventory_allowed_lot_ids')
         if allowed_ids is not None and not self.env.context.get('skip_customer_inventory_scope'):
             scope = [('id', 'in', allowed_ids)] if allowed_ids else [('id', '=', False)]
             domain = expression.AND([domain or [], scope])
-
-        # Evitar procesar cuando se está en contexto de propagación para evitar recursión
-        # También evitar si el dominio es muy simple (búsquedas internas del sistema)
-        if (self.env.context.get('skip_search_enhancement', False) or 
-            self.env.context.get('skip_tracking', False) or
-            self.env.context.get('active_test', False)):
-            return super()._search(domain, offset=offset, limit=limit, order=order)
-        
-        # Si el dominio solo contiene condiciones simples (no búsquedas de texto),
-        # no procesar para evitar problemas con búsquedas internas
-        try:
-            # Convertir domain a lista si es necesario
-            if not isinstance(domain, list):
-                domain = list(domain) if domain else []
-            
-            # Si el dominio es muy simple (solo IDs o condiciones directas), no procesar
-            simple_domains = [('id', 'in', []), ('id', '=', 0), ('principal_lot_id', '=', 0)]
-            if len(domain) == 1 and isinstance(domain[0], (list, tuple)) and len(domain[0]) >= 2:
-                field = domain[0][0]
-                if field in ('id', 'principal_lot_id') and domain[0][1] in ('=', 'in'):
-                    return super()._search(domain, offset=offset, limit=limit, order=order)
-            
-            # Crear una copia del dominio para no modificar el original
-            domain_copy = list(domain)
-            
-            # Buscar si hay una condición de búsqueda por 'name' (número de serie) o 'inventory_plate' (placa)
-            # y hacer que busquen en ambos campos simultáneamente
-            name_condition = None
-            inventory_plate_condition = None
-            text_operators = ('ilike', 'like', '=like', '=', '!=')
-            
-            for condition in domain_copy:
-                if isinstance(condition, (list, tuple)) and len(condition) >= 3:
-                    field_name = condition[0]
-                    operator = condition[1]
-                    value = condition[2]
-                    
-                    # Si se busca por 'name' con un operador de texto
-                    if field_name == 'name' and operator in text_operators:
-                        if value and isinstance(value, str) and value.strip():
-                            name_condition = condition
-                    # Si se busca por 'inventory_plate' con un operador de texto
-                    elif field_name == 'inventory_plate' and operator in text_operators:
-                        if value and isinstance(value, str) and value.strip():
-                            inventory_plate_condition = condition
-            
-            # Si se busca por 'name' y NO hay búsqueda por 'inventory_plate', agregar búsqueda por 'inventory_plate'
-            if name_condition and not inventory_plate_condition:
-                operator = name_condition[1]
-                value = name_condition[2]
-                
-                # Crear condición para inventory_plate con el mismo operador y valor
-                inventory_plate_condition_new = ('inventory_plate', operator, value)
-                
-                # Reemplazar la condición de 'name' con una búsqueda OR en ambos campos
-                name_index = domain_copy.index(name_condition)
-                domain_copy[name_index] = '|'
-                domain_copy.insert(name_index + 1, name_condition)
-                domain_copy.insert(name_index + 2, inventory_plate_condition_new)
-            
-            # Si se busca por 'inventory_plate' y NO hay búsqueda por 'name', agregar búsqueda por 'name'
-            elif inventory_plate_condition and not name_condition:
-                operator = inventory_plate_condition[1]
-                value = inventory_plate_condition[2]
-                
-                # Crear condición para name con el mismo operador y valor
-                name_condition_new = ('name', operator, value)
-                
-                # Reemplazar la condición de 'inventory_plate' con una búsqueda OR en ambos campos
-                plate_index = domain_copy.index(inventory_plate_condition)
-                domain_copy[plate_index] = '|'
-                domain_copy.insert(plate_index + 1, inventory_plate_condition)
-                domain_copy.insert(plate_index + 2, name_condition_new)
-            
-            # Llamar al método padre con el dominio modificado
-            # Usar un modelo base sin nuestras mejoras para evitar recursión
-            StockLotBase = self.env['stock.lot'].with_context(skip_search_enhancement=True)
-            return StockLotBase._search(domain_copy, offset=offset, limit=limit, order=order)
-        except Exception as e:
-            # Si hay algún error, usar el dominio original con contexto de skip
-            _logger.warning("Error en _search de stock.lot: %s", str(e))
-            return super()._search(domain, offset=offset, limit=limit, order=order)
-
-    @api.model
-    def _name_search(self, name='', args=None, operator='ilike', limit=100, order=None):
-        """Sobrescribe la búsqueda para buscar también por placa de inventario.
-        Prioriza la búsqueda en inventory_plate sobre name.
-        Busca en ambos campos simultáneamente cuando se escribe en la barra de búsqueda general."""
-        if args is None:
-            args = []
-        
-        # Si hay un término de búsqueda, buscar tanto en 'inventory_plate' como en 'name'
-        # Priorizar inventory_plate primero, pero buscar en ambos campos
-        if name and name.strip():
-            # Buscar en ambos campos usando OR
-            # Esto permite encontrar resultados tanto por placa como por número de serie
-            domain = [
-                '|',
-                ('inventory_plate', operator, name.strip()),  # Prioridad: buscar primero en placa
-                ('name', operator, name.strip())
-            ]
-            # Combinar con los args existentes usando AND
-            if args:
-                domain = ['&'] + domain + args
-            args = domain
-            # Llamar al método padre con name='' porque ya construimos el dominio completo
-            return super()._name_search(name='', args=args, operator=operator, limit=limit, order=order)
-        
-        # Si no hay término de búsqueda, usar el método padre normal
-        return super()._name_search(name=name, args=args, operator=operator, limit=limit, order=order)
+        return super()._search(domain, offset=offset, limit=limit, order=order)
 
     def action_view_components(self):
         """Ver componentes asociados a este producto principal."""
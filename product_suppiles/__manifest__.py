@@ -11,7 +11,7 @@
     'website': 'https://www.supplies.com',
     'license': 'LGPL-3',
     'category': 'Inventory/Inventory',
-    'version': '18.0.0.0.1',
+    'version': '18.0.0.0.2',
     'installable': True,
     'depends': [
         'purchase',
@@ -25,6 +25,8 @@
     ],
     'data': [
         'security/ir.model.access.csv',
+        'data/stock_lot_cron.xml',
+        'data/stock_picking_cron.xml',
         'views/asset_category_views.xml',
         'views/product_views.xml',
         'views/purchase_views.xml',
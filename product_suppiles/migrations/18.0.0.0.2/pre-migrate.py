@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+"""
+Resuelve los seriales asociados a más de una línea de stock_lot_supply_line antes
+de que init() cree el índice único de related_lot_id: se conserva la línea más
+antigua de cada serial y las demás quedan sin serial asociado.
+"""
+import logging
+
+from odoo.addons.product_suppiles.models.stock_lot_supply_line import _clear_duplicate_related_lots
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    cleared = _clear_duplicate_related_lots(cr)
+    _logger.info("product_suppiles: %s asociaciones de serial repetidas resueltas", cleared)
@@ -1,7 +1,25 @@
 # -*- coding: utf-8 -*-
-from odoo import api, fields, models, _
+from odoo import api, fields, models, tools, _
 from odoo.exceptions import ValidationError
 
+# Origen de cada tipo de elemento en la tabla de expansión:
+# item_type -> (modelo de línea, campo producto, campo cantidad, campo unidad)
+EXPANSION_SOURCES = {
+    "component": ("product.composite.line", "component_product_id", "component_qty", "component_uom_id"),
+    "peripheral": ("product.peripheral.line", "peripheral_product_id", "peripheral_qty", "peripheral_uom_id"),
+    "complement": ("product.complement.line", "complement_product_id", "complement_qty", "complement_uom_id"),
+}
+
+# Secuencia de versiones de la tabla de expansión (clave de la caché de explosión)
+EXPANSION_VERSION_SEQUENCE = "product_template_expansion_version_seq"
+
+# Bandera de la plantilla que habilita cada tipo de elemento en la explosión
+EXPLOSION_FLAGS = {
+    "component": "is_composite",
+    "peripheral": "use_peripherals",
+    "complement": "use_complements",
+}
+
 class ProductTemplate(models.Model):
     _inherit = "product.template"
 
@@ -140,6 +158,14 @@ class ProductTemplate(models.Model):
         store=False,
         help="Trigger técnico para aplicar defaults según el tipo de producto."
     )
+    expansion_version = fields.Integer(
+        string="Versión de expansión",
+        default=0,
+        copy=False,
+        readonly=True,
+        help="Contador técnico: sube cada vez que cambia la tabla de expansión; forma parte "
+             "de la clave de la caché de explosión.",
+    )
 
     @api.depends("type")
     def _compute_ui_apply_defaults(self):
@@ -228,50 +254,150 @@ class ProductTemplate(models.Model):
         # Esta validación se mantiene por compatibilidad pero la lógica real está en _validate_composite_lines
         pass
 
+    @api.model
+    def _get_explosion_rows(self, tmpl_id):
+        """Tabla de explosión en caché de una plantilla, desde la tabla de expansión.
+
+        Devuelve ((item_type, product_id, cantidad por 1 unidad, uom_id), ...) con la unidad
+        ya normalizada (la de la línea o, si no tiene, la del elemento). La clave de la caché
+        incluye expansion_version, que _refresh_expansion_lines incrementa cuando cambian
+        las líneas: las entradas viejas simplemente dejan de coincidir.
+        """
+        return self._get_cached_explosion_rows(tmpl_id, self.browse(tmpl_id).expansion_version)
+
+    @api.model
+    @tools.ormcache("tmpl_id", "version")
+    def _get_cached_explosion_rows(self, tmpl_id, version):
+        rows = self.browse(tmpl_id)._get_expansion_map()[tmpl_id]
+        return tuple(
+            (row["item_type"], row["product_id"], row["quantity"], row["uom_id"])
+            for row in rows
+        )
+
+    def _explode_many(self, requests, item_types=("component", "peripheral", "complement")):
+        """Explotar varios (plantilla, cantidad, uom) de una sola vez.
+
+        :param requests: lista de tuplas (product.template, cantidad, uom o None)
+        :param item_types: tipos a explotar, en el orden en que se devuelven
+        :return: lista alineada con ``requests``; cada elemento es
+            [(item_type, {"product", "qty", "uom"}), ...]
+        Cada plantilla se lee una sola vez (de la caché) aunque aparezca en muchas tuplas,
+        y productos y unidades se cargan en bloque.
+        """
+        tables = {
+            tmpl._origin.id: self._get_explosion_rows(tmpl._origin.id)
+            for tmpl in {tmpl for tmpl, _qty, _uom in requests if tmpl._origin}
+        }
+        product_ids = {row[1] for rows in tables.values() for row in rows}
+        uom_ids = {row[3] for rows in tables.values() for row in rows if row[3]}
+        products = {product.id: product for product in self.env["product.product"].browse(product_ids)}
+        uoms = {uom.id: uom for uom in self.env["uom.uom"].browse(uom_ids)}
+
+        results = []
+        for tmpl, qty, uom in requests:
+            exploded = []
+            results.append(exploded)
+            if not tmpl:
+                continue
+            qty_in_base = qty
+            if uom and uom != tmpl.uom_id:
+                qty_in_base = uom._compute_quantity(qty, tmpl.uom_id, rounding_method="HALF-UP")
+            rows = tables.get(tmpl._origin.id, ())
+            for item_type in item_types:
+                if not tmpl[EXPLOSION_FLAGS[item_type]]:
+                    continue
+                for row_type, product_id, line_qty, uom_id in rows:
+                    if row_type != item_type:
+                        continue
+                    product = products[product_id]
+                    item_uom = uoms[uom_id] if uom_id else product.uom_id
+                    item_qty = tmpl.uom_id._compute_quantity(line_qty * qty_in_base, item_uom, rounding_method="HALF-UP")
+                    exploded.append((item_type, {"product": product, "qty": item_qty, "uom": item_uom}))
+        return results
+
     def _explode_components(self, qty, uom=None):
         self.ensure_one()
-        if not self.is_composite:
-            return []
-        qty_in_base = qty
-        if uom and uom != self.uom_id:
-            qty_in_base = uom._compute_quantity(qty, self.uom_id, rounding_method="HALF-UP")
-        result = []
-        for line in self.composite_line_ids:
-            comp_uom = line.component_uom_id or line.component_product_id.uom_id
-            comp_qty_base = line.component_qty * qty_in_base
-            comp_qty = self.uom_id._compute_quantity(comp_qty_base, comp_uom, rounding_method="HALF-UP")
-            result.append({"product": line.component_product_id, "qty": comp_qty, "uom": comp_uom})
-        return result
+        return [item for _kind, item in self._explode_many([(self, qty, uom)], ("component",))[0]]
 
     def _explode_peripherals(self, qty, uom=None):
         self.ensure_one()
-        if not self.use_peripherals:
-            return []
-        qty_in_base = qty
-        if uom and uom != self.uom_id:
-            qty_in_base = uom._compute_quantity(qty, self.uom_id, rounding_method="HALF-UP")
-        result = []
-        for line in self.peripheral_line_ids:
-            per_uom = line.peripheral_uom_id or line.peripheral_product_id.uom_id
-            per_qty_base = line.peripheral_qty * qty_in_base
-            per_qty = self.uom_id._compute_quantity(per_qty_base, per_uom, rounding_method="HALF-UP")
-            result.append({"product": line.peripheral_product_id, "qty": per_qty, "uom": per_uom})
-        return result
+        return [item for _kind, item in self._explode_many([(self, qty, uom)], ("peripheral",))[0]]
 
     def _explode_complements(self, qty, uom=None):
         self.ensure_one()
-        if not (self.use_complements or getattr(self, "use_complements", False)):
-            return []
-        qty_in_base = qty
-        if uom and uom != self.uom_id:
-            qty_in_base = uom._compute_quantity(qty, self.uom_id, rounding_method="HALF-UP")
-        result = []
-        for line in self.complement_line_ids:
-            com_uom = line.complement_uom_id or line.complement_product_id.uom_id
-            com_qty_base = line.complement_qty * qty_in_base
-            com_qty = self.uom_id._compute_quantity(com_qty_base, com_uom, rounding_method="HALF-UP")
-            result.append({"product": line.complement_product_id, "qty": com_qty, "uom": com_uom})
+        return [item for _kind, item in self._explode_many([(self, qty, uom)], ("complement",))[0]]
+
+    def _refresh_expansion_lines(self):
+        """Sincronizar la tabla de expansión con las líneas de componentes, periféricos y complementos.
+
+        Solo se crean, modifican o eliminan las filas que realmente cambiaron.
+        """
+        templates = self.filtered("id")
+        if not templates:
+            return
+        Expansion = self.env["product.template.expansion.line"].sudo()
+        desired = {}
+        for item_type, (model, product_field, qty_field, uom_field) in EXPANSION_SOURCES.items():
+            for line in self.env[model].sudo().search([("parent_product_tmpl_id", "in", templates.ids)]):
+                desired[(item_type, line.id)] = {
+                    "product_tmpl_id": line.parent_product_tmpl_id.id,
+                    "item_type": item_type,
+                    "source_line_id": line.id,
+                    "sequence": line.sequence,
+                    "product_id": line[product_field].id,
+                    "quantity": line[qty_field],
+                    "uom_id": line[uom_field].id or line[product_field].uom_id.id,
+                }
+
+        to_unlink = Expansion
+        changed_tmpl_ids = set()
+        for row in Expansion.search([("product_tmpl_id", "in", templates.ids)]):
+            vals = desired.pop((row.item_type, row.source_line_id), None)
+            if vals is None:
+                to_unlink |= row
+                changed_tmpl_ids.add(row.product_tmpl_id.id)
+                continue
+            changes = {
+                key: value for key, value in vals.items()
+                if (row[key].id if key in ("product_tmpl_id", "product_id", "uom_id") else row[key]) != value
+            }
+            if changes:
+                changed_tmpl_ids.update((row.product_tmpl_id.id, vals["product_tmpl_id"]))
+                row.write(changes)
+        if to_unlink:
+            to_unlink.unlink()
+        if desired:
+            changed_tmpl_ids.update(vals["product_tmpl_id"] for vals in desired.values())
+            Expansion.create(list(desired.values()))
+        if changed_tmpl_ids:
+            # Nueva versión de la tabla de explosión en caché (_get_explosion_rows) solo de
+            # las plantillas que cambiaron, sin limpiar las demás cachés del registro
+            # (la secuencia no repite valores aunque la transacción se revierta)
+            self.env.cr.execute(f"""
+                UPDATE product_template
+                   SET expansion_version = nextval('{EXPANSION_VERSION_SEQUENCE}')
+                 WHERE id = ANY(%s)
+            """, (sorted(changed_tmpl_ids),))
+            self.browse(changed_tmpl_ids).invalidate_recordset(["expansion_version"])
+
+    def _get_expansion_map(self):
+        """Devolver {template_id: [filas de expansión]} leyendo la tabla en una sola consulta."""
+        result = {tmpl_id: [] for tmpl_id in self.ids}
+        if not self.ids:
+            return result
+        rows = self.env["product.template.expansion.line"].sudo().search_read(
+            [("product_tmpl_id", "in", self.ids)],
+            ["product_tmpl_id", "item_type", "product_id", "quantity", "uom_id"],
+        )
+        for row in rows:
+            result[row["product_tmpl_id"][0]].append({
+                "item_type": row["item_type"],
+                "product_id": row["product_id"][0],
+                "quantity": row["quantity"],
+                "uom_id": row["uom_id"] and row["uom_id"][0] or False,
+            })
         return result
+
     @api.onchange("asset_category_id")
     def _onchange_asset_category_id_reset_class(self):
         for rec in self:
@@ -299,6 +425,24 @@ class ProductCompositeLine(models.Model):
             if line.component_product_id and not line.component_uom_id:
                 line.component_uom_id = line.component_product_id.uom_id
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super().create(vals_list)
+        lines.parent_product_tmpl_id._refresh_expansion_lines()
+        return lines
+
+    def write(self, vals):
+        templates = self.parent_product_tmpl_id
+        res = super().write(vals)
+        (templates | self.parent_product_tmpl_id)._refresh_expansion_lines()
+        return res
+
+    def unlink(self):
+        templates = self.parent_product_tmpl_id
+        res = super().unlink()
+        templates.exists()._refresh_expansion_lines()
+        return res
+
 
 class ProductPeripheralLine(models.Model):
     _name = "product.peripheral.line"
@@ -321,6 +465,24 @@ class ProductPeripheralLine(models.Model):
             if line.peripheral_product_id and not line.peripheral_uom_id:
                 line.peripheral_uom_id = line.peripheral_product_id.uom_id
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super().create(vals_list)
+        lines.parent_product_tmpl_id._refresh_expansion_lines()
+        return lines
+
+    def write(self, vals):
+        templates = self.parent_product_tmpl_id
+        res = super().write(vals)
+        (templates | self.parent_product_tmpl_id)._refresh_expansion_lines()
+        return res
+
+    def unlink(self):
+        templates = self.parent_product_tmpl_id
+        res = super().unlink()
+        templates.exists()._refresh_expansion_lines()
+        return res
+
 
 class ProductComplementLine(models.Model):
     _name = "product.complement.line"
@@ -343,6 +505,71 @@ class ProductComplementLine(models.Model):
             if line.complement_product_id and not line.complement_uom_id:
                 line.complement_uom_id = line.complement_product_id.uom_id
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super().create(vals_list)
+        lines.parent_product_tmpl_id._refresh_expansion_lines()
+        return lines
+
+    def write(self, vals):
+        templates = self.parent_product_tmpl_id
+        res = super().write(vals)
+        (templates | self.parent_product_tmpl_id)._refresh_expansion_lines()
+        return res
+
+    def unlink(self):
+        templates = self.parent_product_tmpl_id
+        res = super().unlink()
+        templates.exists()._refresh_expansion_lines()
+        return res
+
+
+class ProductTemplateExpansionLine(models.Model):
+    """Expansión precalculada (tipo lista de materiales) de una plantilla.
+
+    Una fila por cada componente, periférico o complemento, con la cantidad por
+    1 unidad del producto padre. Se mantiene desde las líneas de la plantilla.
+    """
+    _name = "product.template.expansion.line"
+    _description = "Expansión de componentes/periféricos/complementos por plantilla"
+    _order = "product_tmpl_id, item_type, sequence, id"
+
+    product_tmpl_id = fields.Many2one("product.template", string="Producto", required=True, ondelete="cascade", index=True)
+    item_type = fields.Selection([
+        ("component", "Componente"),
+        ("peripheral", "Periférico"),
+        ("complement", "Complemento"),
+    ], string="Tipo", required=True)
+    source_line_id = fields.Integer(string="Línea origen", required=True)
+    sequence = fields.Integer(default=10)
+    product_id = fields.Many2one("product.product", string="Elemento", required=True, ondelete="cascade")
+    quantity = fields.Float(string="Cantidad (por 1 producto)", digits="Product Unit of Measure")
+    uom_id = fields.Many2one("uom.uom", string="Unidad")
+
+    _sql_constraints = [
+        ("source_unique", "unique(item_type, source_line_id)", "Cada línea origen solo puede expandirse una vez."),
+    ]
+
+    def init(self):
+        """Crear la secuencia de versiones y poblar la tabla desde las líneas existentes si aún está vacía."""
+        self.env.cr.execute(f"CREATE SEQUENCE IF NOT EXISTS {EXPANSION_VERSION_SEQUENCE}")
+        self.env.cr.execute("SELECT 1 FROM product_template_expansion_line LIMIT 1")
+        if self.env.cr.fetchone():
+            return
+        for item_type, (model, product_field, qty_field, uom_field) in EXPANSION_SOURCES.items():
+            table = self.env[model]._table
+            self.env.cr.execute(f"""
+                INSERT INTO product_template_expansion_line
+                    (product_tmpl_id, item_type, source_line_id, sequence, product_id, quantity, uom_id,
+                     create_uid, create_date, write_uid, write_date)
+                SELECT l.parent_product_tmpl_id, %s, l.id, l.sequence, l.{product_field}, l.{qty_field},
+                       COALESCE(l.{uom_field}, pt.uom_id),
+                       1, now() at time zone 'UTC', 1, now() at time zone 'UTC'
+                  FROM {table} l
+                  JOIN product_product pp ON pp.id = l.{product_field}
+                  JOIN product_template pt ON pt.id = pp.product_tmpl_id
+            """, (item_type,))
+
 
 class ProductProduct(models.Model):
     _inherit = "product.product"
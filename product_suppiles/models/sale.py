@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError
+import logging
+
+_logger = logging.getLogger(__name__)
 
 class SaleOrder(models.Model):
     _inherit = "sale.order"
@@ -19,46 +22,81 @@ class SaleOrder(models.Model):
         return res
 
 
+    def _get_renting_target(self, renting_line):
+        """Plantilla y variante objetivo de una línea de renting (completa renting_applies_to_tmpl_id si falta)."""
+        dst_tmpl = renting_line.renting_applies_to_tmpl_id
+        if not dst_tmpl:
+            renting_obj = renting_line.order_id.renting_line_ids.filtered(lambda r: r.line_type == "objective")
+            if renting_obj and renting_obj[0].product_id:
+                dst_tmpl = renting_obj[0].product_id.product_tmpl_id
+                if dst_tmpl:
+                    renting_line.write({"renting_applies_to_tmpl_id": dst_tmpl.id})
+
+        if not dst_tmpl or not dst_tmpl.exists():
+            raise UserError(_("Debes seleccionar el producto objetivo para el renting (línea: %s).") % renting_line.name)
+        dst_prod = dst_tmpl.product_variant_id or self.env["product.product"].search(
+            [("product_tmpl_id", "=", dst_tmpl.id), ("sale_ok", "=", True)], limit=1
+        )
+        if not dst_prod:
+            raise UserError(_("El producto objetivo '%s' no tiene variante vendible.") % (dst_tmpl.display_name,))
+        if not dst_prod.uom_id:
+            raise UserError(_("El producto objetivo '%s' no tiene unidad de medida configurada.") % (dst_prod.display_name,))
+        return dst_tmpl, dst_prod
+
     def _create_renting_moves(self):
-        Picking = self.env["stock.picking"]
-        Move = self.env["stock.move"]
+        """Crear los pickings de salida de renting y sus movimientos (objetivo + explosión).
 
+        Los valores de todos los movimientos se arman en memoria: los pickings se crean con un
+        solo create, los movimientos padre con un create y los hijos (enlazados a su padre por
+        índice) con otro, y todos los pickings se confirman juntos.
+        """
+        plans = []
         for order in self:
-            # CORRECCIÓN: Validar que product_id y product_tmpl_id existen antes de acceder
             renting_parent_lines = order.order_line.filtered(
-                lambda l: l.product_id and l.product_id.exists() and 
-                         l.product_id.product_tmpl_id and 
-                         getattr(l.product_id.product_tmpl_id, "product_renting", False)
+                lambda l: l.product_id and getattr(l.product_id.product_tmpl_id, "product_renting", False)
             )
             if not renting_parent_lines:
                 continue
 
-            # CORRECCIÓN: Validar que warehouse_id existe antes de acceder
-            if not order.warehouse_id or not order.warehouse_id.exists():
+            if not order.warehouse_id:
                 raise UserError(_("La orden de venta no tiene almacén configurado."))
             picking_type = order.warehouse_id.out_type_id
             if not picking_type:
                 raise UserError(_("No se encontró el tipo de operación de salida del almacén."))
-
-            # CORRECCIÓN: Validar que partner_shipping_id existe antes de acceder
-            if not order.partner_shipping_id or not order.partner_shipping_id.exists():
+            if not order.partner_shipping_id:
                 raise UserError(_("La orden de venta no tiene dirección de envío configurada."))
-            
-            picking_vals = {
-                "partner_id": order.partner_shipping_id.id,
-                "picking_type_id": picking_type.id,
-                "location_id": picking_type.default_location_src_id.id if picking_type.default_location_src_id else False,
-                "location_dest_id": order.partner_shipping_id.property_stock_customer.id if order.partner_shipping_id.property_stock_customer else False,
-                "origin": order.name,
-                "sale_id": order.id,
-                "company_id": order.company_id.id if order.company_id else False,
-                "move_type": "direct",   
-            }
-            picking = Picking.create(picking_vals)
-
-            def _create_move(product, qty, uom, supply_kind="parent", name=None, sale_line=None):
-                vals = {
-                    "name": name or product.display_name,
+
+            targets = [(line,) + self._get_renting_target(line) for line in renting_parent_lines]
+            plans.append((order, picking_type, targets))
+        if not plans:
+            return
+
+        Picking = self.env["stock.picking"]
+        Move = self.env["stock.move"]
+        pickings = Picking.create([{
+            "partner_id": order.partner_shipping_id.id,
+            "picking_type_id": picking_type.id,
+            "location_id": picking_type.default_location_src_id.id,
+            "location_dest_id": order.partner_shipping_id.property_stock_customer.id,
+            "origin": order.name,
+            "sale_id": order.id,
+            "company_id": order.company_id.id,
+            "move_type": "direct",
+        } for order, picking_type, _targets in plans])
+
+        exploded = self.env["product.template"]._explode_many([
+            (dst_tmpl, 1.0, None)
+            for _order, _picking_type, targets in plans
+            for _line, dst_tmpl, _dst_prod in targets
+        ])
+        exploded = iter(exploded)
+
+        parent_vals = []
+        child_vals = []
+        for (order, _picking_type, targets), picking in zip(plans, pickings):
+            def _move_vals(product, qty, uom, supply_kind, name, sale_line):
+                return {
+                    "name": name,
                     "product_id": product.id,
                     "product_uom": uom.id,
                     "product_uom_qty": qty,
@@ -67,74 +105,38 @@ class SaleOrder(models.Model):
                     "location_dest_id": picking.location_dest_id.id,
                     "company_id": order.company_id.id,
                     "supply_kind": supply_kind,
+                    "sale_line_id": sale_line.id,
                 }
-                if sale_line:
-                    vals["sale_line_id"] = sale_line.id
-                return Move.create(vals)
-
-            for renting_line in renting_parent_lines:
-                dst_tmpl = renting_line.renting_applies_to_tmpl_id
-                if not dst_tmpl:
-                    # CORRECCIÓN: Validar que order_id existe antes de acceder
-                    if renting_line.order_id and renting_line.order_id.exists():
-                        renting_obj = renting_line.order_id.renting_line_ids.filtered(lambda r: r.line_type == "objective")
-                        if renting_obj and len(renting_obj) > 0:
-                            # CORRECCIÓN: Validar que product_id y product_tmpl_id existen
-                            if renting_obj[0].product_id and renting_obj[0].product_id.exists():
-                                dst_tmpl = renting_obj[0].product_id.product_tmpl_id
-                                if dst_tmpl and dst_tmpl.exists():
-                                    renting_line.write({"renting_applies_to_tmpl_id": dst_tmpl.id})
-
-                if not dst_tmpl or not dst_tmpl.exists():
-                    raise UserError(_("Debes seleccionar el producto objetivo para el renting (línea: %s).") % renting_line.name)
-                # CORRECCIÓN: Validar que product_variant_id existe antes de usar
-                dst_prod = False
-                if dst_tmpl.product_variant_id and dst_tmpl.product_variant_id.exists():
-                    dst_prod = dst_tmpl.product_variant_id
-                else:
-                    dst_prod = self.env["product.product"].search(
-                        [("product_tmpl_id", "=", dst_tmpl.id), ("sale_ok", "=", True)], limit=1
-                    )
-                if not dst_prod or not dst_prod.exists():
-                    raise UserError(_("El producto objetivo '%s' no tiene variante vendible.") % (dst_tmpl.display_name,))
 
+            for renting_line, _dst_tmpl, dst_prod in targets:
                 qty = renting_line.product_uom_qty or 1.0
-                # CORRECCIÓN: Validar que uom_id existe antes de acceder
-                uom = dst_prod.uom_id if dst_prod.uom_id and dst_prod.uom_id.exists() else False
-                if not uom:
-                    raise UserError(_("El producto objetivo '%s' no tiene unidad de medida configurada.") % (dst_prod.display_name,))
-                _create_move(
-                    product=dst_prod,
-                    qty=qty,
-                    uom=uom,
-                    supply_kind="parent",
-                    name="%s (Objetivo Renting de %s)" % (dst_prod.display_name, renting_line.product_id.display_name if renting_line.product_id else ""),
-                    sale_line=renting_line,  
-                )       
-
-                def _explode_one(exploded, kind):
-                    for item in (exploded or []):
-                        pr = item["product"]
-                        pr_uom = item["uom"]
-                        pr_qty = (item.get("qty") or 0.0) * qty
-                        if pr_uom != pr.uom_id:
-                            pr_qty = pr_uom._compute_quantity(pr_qty, pr.uom_id, rounding_method="HALF-UP")
-                            pr_uom = pr.uom_id
-                        _create_move(
-                            product=pr,
-                            qty=pr_qty,
-                            uom=pr_uom,
-                            supply_kind=kind,
-                            name="%s (%s de %s)" % (pr.display_name, kind, dst_prod.display_name),
-                            sale_line=renting_line,
-                        )
-
-                _explode_one(dst_tmpl._explode_components(1.0), "component")
-                _explode_one(dst_tmpl._explode_peripherals(1.0), "peripheral")
-                _explode_one(dst_tmpl._explode_complements(1.0), "complement")
-
-            picking.action_confirm()
-            # picking.action_assign()
+                parent_index = len(parent_vals)
+                parent_vals.append(_move_vals(
+                    dst_prod, qty, dst_prod.uom_id, "parent",
+                    "%s (Objetivo Renting de %s)" % (dst_prod.display_name, renting_line.product_id.display_name),
+                    renting_line,
+                ))
+                for kind, item in next(exploded):
+                    pr = item["product"]
+                    pr_uom = item["uom"]
+                    pr_qty = (item.get("qty") or 0.0) * qty
+                    if pr_uom != pr.uom_id:
+                        pr_qty = pr_uom._compute_quantity(pr_qty, pr.uom_id, rounding_method="HALF-UP")
+                        pr_uom = pr.uom_id
+                    child_vals.append((parent_index, _move_vals(
+                        pr, pr_qty, pr_uom, kind,
+                        "%s (%s de %s)" % (pr.display_name, kind, dst_prod.display_name),
+                        renting_line,
+                    )))
+
+        parent_moves = Move.create(parent_vals)
+        if child_vals:
+            Move.create([
+                dict(vals, internal_parent_move_id=parent_moves[parent_index].id)
+                for parent_index, vals in child_vals
+            ])
+
+        pickings.action_confirm()
 
     def _explode_components_in_pickings(self):
         """
@@ -142,55 +144,31 @@ class SaleOrder(models.Model):
         Los elementos asociados se moverán automáticamente cuando se valide el picking
         a través del método _move_associated_lots_with_principal en stock_move_line.py.
         Esto evita errores de seriales duplicados y mantiene la consistencia con el disparador de rutas.
+        Una búsqueda de pickings y una escritura para todas las órdenes.
         """
         try:
-            for order in self:
-                # Buscar todos los pickings creados desde esta orden de venta
-                pickings = self.env["stock.picking"].search([
-                    ("sale_id", "=", order.id),
-                    ("state", "in", ("draft", "waiting", "confirmed", "assigned")),
-                ])
-                
-                if not pickings:
-                    continue
-                
-                for picking in pickings:
-                    try:
-                        # Buscar movimientos padre (productos principales) que no sean de renting
-                        # Los movimientos de renting ya fueron procesados en _create_renting_moves
-                        # CORRECCIÓN: Validar que sale_line_id, product_id y product_tmpl_id existen antes de acceder
-                        parent_moves = picking.move_ids_without_package.filtered(
-                            lambda m: m.sale_line_id and m.sale_line_id.exists()
-                            and m.sale_line_id.product_id and m.sale_line_id.product_id.exists()
-                            and m.sale_line_id.product_id.product_tmpl_id
-                            and not getattr(m.sale_line_id.product_id.product_tmpl_id, "product_renting", False)
-                            and m.product_id and m.product_id.exists()
-                            and m.product_id.product_tmpl_id
-                            and (
-                                getattr(m.product_id.product_tmpl_id, "is_composite", False)
-                                or getattr(m.product_id.product_tmpl_id, "use_peripherals", False)
-                                or getattr(m.product_id.product_tmpl_id, "use_complements", False)
-                            )
-                            and m.state in ("draft", "confirmed", "waiting", "assigned")
-                            and (not hasattr(m, 'supply_kind') or not m.supply_kind or m.supply_kind == "parent")
-                        )
-                        
-                        if not parent_moves:
-                            continue
-                        
-                        # CORRECCIÓN CRÍTICA: Solo marcar los movimientos padre como "parent"
-                        # NO crear movimientos para elementos asociados porque:
-                        # 1. Se moverán automáticamente cuando se valide el picking
-                        # 2. Evita errores de seriales duplicados
-                        # 3. Mantiene consistencia con el disparador de rutas
-                        # 4. La última operación solo mostrará productos principales
-                        for parent_move in parent_moves:
-                            if hasattr(parent_move, 'supply_kind') and not parent_move.supply_kind:
-                                parent_move.write({"supply_kind": "parent"})
-                    except Exception:
-                        continue
-        except Exception:
-            pass
+            # Los movimientos de renting ya vienen marcados desde _create_renting_moves
+            pickings = self.env["stock.picking"].search([
+                ("sale_id", "in", self.ids),
+                ("state", "in", ("draft", "waiting", "confirmed", "assigned")),
+            ])
+            parent_moves = pickings.move_ids_without_package.filtered(
+                lambda m: not m.supply_kind
+                and m.state in ("draft", "confirmed", "waiting", "assigned")
+                and m.sale_line_id.product_id
+                and not getattr(m.sale_line_id.product_id.product_tmpl_id, "product_renting", False)
+                and (
+                    m.product_id.product_tmpl_id.is_composite
+                    or m.product_id.product_tmpl_id.use_peripherals
+                    or m.product_id.product_tmpl_id.use_complements
+                )
+            )
+            # NO crear movimientos para elementos asociados: se moverán al validar el picking,
+            # se evitan seriales duplicados y la última operación solo muestra productos principales
+            if parent_moves:
+                parent_moves.write({"supply_kind": "parent"})
+        except Exception as e:
+            _logger.warning("Error al marcar movimientos principales en pickings de venta: %s", str(e))
 
 
 class SaleOrderLine(models.Model):
@@ -271,7 +249,9 @@ class SaleOrderLine(models.Model):
         """
         Genera líneas logísticas (precio 0) del producto objetivo y su explosión
         de comp./perif./compl. Cantidad proporcional a la qty de la línea renting.
+        Todas las líneas se explotan con una sola llamada y se crean con un solo create.
         """
+        todo = []
         for line in self:
             if not line.product_id or not line.product_id.product_tmpl_id.product_renting:
                 continue
@@ -281,55 +261,43 @@ class SaleOrderLine(models.Model):
             if line.state not in ("draft", "sent"):
                 continue
 
-            line._unlink_previous_generated_lines()
-
-            order = line.order_id
             dst_tmpl = line.renting_applies_to_tmpl_id
-
             dst_product = dst_tmpl.product_variant_id if dst_tmpl.product_variant_id and dst_tmpl.product_variant_id.sale_ok else \
                 self.env["product.product"].search([("product_tmpl_id", "=", dst_tmpl.id), ("sale_ok", "=", True)], limit=1)
             if not dst_product:
                 raise UserError(_("El producto objetivo no tiene variantes vendibles."))
+            todo.append((line, dst_product))
+        if not todo:
+            return
 
-            qty = line.product_uom_qty
-            uom_order = dst_product.uom_id
+        self.browse([line.id for line, _dst in todo])._unlink_previous_generated_lines()
 
-            parent_vals = {
+        exploded_by_line = self.env["product.template"]._explode_many(
+            [(line.renting_applies_to_tmpl_id, 1.0, None) for line, _dst in todo]
+        )
+        vals_list = []
+        for (line, dst_product), exploded in zip(todo, exploded_by_line):
+            order = line.order_id
+            qty = line.product_uom_qty
+            vals_list.append({
                 "order_id": order.id,
                 "product_id": dst_product.id,
                 "name": "%s (Objetivo de Renting: %s)" % (dst_product.display_name, line.product_id.display_name),
                 "product_uom_qty": qty,
-                "product_uom": uom_order.id,
+                "product_uom": dst_product.uom_id.id,
                 "price_unit": 0.0,
                 "tax_id": [(6, 0, [])], 
                 "renting_parent_line_id": line.id,
                 "renting_is_generated": True,
-            }
-            self.env["sale.order.line"].create(parent_vals)
-
-            def _explode(lines, factor_qty):
-                out = []
-                for item in lines or []:
-                    pr = item["product"]
-                    pr_uom = item["uom"]
-                    pr_qty = (item["qty"] or 0.0) * factor_qty
-                    if pr_uom != pr.uom_id:
-                        pr_qty = pr_uom._compute_quantity(pr_qty, pr.uom_id, rounding_method="HALF-UP")
-                        pr_uom = pr.uom_id
-                    out.append((pr, pr_qty, pr_uom))
-                return out
-
-            exploded_components = dst_tmpl._explode_components(1.0) or []
-            exploded_peripherals = dst_tmpl._explode_peripherals(1.0) or []
-            exploded_complements = dst_tmpl._explode_complements(1.0) or []
-
-            all_items = []
-            all_items += _explode(exploded_components, qty)
-            all_items += _explode(exploded_peripherals, qty)
-            all_items += _explode(exploded_complements, qty)
-
-            for pr, pr_qty, pr_uom in all_items:
-                self.env["sale.order.line"].create({
+            })
+            for _kind, item in exploded:
+                pr = item["product"]
+                pr_uom = item["uom"]
+                pr_qty = (item["qty"] or 0.0) * qty
+                if pr_uom != pr.uom_id:
+                    pr_qty = pr_uom._compute_quantity(pr_qty, pr.uom_id, rounding_method="HALF-UP")
+                    pr_uom = pr.uom_id
+                vals_list.append({
                     "order_id": order.id,
                     "product_id": pr.id,
                     "name": "%s (Renting de %s → %s)" % (pr.display_name, line.product_id.display_name, dst_product.display_name),
@@ -340,6 +308,7 @@ class SaleOrderLine(models.Model):
                     "renting_parent_line_id": line.id,
                     "renting_is_generated": True,
                 })
+        self.env["sale.order.line"].create(vals_list)
 
     @api.onchange("renting_applies_to_tmpl_id", "product_uom_qty")
     def _onchange_regenerate_generated_lines(self):
@@ -351,10 +320,10 @@ class SaleOrderLine(models.Model):
 
     def write(self, vals):
         res = super().write(vals)
-        for line in self:
-            if line.state in ("draft", "sent") and line.product_id and line.product_id.product_tmpl_id.product_renting:
-                if any(k in vals for k in ("renting_applies_to_tmpl_id", "product_uom_qty")):
-                    line._create_generated_lines_for_renting()
+        if any(k in vals for k in ("renting_applies_to_tmpl_id", "product_uom_qty")):
+            self.filtered(
+                lambda l: l.state in ("draft", "sent") and l.product_id and l.product_id.product_tmpl_id.product_renting
+            )._create_generated_lines_for_renting()
         return res
 
     def unlink(self):
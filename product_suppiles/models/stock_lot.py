@@ -1,16 +1,29 @@
 # -*- coding: utf-8 -*-
 from odoo import api, fields, models, _
+from odoo.osv import expression
+from odoo.tools.sql import column_exists, create_column, table_exists
 import logging
 from dateutil.relativedelta import relativedelta
 
+from .product_template import EXPLOSION_FLAGS
+
 _logger = logging.getLogger(__name__)
 
 class StockLot(models.Model):
     _inherit = "stock.lot"
+    _rec_names_search = ["search_key"]
 
     model_name = fields.Char(string="Modelo")
-    inventory_plate = fields.Char(string="Placa de Inventario")
+    inventory_plate = fields.Char(string="Placa de Inventario", index="trigram")
     security_plate = fields.Char(string="Placa de Seguridad")
+    # Clave única de búsqueda (placa, serie, placa de seguridad, referencia interna y producto)
+    search_key = fields.Char(
+        string="Clave de búsqueda",
+        compute="_compute_search_key",
+        store=True,
+        index="trigram",
+        help="Texto indexado que usan la búsqueda de seriales y los autocompletados de todos los módulos."
+    )
     billing_code = fields.Char(string="Código de Facturación")
     entry_date = fields.Date(
         string="Fecha Activacion Renting",
@@ -227,15 +240,22 @@ class StockLot(models.Model):
         "stock.location",
         string="Ubicación actual",
         compute="_compute_current_location_id",
-        store=False,
-        help="Ubicación interna donde existe stock positivo de este lote/serie (primera encontrada)."
+        store=True,
+        index=True,
+        help="Ubicación interna donde existe stock positivo de este lote/serie (la de entrada más reciente)."
     )
     
+    # Líneas de suministro donde este lote figura como elemento (inverso de related_lot_id)
+    associated_supply_line_ids = fields.One2many(
+        "stock.lot.supply.line", "related_lot_id", string="Asociado en líneas de suministro"
+    )
+
     # Campos para mostrar información cuando este lote está asociado a otro producto principal
     is_associated_element = fields.Boolean(
         string="Es Elemento Asociado",
         compute="_compute_is_associated_element",
-        store=False,
+        store=True,
+        index=True,
         help="Indica si este serial está asociado como elemento (componente/periférico/complemento) a otro producto principal."
     )
     
@@ -243,15 +263,15 @@ class StockLot(models.Model):
         "stock.lot",
         string="Producto Principal",
         compute="_compute_is_associated_element",
-        store=False,
+        store=True,
+        index=True,
         help="Producto principal al que está asociado este elemento."
     )
     
     associated_to_principal_product_id = fields.Many2one(
         "product.product",
         string="Producto Principal (Producto)",
-        compute="_compute_is_associated_element",
-        store=False,
+        related="associated_to_principal_lot_id.product_id",
         help="Producto principal (producto) al que está asociado este elemento."
     )
     
@@ -259,125 +279,236 @@ class StockLot(models.Model):
         [("component", "Componente"), ("peripheral", "Periférico"), ("complement", "Complemento"), ("monitor", "Monitores"), ("ups", "UPS")],
         string="Tipo de Asociación",
         compute="_compute_is_associated_element",
-        store=False,
+        store=True,
         help="Tipo de elemento asociado (componente, periférico, complemento, monitores o UPS)."
     )
     
     associated_to_principal_inventory_plate = fields.Char(
         string="Placa de Inventario Principal",
-        compute="_compute_is_associated_element",
-        store=False,
+        related="associated_to_principal_lot_id.inventory_plate",
         help="Placa de inventario del producto principal al que está asociado este elemento."
     )
     
-    # Campo para detectar seriales con cantidad > 1
+    # Campo para detectar seriales con cantidad > 1 (índice parcial creado en init())
     has_excess_quantity = fields.Boolean(
         string="Cantidad > 1",
         compute="_compute_has_excess_quantity",
-        store=False,
-        search="_search_has_excess_quantity",
+        store=True,
         help="Indica si este serial tiene una cantidad a la mano mayor a 1 (debería ser siempre 1)"
     )
     
+    @api.depends("quant_ids.quantity", "quant_ids.location_id")
     def _compute_has_excess_quantity(self):
-        """Calcula si el serial tiene cantidad > 1."""
+        """Calcula si el serial tiene cantidad > 1 con un read_group para todo el lote de registros."""
+        qty_by_lot = {}
+        lot_ids = [lot.id for lot in self if lot.id]
+        if lot_ids:
+            groups = self.env["stock.quant"].sudo()._read_group(
+                [("lot_id", "in", lot_ids), ("location_id.usage", "in", ("internal", "transit"))],
+                ["lot_id"],
+                ["quantity:sum"],
+            )
+            qty_by_lot = {lot.id: quantity for lot, quantity in groups}
         for lot in self:
-            lot.has_excess_quantity = lot.product_qty > 1.0 if lot.product_qty else False
-    
+            lot.has_excess_quantity = (qty_by_lot.get(lot.id) or 0.0) > 1.0
+
+    def init(self):
+        super().init()
+        # Solo una fracción mínima de seriales tiene cantidad > 1: el filtro usa este índice parcial
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS stock_lot_has_excess_quantity_idx
+                ON stock_lot (product_id) WHERE has_excess_quantity
+        """)
+
     @api.model
-    def _search_has_excess_quantity(self, operator, value):
-        """Permite buscar seriales con cantidad > 1."""
-        try:
-            # Buscar todos los lotes con cantidad > 1 usando SQL directa para mejor performance
-            self.env.cr.execute("""
-                SELECT DISTINCT lot.id 
-                FROM stock_lot lot
-                INNER JOIN stock_quant quant ON quant.lot_id = lot.id
-                WHERE quant.quantity > 0
-                GROUP BY lot.id
+    def _reconcile_excess_quantity(self):
+        """Recalcular con SQL has_excess_quantity de todos los lotes; devuelve cuántos cambiaron."""
+        cr = self.env.cr
+        cr.execute("""
+            WITH excess AS (
+                SELECT quant.lot_id
+                  FROM stock_quant quant
+                  JOIN stock_location loc ON loc.id = quant.location_id
+                 WHERE quant.lot_id IS NOT NULL
+                   AND loc.usage IN ('internal', 'transit')
+              GROUP BY quant.lot_id
                 HAVING SUM(quant.quantity) > 1.0
-            """)
-            lot_ids = [row[0] for row in self.env.cr.fetchall()]
-            
-            # Si no hay resultados, retornar dominio que no coincida con nada
-            if not lot_ids:
-                lot_ids = [-1]  # ID que no existe
-            
-            # Manejar diferentes operadores
-            if operator == '=' and value:
-                # Buscar lotes con cantidad > 1
-                return [('id', 'in', lot_ids)]
-            elif operator == '=' and not value:
-                # Buscar lotes con cantidad <= 1 (todos menos los de lot_ids)
-                return [('id', 'not in', lot_ids if lot_ids != [-1] else [])]
-            elif operator == '!=' and value:
-                # Buscar lotes con cantidad <= 1
-                return [('id', 'not in', lot_ids if lot_ids != [-1] else [])]
-            elif operator == '!=' and not value:
-                # Buscar lotes con cantidad > 1
-                return [('id', 'in', lot_ids)]
-            else:
-                # Por defecto, retornar los lotes con cantidad > 1
-                return [('id', 'in', lot_ids)]
-        except Exception as e:
-            # En caso de error, retornar dominio vacío
-            _logger.warning("Error en _search_has_excess_quantity: %s", str(e))
-            return [('id', '=', False)]
+            )
+            UPDATE stock_lot lot
+               SET has_excess_quantity = (excess.lot_id IS NOT NULL)
+              FROM stock_lot target
+         LEFT JOIN excess ON excess.lot_id = target.id
+             WHERE target.id = lot.id
+               AND lot.has_excess_quantity IS DISTINCT FROM (excess.lot_id IS NOT NULL)
+        """)
+        changed = cr.rowcount
+        if changed:
+            _logger.info("Lotes: %s seriales con has_excess_quantity corregido", changed)
+            self.invalidate_model(["has_excess_quantity"])
+        return changed
 
+    @api.model
+    def _cron_reconcile_excess_quantity(self):
+        """Cron de conciliación del indicador de cantidad > 1 (corrige escrituras de quants por SQL)."""
+        self._reconcile_excess_quantity()
 
+    @api.depends("quant_ids.quantity", "quant_ids.location_id", "quant_ids.in_date")
     def _compute_current_location_id(self):
-        """Calcula la ubicación actual del lote, protegido contra errores durante instalación."""
-        Quant = self.env["stock.quant"]
+        """Ubicación interna con stock positivo más reciente, con una sola búsqueda de quants para el lote."""
+        location_by_lot = {}
+        lot_ids = [lot.id for lot in self if lot.id]
+        if lot_ids:
+            quants = self.env["stock.quant"].sudo().search_read([
+                ("lot_id", "in", lot_ids),
+                ("quantity", ">", 0),
+                ("location_id.usage", "=", "internal"),
+            ], ["lot_id", "location_id"], order="in_date desc, id desc")
+            for quant in quants:
+                location_by_lot.setdefault(quant["lot_id"][0], quant["location_id"][0])
         for lot in self:
-            lot.current_location_id = False
-            if not lot.id:
-                continue
-            # Proteger contra errores durante instalación/actualización
-            try:
-                # Buscamos una ubicación interna con stock positivo
-                quant = Quant.search([
-                    ("lot_id", "=", lot.id),
-                    ("quantity", ">", 0),
-                    ("location_id.usage", "=", "internal"),
-                ], order="in_date desc, id desc", limit=1)
-                lot.current_location_id = quant.location_id if quant else False
-            except Exception:
-                # Si hay error (por ejemplo, durante instalación), dejar en False
-                lot.current_location_id = False
+            lot.current_location_id = location_by_lot.get(lot.id, False)
     
+    @api.depends("associated_supply_line_ids.lot_id", "associated_supply_line_ids.item_type")
     def _compute_is_associated_element(self):
-        """Calcula si este lote está asociado como elemento a otro producto principal."""
+        """Calcula si este lote está asociado como elemento a otro producto principal.
+
+        Se usa la primera línea de suministro (por id) donde el lote figura como related_lot_id.
+        """
+        line_by_lot = {}
+        lot_ids = [lot.id for lot in self if lot.id]
+        if lot_ids:
+            supply_lines = self.env["stock.lot.supply.line"].sudo().search_read([
+                ("related_lot_id", "in", lot_ids),
+                ("lot_id", "!=", False),
+            ], ["related_lot_id", "lot_id", "item_type"], order="id")
+            for line in supply_lines:
+                line_by_lot.setdefault(line["related_lot_id"][0], line)
         for lot in self:
-            lot.is_associated_element = False
-            lot.associated_to_principal_lot_id = False
-            lot.associated_to_principal_product_id = False
-            lot.associated_item_type = False
-            lot.associated_to_principal_inventory_plate = False
-            
-            if not lot.id:
-                continue
-            
-            # Buscar si este lote está en alguna línea de suministro como related_lot_id
-            try:
-                # Verificar que el modelo existe antes de buscar
-                if 'stock.lot.supply.line' not in self.env:
-                    continue
-                
-                SupplyLine = self.env['stock.lot.supply.line']
-                supply_line = SupplyLine.search([
-                    ('related_lot_id', '=', lot.id)
-                ], limit=1)
-                
-                if supply_line and supply_line.lot_id and supply_line.lot_id.exists():
-                    principal_lot = supply_line.lot_id
-                    lot.is_associated_element = True
-                    lot.associated_to_principal_lot_id = principal_lot
-                    lot.associated_to_principal_product_id = principal_lot.product_id
-                    lot.associated_item_type = supply_line.item_type
-                    lot.associated_to_principal_inventory_plate = principal_lot.inventory_plate or ''
-            except Exception:
-                # Si hay error, dejar en False
-                pass
+            line = line_by_lot.get(lot.id)
+            lot.is_associated_element = bool(line)
+            lot.associated_to_principal_lot_id = line["lot_id"][0] if line else False
+            lot.associated_item_type = line["item_type"] if line else False
+
+    def _auto_init(self):
+        """Crear y rellenar por SQL las columnas almacenadas nuevas al instalar o actualizar.
+
+        Así el ORM no recalcula lote por lote todos los seriales existentes.
+        """
+        cr = self.env.cr
+        if not column_exists(cr, "stock_lot", "current_location_id"):
+            create_column(cr, "stock_lot", "current_location_id", "int4")
+            create_column(cr, "stock_lot", "is_associated_element", "bool")
+            create_column(cr, "stock_lot", "associated_to_principal_lot_id", "int4")
+            create_column(cr, "stock_lot", "associated_item_type", "varchar")
+            self._backfill_association_fields()
+        if not column_exists(cr, "stock_lot", "search_key"):
+            create_column(cr, "stock_lot", "search_key", "varchar")
+            self._backfill_search_key()
+        if not column_exists(cr, "stock_lot", "has_excess_quantity"):
+            create_column(cr, "stock_lot", "has_excess_quantity", "bool")
+            self._reconcile_excess_quantity()
+        return super()._auto_init()
+
+    @api.model
+    def _backfill_association_fields(self, lot_ids=None):
+        """Recalcular con SQL los campos almacenados de asociación y ubicación actual.
+
+        :param lot_ids: limitar a estos lotes (p. ej. los que tocó una escritura por SQL);
+            por defecto, todos los lotes
+        """
+        cr = self.env.cr
+        if lot_ids is not None and not lot_ids:
+            return
+        # Filtro opcional por lotes: "lot.id = ANY(...)" o siempre verdadero
+        scope = "lot.id = ANY(%(lot_ids)s)" if lot_ids is not None else "TRUE"
+        quant_scope = scope.replace("lot.id", "quant.lot_id")
+        related_scope = scope.replace("lot.id", "related_lot_id")
+        params = {"lot_ids": list(lot_ids or [])}
+        cr.execute(f"""
+            UPDATE stock_lot lot
+               SET current_location_id = q.location_id
+              FROM (
+                    SELECT DISTINCT ON (quant.lot_id) quant.lot_id, quant.location_id
+                      FROM stock_quant quant
+                      JOIN stock_location loc ON loc.id = quant.location_id
+                     WHERE quant.lot_id IS NOT NULL
+                       AND quant.quantity > 0
+                       AND loc.usage = 'internal'
+                       AND {quant_scope}
+                  ORDER BY quant.lot_id, quant.in_date DESC, quant.id DESC
+                   ) q
+             WHERE q.lot_id = lot.id
+               AND {scope}
+               AND lot.current_location_id IS DISTINCT FROM q.location_id
+        """, params)
+        located = cr.rowcount
+        cr.execute(f"""
+            UPDATE stock_lot lot
+               SET current_location_id = NULL
+             WHERE lot.current_location_id IS NOT NULL
+               AND {scope}
+               AND NOT EXISTS (
+                    SELECT 1
+                      FROM stock_quant quant
+                      JOIN stock_location loc ON loc.id = quant.location_id
+                     WHERE quant.lot_id = lot.id
+                       AND quant.quantity > 0
+                       AND loc.usage = 'internal'
+               )
+        """, params)
+        unlocated = cr.rowcount
+
+        associated = 0
+        if table_exists(cr, "stock_lot_supply_line"):
+            cr.execute(f"""
+                UPDATE stock_lot lot
+                   SET is_associated_element = TRUE,
+                       associated_to_principal_lot_id = sl.lot_id,
+                       associated_item_type = sl.item_type
+                  FROM (
+                        SELECT DISTINCT ON (related_lot_id) related_lot_id, lot_id, item_type
+                          FROM stock_lot_supply_line
+                         WHERE related_lot_id IS NOT NULL
+                           AND lot_id IS NOT NULL
+                           AND {related_scope}
+                      ORDER BY related_lot_id, id
+                       ) sl
+                 WHERE sl.related_lot_id = lot.id
+                   AND {scope}
+                   AND (lot.is_associated_element IS NOT TRUE
+                        OR lot.associated_to_principal_lot_id IS DISTINCT FROM sl.lot_id
+                        OR lot.associated_item_type IS DISTINCT FROM sl.item_type)
+            """, params)
+            associated = cr.rowcount
+            cr.execute(f"""
+                UPDATE stock_lot lot
+                   SET is_associated_element = FALSE,
+                       associated_to_principal_lot_id = NULL,
+                       associated_item_type = NULL
+                 WHERE (lot.is_associated_element OR lot.associated_to_principal_lot_id IS NOT NULL)
+                   AND {scope}
+                   AND NOT EXISTS (
+                        SELECT 1
+                          FROM stock_lot_supply_line sl
+                         WHERE sl.related_lot_id = lot.id
+                           AND sl.lot_id IS NOT NULL
+                   )
+            """, params)
+            associated += cr.rowcount
+        cr.execute(f"UPDATE stock_lot lot SET is_associated_element = FALSE WHERE is_associated_element IS NULL AND {scope}", params)
+
+        if located or unlocated or associated:
+            _logger.info(
+                "Lotes: %s ubicaciones actualizadas, %s sin ubicación interna, %s asociaciones corregidas",
+                located, unlocated, associated,
+            )
+        self.invalidate_model(["current_location_id", "is_associated_element",
+                               "associated_to_principal_lot_id", "associated_item_type"])
+
+    @api.model
+    def _cron_backfill_association_fields(self):
+        """Cron de conciliación: corrige desvíos de los campos almacenados (p. ej. escrituras por SQL)."""
+        self._backfill_association_fields()
 
     @api.depends("product_id", "product_id.product_tmpl_id",
                  "product_id.product_tmpl_id.composite_line_ids",
@@ -422,65 +553,143 @@ class StockLot(models.Model):
             result.append((lot.id, display_name))
         return result
 
+    @api.depends("inventory_plate", "name", "security_plate", "ref", "product_id.name")
+    def _compute_search_key(self):
+        """Concatenar los textos buscables del lote; el nombre del producto en todos los idiomas instalados."""
+        product_names = {}
+        products = self.product_id
+        for lang, _label in self.env["res.lang"].get_installed():
+            for product in products.with_context(lang=lang):
+                if product.name:
+                    product_names.setdefault(product.id, set()).add(product.name)
+        for lot in self:
+            parts = [lot.inventory_plate, lot.name, lot.security_plate, lot.ref]
+            parts += sorted(product_names.get(lot.product_id.id, ()))
+            lot.search_key = " | ".join(part for part in parts if part) or False
+
+    def _backfill_search_key(self):
+        """Rellenar search_key por SQL (columna nueva en una base existente)."""
+        cr = self.env.cr
+        # En instalación nueva las columnas propias del módulo aún no existen
+        columns = [
+            f"lot.{column}" for column in ("inventory_plate", "name", "security_plate", "ref")
+            if column_exists(cr, "stock_lot", column)
+        ]
+        cr.execute(f"""
+            UPDATE stock_lot lot
+               SET search_key = NULLIF(concat_ws(' | ', {", ".join(columns)}, (
+                        SELECT string_agg(DISTINCT names.value, ' | ' ORDER BY names.value)
+                          FROM jsonb_each_text(pt.name) AS names
+                   )), '')
+              FROM product_product pp
+              JOIN product_template pt ON pt.id = pp.product_tmpl_id
+             WHERE pp.id = lot.product_id
+        """)
+        _logger.info("Lotes: search_key calculada para %s seriales", cr.rowcount)
+
     @api.model
-    def _name_search(self, name='', args=None, operator='ilike', limit=100, order=None):
-        """Permite buscar por placa de inventario, número de serie o nombre del producto."""
-        args = args or []
-        domain = args[:]
-        if name:
-            # Buscar por placa de inventario (prioridad), número de serie o nombre del producto
-            search_domain = [
-                '|', '|',
-                ('inventory_plate', operator, name),
-                ('name', operator, name),
-                ('product_id.name', operator, name)
-            ]
-            domain = search_domain + domain
-        # Usar el método base con el dominio combinado
-        return super(StockLot, self)._name_search(name, args=domain, operator=operator, limit=limit, order=order)
+    def _name_search(self, name, domain=None, operator='ilike', limit=None, order=None):
+        """Búsqueda de seriales por la clave indexada, con ranking.
+
+        Primero las coincidencias exactas de placa de inventario o número de serie y después
+        el resto de coincidencias en search_key (placa, serie, placa de seguridad, referencia
+        interna y nombre del producto). Los demás módulos delegan en esta implementación.
+        """
+        term = (name or "").strip()
+        if not term or operator not in ("ilike", "like", "=ilike", "=like"):
+            return super()._name_search(name, domain, operator, limit=limit, order=order)
+        domain = list(domain or [])
+        exact_ids = list(self._search(
+            expression.AND([domain, ["|", ("inventory_plate", "=ilike", term), ("name", "=ilike", term)]]),
+            limit=limit, order=order,
+        ))
+        if limit and len(exact_ids) >= limit:
+            return exact_ids
+        other_ids = self._search(
+            expression.AND([domain, [("search_key", operator, term), ("id", "not in", exact_ids)]]),
+            limit=limit and limit - len(exact_ids), order=order,
+        )
+        return exact_ids + list(other_ids)
+
+    def _filter_lots_without_supply_lines(self):
+        """Lotes del recordset que aún no tienen líneas de suministro (una consulta anti-join)."""
+        if not self.ids:
+            return self.browse()
+        self.env["stock.lot.supply.line"].flush_model(["lot_id"])
+        self.env.cr.execute("""
+            SELECT lot.id
+              FROM stock_lot lot
+             WHERE lot.id IN %s
+               AND NOT EXISTS (
+                    SELECT 1 FROM stock_lot_supply_line sl WHERE sl.lot_id = lot.id
+               )
+        """, (tuple(self.ids),))
+        return self.browse([row[0] for row in self.env.cr.fetchall()])
 
     def action_initialize_supply_lines(self):
-            for lot in self:
-                if lot.lot_supply_line_ids:
-                    continue
-                tmpl = lot.product_id.product_tmpl_id
-                if not tmpl:
+        """Crear las líneas de componentes/periféricos/complementos desde la plantilla de cada lote.
+
+        Idempotente: los lotes que ya tienen líneas se omiten.
+        """
+        self._initialize_supply_lines()
+
+    def _initialize_supply_lines(self):
+        """Inicializar las líneas de los lotes que no tienen ninguna con un solo create.
+
+        Las líneas de todos los lotes salen de las tablas de explosión de las plantillas.
+        Devuelve el número de líneas creadas.
+        """
+        lots = self._filter_lots_without_supply_lines()
+        Template = self.env["product.template"]
+        vals_list = []
+        for lot in lots:
+            tmpl = lot.product_id.product_tmpl_id
+            if not tmpl:
+                continue
+            for item_type, product_id, quantity, uom_id in Template._get_explosion_rows(tmpl.id):
+                if not tmpl[EXPLOSION_FLAGS[item_type]]:
                     continue
+                vals_list.append({
+                    "lot_id": lot.id,
+                    "item_type": item_type,
+                    "product_id": product_id,
+                    "quantity": quantity,
+                    "uom_id": uom_id,
+                })
+        if vals_list:
+            self.env["stock.lot.supply.line"].create(vals_list)
+        return len(vals_list)
 
-                lines_to_create = []
-
-                if getattr(tmpl, "is_composite", False):
-                    for l in tmpl.composite_line_ids:
-                        lines_to_create.append({
-                            "lot_id": lot.id,
-                            "item_type": "component",
-                            "product_id": l.component_product_id.id,
-                            "quantity": l.component_qty,
-                            "uom_id": (l.component_uom_id or l.component_product_id.uom_id).id,
-                        })
-
-                if getattr(tmpl, "use_peripherals", False):
-                    for l in tmpl.peripheral_line_ids:
-                        lines_to_create.append({
-                            "lot_id": lot.id,
-                            "item_type": "peripheral",
-                            "product_id": l.peripheral_product_id.id,
-                            "quantity": l.peripheral_qty,
-                            "uom_id": (l.peripheral_uom_id or l.peripheral_product_id.uom_id).id,
-                        })
-
-                if getattr(tmpl, "use_complements", False):
-                    for l in tmpl.complement_line_ids:
-                        lines_to_create.append({
-                            "lot_id": lot.id,
-                            "item_type": "complement",
-                            "product_id": l.complement_product_id.id,
-                            "quantity": l.complement_qty,
-                            "uom_id": (l.complement_uom_id or l.complement_product_id.uom_id).id,
-                        })
-
-                if lines_to_create:
-                    self.env["stock.lot.supply.line"].create(lines_to_create)
+    @api.model
+    def _cron_initialize_supply_lines(self, limit=5000):
+        """Backfill: inicializar las líneas de los lotes principales que aún no las tienen."""
+        self.env["stock.lot.supply.line"].flush_model(["lot_id"])
+        self.env.cr.execute("""
+            SELECT lot.id
+              FROM stock_lot lot
+              JOIN product_product pp ON pp.id = lot.product_id
+              JOIN product_template pt ON pt.id = pp.product_tmpl_id
+             WHERE EXISTS (
+                    SELECT 1
+                      FROM product_template_expansion_line exp
+                     WHERE exp.product_tmpl_id = pt.id
+                       AND ((exp.item_type = 'component' AND pt.is_composite)
+                            OR (exp.item_type = 'peripheral' AND pt.use_peripherals)
+                            OR (exp.item_type = 'complement' AND pt.use_complements))
+               )
+               AND NOT EXISTS (
+                    SELECT 1 FROM stock_lot_supply_line sl WHERE sl.lot_id = lot.id
+               )
+          ORDER BY lot.id
+             LIMIT %s
+        """, (limit,))
+        lots = self.browse([row[0] for row in self.env.cr.fetchall()])
+        created = lots._initialize_supply_lines()
+        if created:
+            _logger.info("Lotes: %s líneas de suministro inicializadas en %s lotes principales", created, len(lots))
+        if len(lots) == limit:
+            # Quedan lotes pendientes: volver a ejecutar el cron
+            self.env.ref("product_suppiles.ir_cron_stock_lot_initialize_supply_lines")._trigger()
 
     def action_debug_view_info(self):
         """Método de debug para mostrar información de la vista y orden de campos."""
@@ -1,6 +1,38 @@
 # -*- coding: utf-8 -*-
 from odoo import api, fields, models, _
 from odoo.exceptions import ValidationError
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def _clear_duplicate_related_lots(cr):
+    """Dejar cada serial asociado a una sola línea (la más antigua); las demás quedan sin serial.
+
+    Lo usan init() y la migración 18.0.0.0.2 antes de crear el índice único de related_lot_id.
+    """
+    cr.execute("""
+        UPDATE stock_lot_supply_line sl
+           SET related_lot_id = NULL
+          FROM (
+                SELECT id, related_lot_id,
+                       row_number() OVER (PARTITION BY related_lot_id ORDER BY id) AS position
+                  FROM stock_lot_supply_line
+                 WHERE related_lot_id IS NOT NULL
+               ) dup
+         WHERE dup.id = sl.id
+           AND dup.position > 1
+     RETURNING sl.id, dup.related_lot_id
+    """)
+    cleared = cr.fetchall()
+    if cleared:
+        _logger.warning(
+            "stock_lot_supply_line: %s líneas con serial asociado repetido quedaron sin serial "
+            "(se conserva la línea más antigua de cada serial): %s",
+            len(cleared), cleared,
+        )
+    return len(cleared)
+
 
 class StockLotSupplyLine(models.Model):
     _name = "stock.lot.supply.line"
@@ -60,6 +92,7 @@ class StockLotSupplyLine(models.Model):
     related_lot_id = fields.Many2one(
         "stock.lot",
         string="Serial",
+        index=True,
         domain="[('id', 'in', available_related_lot_ids)]",
         help="Serie/Lote del componente; filtrado por producto, ubicación y excluyendo los ya usados.",
     )
@@ -103,6 +136,125 @@ class StockLotSupplyLine(models.Model):
             res["has_cost"] = bool(self.env.context["default_has_cost"])
         return res
 
+    def init(self):
+        """Índice único parcial sobre related_lot_id: un serial solo puede estar asociado una vez.
+
+        Los seriales repetidos que queden (p. ej. escritos por SQL) se resuelven antes
+        de crear el índice, de modo que la regla se aplica en todas las bases.
+        """
+        _clear_duplicate_related_lots(self.env.cr)
+        self.env.cr.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS stock_lot_supply_line_related_lot_uniq
+                ON stock_lot_supply_line (related_lot_id)
+             WHERE related_lot_id IS NOT NULL
+        """)
+
+    def _check_related_lots_available(self, related_lot_ids):
+        """Verificar que los seriales no estén asociados a otra línea (fuera de ``self``).
+
+        Se llama antes de escribir para dar un mensaje claro en lugar del error del
+        índice único. ``related_lot_ids`` puede repetir un serial si se asigna a varias
+        líneas a la vez, lo que también se rechaza.
+        """
+        related_lot_ids = [lot_id for lot_id in related_lot_ids if lot_id]
+        if not related_lot_ids:
+            return
+        Lot = self.env["stock.lot"].sudo()
+        repeated = {lot_id for lot_id in related_lot_ids if related_lot_ids.count(lot_id) > 1}
+        if repeated:
+            raise ValidationError(_(
+                "Un serial solo puede asociarse a un elemento. Se intentó asociar varias veces: %s"
+            ) % ", ".join(Lot.browse(sorted(repeated)).mapped("name")))
+
+        self.flush_model(["related_lot_id", "lot_id"])
+        self.env.cr.execute("""
+            SELECT related_lot_id, lot_id
+              FROM stock_lot_supply_line
+             WHERE related_lot_id = ANY(%s)
+               AND NOT (id = ANY(%s))
+        """, (related_lot_ids, list(self.ids)))
+        taken = self.env.cr.fetchall()
+        if taken:
+            raise ValidationError(_(
+                "Los siguientes seriales ya están asociados a otro producto principal:\n%s"
+            ) % "\n".join(
+                "- %s → %s" % (Lot.browse(related_id).name, Lot.browse(principal_id).name)
+                for related_id, principal_id in taken
+            ))
+
+    @api.model
+    def _get_free_serials(self, keys):
+        """Pool de seriales libres por (producto, ubicación).
+
+        Devuelve {(product_id, location_id): [lot_id, ...]} con los lotes que tienen
+        stock en esa ubicación exacta y que no están asociados a ninguna línea, en una
+        sola consulta (anti-join sobre el índice de related_lot_id).
+        """
+        keys = {key for key in keys if all(key)}
+        pool = {key: [] for key in keys}
+        if not keys:
+            return pool
+        self.env["stock.quant"].flush_model(["product_id", "location_id", "lot_id", "quantity"])
+        self.flush_model(["related_lot_id"])
+        self.env.cr.execute("""
+            SELECT q.product_id, q.location_id, q.lot_id
+              FROM stock_quant q
+             WHERE q.lot_id IS NOT NULL
+               AND q.quantity > 0
+               AND (q.product_id, q.location_id) IN %s
+               AND NOT EXISTS (
+                    SELECT 1 FROM stock_lot_supply_line s WHERE s.related_lot_id = q.lot_id
+               )
+             GROUP BY q.product_id, q.location_id, q.lot_id
+             ORDER BY q.lot_id
+        """, (tuple(keys),))
+        for product_id, location_id, lot_id in self.env.cr.fetchall():
+            pool[(product_id, location_id)].append(lot_id)
+        return pool
+
+    @api.model
+    def _get_associated_elements_map(self, principal_lot_ids):
+        """Elementos asociados por lote principal, cargados en bloque para listas de movimientos.
+
+        Devuelve {lot_id: {'component'|'peripheral'|'complement': [(nombre producto, serial), ...]}}
+        con una sola búsqueda de líneas; nombres de producto y seriales llegan en la misma lectura.
+        Monitores y UPS se agrupan como periféricos.
+        """
+        elements = {}
+        principal_lot_ids = [lot_id for lot_id in set(principal_lot_ids) if lot_id]
+        if not principal_lot_ids:
+            return elements
+        lines = self.sudo().search_read(
+            [("lot_id", "in", principal_lot_ids), ("related_lot_id", "!=", False)],
+            ["lot_id", "item_type", "product_id", "related_lot_id"],
+        )
+        for line in lines:
+            serial_name = line["related_lot_id"][1]
+            if not serial_name:
+                continue
+            kind = "peripheral" if line["item_type"] in ("monitor", "ups") else line["item_type"]
+            product_name = line["product_id"][1] if line["product_id"] else ""
+            by_kind = elements.setdefault(line["lot_id"][0], {})
+            by_kind.setdefault(kind, []).append((product_name, serial_name))
+        return elements
+
+    def _get_free_serial_key(self):
+        """Clave (producto, ubicación del serial padre) de la línea en el pool de seriales libres."""
+        self.ensure_one()
+        return (self.product_id.id, self.lot_id.location_id.id)
+
+    def _autofill_related_lots(self):
+        """Asignar un serial libre a las líneas sin serial, con una consulta para todo el lote."""
+        lines = self.filtered(lambda r: not r.related_lot_id and r.product_id and r.lot_id and r.lot_id.location_id)
+        if not lines:
+            return
+        pool = self._get_free_serials({line._get_free_serial_key() for line in lines})
+        for line in lines:
+            free_lots = pool.get(line._get_free_serial_key())
+            if free_lots:
+                # Cada serial se entrega una sola vez, también dentro del mismo lote
+                line.with_context(supply_line_skip_autofill=True).related_lot_id = free_lots.pop(0)
+
     @api.depends('item_type')
     def _compute_available_product_ids(self):
         """Calcular productos disponibles según el item_type seleccionado."""
@@ -226,52 +378,18 @@ class StockLotSupplyLine(models.Model):
     
     @api.onchange("product_id", "lot_id")
     def _onchange_filter_related_lot_by_location(self):
-        """Filtra lotes disponibles por ubicación, protegido contra errores de instalación."""
-        Quant = self.env["stock.quant"]
+        """Filtra lotes disponibles por ubicación usando el pool de seriales libres."""
         for r in self:
             domain = [("id", "=", 0)]
             r.related_lot_id = False
 
             # Proteger contra errores durante instalación
             try:
-                if not r.product_id or not r.lot_id:
-                    return {"domain": {"related_lot_id": domain}}
-                
-                # Verificar que location_id existe y es accesible
-                try:
-                    if not r.lot_id.location_id:
-                        return {"domain": {"related_lot_id": domain}}
-                except Exception:
+                if not r.product_id or not r.lot_id or not r.lot_id.location_id:
                     return {"domain": {"related_lot_id": domain}}
 
-                try:
-                    quants = Quant.search([
-                        ("product_id", "=", r.product_id.id),
-                        ("location_id", "=", r.lot_id.location_id.id),
-                        ("lot_id", "!=", False),
-                        ("quantity", ">", 0),
-                    ])
-                    lot_ids = set(quants.mapped("lot_id").ids)
-                except Exception:
-                    lot_ids = set()
-
-                try:
-                    used_ids_global = set(self.search([
-                        ("related_lot_id", "!=", False),
-                    ]).mapped("related_lot_id").ids)
-                except Exception:
-                    used_ids_global = set()
-
-                try:
-                    used_ids_same_parent = set(self.search([
-                        ("lot_id", "=", r.lot_id.id),
-                        ("related_lot_id", "!=", False),
-                    ]).mapped("related_lot_id").ids)
-                except Exception:
-                    used_ids_same_parent = set()
-
-                blocked = used_ids_global | used_ids_same_parent
-                available_ids = list(lot_ids - blocked)
+                key = r._get_free_serial_key()
+                available_ids = self._get_free_serials({key})[key]
 
                 if available_ids:
                     domain = [("id", "in", available_ids)]
@@ -286,93 +404,61 @@ class StockLotSupplyLine(models.Model):
 
 
 
-    @api.model
-    def create(self, vals):
+    @api.model_create_multi
+    def create(self, vals_list):
         ctx = self._context or {}
-        if not vals.get("lot_id") and ctx.get("default_lot_id"):
-            vals["lot_id"] = ctx["default_lot_id"]
-        if not vals.get("item_type") and ctx.get("default_item_type"):
-            vals["item_type"] = ctx["default_item_type"]
-        # Aplicar default_has_cost del contexto para que las líneas creadas desde cada pestaña conserven su tipo (también si la clave está en context aunque sea False)
-        if "has_cost" not in vals and "default_has_cost" in ctx:
-            vals["has_cost"] = bool(ctx["default_has_cost"])
-
-        # IMPORTANTE: Si no se especificó item_type, intentar obtenerlo de la clasificación del producto
-        if not vals.get("item_type") and vals.get("product_id"):
-            product = self.env['product.product'].browse(vals["product_id"])
-            if product.exists() and product.product_tmpl_id and hasattr(product.product_tmpl_id, 'classification'):
-                classification = product.product_tmpl_id.classification
-                if classification in ('component', 'peripheral', 'complement', 'monitor', 'ups'):
-                    vals["item_type"] = classification
-
-        rec = super().create(vals)
+        for vals in vals_list:
+            if not vals.get("lot_id") and ctx.get("default_lot_id"):
+                vals["lot_id"] = ctx["default_lot_id"]
+            if not vals.get("item_type") and ctx.get("default_item_type"):
+                vals["item_type"] = ctx["default_item_type"]
+            # Aplicar default_has_cost del contexto para que las líneas creadas desde cada pestaña conserven su tipo (también si la clave está en context aunque sea False)
+            if "has_cost" not in vals and "default_has_cost" in ctx:
+                vals["has_cost"] = bool(ctx["default_has_cost"])
+
+            # IMPORTANTE: Si no se especificó item_type, intentar obtenerlo de la clasificación del producto
+            if not vals.get("item_type") and vals.get("product_id"):
+                product = self.env['product.product'].browse(vals["product_id"])
+                if product.exists() and product.product_tmpl_id and hasattr(product.product_tmpl_id, 'classification'):
+                    classification = product.product_tmpl_id.classification
+                    if classification in ('component', 'peripheral', 'complement', 'monitor', 'ups'):
+                        vals["item_type"] = classification
+
+        self.browse()._check_related_lots_available([vals.get("related_lot_id") for vals in vals_list])
+        records = super().create(vals_list)
 
         # Fallback: si el contexto pedía has_cost=True y no se aplicó en vals, forzar tras crear (p. ej. cuando el inverse se ejecuta antes que el create)
-        if not rec.has_cost and ctx.get("default_has_cost"):
-            rec.has_cost = True
+        if ctx.get("default_has_cost"):
+            missing_cost = records.filtered(lambda r: not r.has_cost)
+            if missing_cost:
+                missing_cost.has_cost = True
 
         # Asignar automáticamente el usuario del serial padre al elemento asociado
         try:
-            if rec.related_lot_id and rec.lot_id:
-                # Obtener el usuario del serial padre
-                parent_user = rec.lot_id.related_partner_id
-                if parent_user:
-                    # Actualizar el usuario del elemento asociado
-                    rec.related_lot_id.related_partner_id = parent_user.id
+            for rec in records:
+                if rec.related_lot_id and rec.lot_id:
+                    # Obtener el usuario del serial padre
+                    parent_user = rec.lot_id.related_partner_id
+                    if parent_user:
+                        # Actualizar el usuario del elemento asociado
+                        rec.related_lot_id.related_partner_id = parent_user.id
         except Exception:
             # Si hay error (campo no existe, etc.), continuar sin asignar
             pass
 
         # Proteger contra errores durante instalación/actualización
         try:
-            if not rec.related_lot_id and rec.product_id and rec.lot_id:
-                # Verificar que location_id existe y es accesible
-                try:
-                    if not rec.lot_id.location_id:
-                        return rec
-                except Exception:
-                    return rec
-
-                Quant = self.env["stock.quant"]
-
-                try:
-                    quants = Quant.search([
-                        ("product_id", "=", rec.product_id.id),
-                        ("location_id", "=", rec.lot_id.location_id.id),
-                        ("lot_id", "!=", False),
-                        ("quantity", ">", 0),
-                    ])
-                    lot_ids = set(quants.mapped("lot_id").ids)
-                except Exception:
-                    lot_ids = set()
-
-                try:
-                    used_ids_global = set(self.search([
-                        ("related_lot_id", "!=", False),
-                    ]).mapped("related_lot_id").ids)
-                except Exception:
-                    used_ids_global = set()
-
-                try:
-                    used_ids_same_parent = set(self.search([
-                        ("lot_id", "=", rec.lot_id.id),
-                        ("related_lot_id", "!=", False),
-                    ]).mapped("related_lot_id").ids)
-                except Exception:
-                    used_ids_same_parent = set()
-
-                blocked = used_ids_global | used_ids_same_parent
-                available_ids = list(lot_ids - blocked)
-                if available_ids:
-                    rec.related_lot_id = available_ids[0]
+            records._autofill_related_lots()
         except Exception:
             # Si hay error durante instalación, continuar sin asignar related_lot_id
             pass
 
-        return rec
+        return records
 
 
     def write(self, vals):
+        if vals.get("related_lot_id"):
+            self._check_related_lots_available([vals["related_lot_id"]] * len(self))
         res = super().write(vals)
         
         # Asignar automáticamente el usuario del serial padre a los elementos asociados
@@ -391,56 +477,12 @@ class StockLotSupplyLine(models.Model):
             pass
         
         # Proteger contra errores durante instalación/actualización
-        try:
-            for rec in self:
-                need_autofill = (
-                    not rec.related_lot_id and
-                    rec.product_id and
-                    rec.lot_id
-                )
-                if need_autofill:
-                    # Verificar que location_id existe y es accesible
-                    try:
-                        if not rec.lot_id.location_id:
-                            continue
-                    except Exception:
-                        continue
-
-                    Quant = self.env["stock.quant"]
-
-                    try:
-                        quants = Quant.search([
-                            ("product_id", "=", rec.product_id.id),
-                            ("location_id", "=", rec.lot_id.location_id.id),
-                            ("lot_id", "!=", False),
-                            ("quantity", ">", 0),
-                        ])
-                        lot_ids = set(quants.mapped("lot_id").ids)
-                    except Exception:
-                        lot_ids = set()
-
-                    try:
-                        used_ids_global = set(self.search([
-                            ("related_lot_id", "!=", False),
-                        ]).mapped("related_lot_id").ids)
-                    except Exception:
-                        used_ids_global = set()
-
-                    try:
-                        used_ids_same_parent = set(self.search([
-                            ("lot_id", "=", rec.lot_id.id),
-                            ("related_lot_id", "!=", False),
-                        ]).mapped("related_lot_id").ids)
-                    except Exception:
-                        used_ids_same_parent = set()
-
-                    blocked = used_ids_global | used_ids_same_parent
-                    available_ids = list(lot_ids - blocked)
-                    if available_ids:
-                        rec.related_lot_id = available_ids[0]
-        except Exception:
-            # Si hay error durante instalación, continuar sin asignar related_lot_id
-            pass
+        if not self.env.context.get("supply_line_skip_autofill"):
+            try:
+                self._autofill_related_lots()
+            except Exception:
+                # Si hay error durante instalación, continuar sin asignar related_lot_id
+                pass
         return res
 
     @api.constrains("related_lot_id", "lot_id", "product_id")
@@ -454,53 +496,24 @@ class StockLotSupplyLine(models.Model):
 
     @api.depends("product_id", "lot_id")
     def _compute_available_related_lot_ids(self):
-        """Calcula los lotes disponibles para relacionar, evitando problemas durante instalación."""
-        Quant = self.env["stock.quant"]
-        SupplyLine = self.env["stock.lot.supply.line"]
+        """Calcula los lotes disponibles para relacionar con una sola consulta para todo el lote."""
+        keys = {
+            r._get_free_serial_key()
+            for r in self
+            if r.product_id and r.lot_id
+        }
 
         # Proteger contra errores durante instalación/actualización
         try:
-            used_global = set(SupplyLine.search([
-                ("related_lot_id", "!=", False),
-            ]).mapped("related_lot_id").ids)
+            pool = self._get_free_serials(keys)
         except Exception:
-            # Si hay error (por ejemplo, durante instalación), usar conjunto vacío
-            used_global = set()
+            pool = {}
 
         for r in self:
-            r.available_related_lot_ids = [(5, 0, 0)] 
+            r.available_related_lot_ids = [(5, 0, 0)]
             if not r.product_id or not r.lot_id:
                 continue
-            
-            # Verificar que location_id existe y es accesible
-            try:
-                if not r.lot_id.location_id:
-                    continue
-            except Exception:
-                continue
-
-            try:
-                quants = Quant.search([
-                    ("product_id", "=", r.product_id.id),
-                    ("location_id", "=", r.lot_id.location_id.id),
-                    ("lot_id", "!=", False),
-                    ("quantity", ">", 0),
-                ])
-                candidate_ids = set(quants.mapped("lot_id").ids)
-            except Exception:
-                candidate_ids = set()
-
-            try:
-                used_same_parent = set(SupplyLine.search([
-                    ("lot_id", "=", r.lot_id.id),
-                    ("related_lot_id", "!=", False),
-                ]).mapped("related_lot_id").ids)
-            except Exception:
-                used_same_parent = set()
-
-            blocked = used_global | used_same_parent
-
-            available = list(candidate_ids - blocked)
+            available = pool.get(r._get_free_serial_key())
             if available:
                 r.available_related_lot_ids = [(6, 0, available)]
     
@@ -170,71 +170,32 @@ class StockMove(models.Model):
                  'move_line_ids.lot_id.lot_supply_line_ids.related_lot_id.name',
                  'supply_kind')
     def _compute_associated_elements(self):
-        """Calcular elementos asociados agrupados por tipo para mostrar en columnas."""
+        """Calcular elementos asociados agrupados por tipo para mostrar en columnas.
+
+        Los lotes principales de todos los movimientos se cargan juntos con un solo mapa.
+        """
+        principal_lot_by_move = {}
         for move in self:
-            move.associated_components = ''
-            move.associated_peripherals = ''
-            move.associated_complements = ''
-            
-            # Solo procesar si es un movimiento principal
+            # Solo procesar si es un movimiento principal con línea principal (con lote)
             if move.supply_kind != 'parent':
                 continue
-            
-            # Buscar la línea principal (con lote y supply_kind = 'parent')
             principal_line = move.move_line_ids.filtered(
                 lambda ml: ml.lot_id and ml.supply_kind == 'parent'
             )
-            
-            if not principal_line or len(principal_line) == 0:
-                continue
-            
-            principal_lot = principal_line[0].lot_id
-            
-            if not principal_lot or not hasattr(principal_lot, 'lot_supply_line_ids'):
-                continue
-            
-            if not principal_lot.lot_supply_line_ids:
-                continue
-            
-            # Agrupar elementos asociados por tipo con nombre del producto y serial
-            components = []
-            peripherals = []
-            complements = []
-            
-            for supply_line in principal_lot.lot_supply_line_ids:
-                if not supply_line.related_lot_id:
-                    continue
-                
-                related_lot = supply_line.related_lot_id
-                serial_name = related_lot.name or ''
-                if not serial_name:
-                    continue
-                
-                # Obtener nombre del producto
-                product_name = ''
-                if supply_line.product_id:
-                    product_name = supply_line.product_id.display_name or supply_line.product_id.name or ''
-                
-                # Formato: "Nombre Producto - Serial"
-                if product_name:
-                    display_text = f"{product_name} - {serial_name}"
-                else:
-                    display_text = serial_name
-                
-                if supply_line.item_type == 'component':
-                    components.append(display_text)
-                elif supply_line.item_type == 'peripheral':
-                    peripherals.append(display_text)
-                elif supply_line.item_type == 'complement':
-                    complements.append(display_text)
-                elif supply_line.item_type in ('monitor', 'ups'):
-                    # Monitores y UPS se muestran como periféricos
-                    peripherals.append(display_text)
-            
-            # Unir los elementos con comas y saltos de línea para mejor visualización
-            move.associated_components = '\n'.join(components) if components else ''
-            move.associated_peripherals = '\n'.join(peripherals) if peripherals else ''
-            move.associated_complements = '\n'.join(complements) if complements else ''
+            if principal_line:
+                principal_lot_by_move[move] = principal_line[0].lot_id.id
+
+        elements = self.env['stock.lot.supply.line']._get_associated_elements_map(principal_lot_by_move.values())
+        for move in self:
+            by_kind = elements.get(principal_lot_by_move.get(move), {})
+            # Formato: "Nombre Producto - Serial", un elemento por línea
+            texts = {
+                kind: '\n'.join(f"{product} - {serial}" if product else serial for product, serial in items)
+                for kind, items in by_kind.items()
+            }
+            move.associated_components = texts.get('component', '')
+            move.associated_peripherals = texts.get('peripheral', '')
+            move.associated_complements = texts.get('complement', '')
 
     @api.depends(
         "purchase_line_id.product_id",
@@ -49,46 +49,20 @@ class StockMoveLine(models.Model):
     @api.depends('lot_id', 'lot_id.lot_supply_line_ids', 'lot_id.lot_supply_line_ids.related_lot_id', 
                  'lot_id.lot_supply_line_ids.item_type', 'lot_id.lot_supply_line_ids.related_lot_id.name')
     def _compute_associated_elements(self):
-        """Calcular elementos asociados agrupados por tipo para mostrar en columnas."""
+        """Calcular elementos asociados agrupados por tipo para mostrar en columnas.
+
+        Los lotes principales de todas las líneas se cargan juntos con un solo mapa.
+        """
+        # Solo procesar productos principales con lote
+        principal_lines = self.filtered(lambda l: l.lot_id and l.supply_kind == 'parent')
+        principal_line_ids = set(principal_lines.ids)
+        elements = self.env['stock.lot.supply.line']._get_associated_elements_map(principal_lines.lot_id.ids)
         for line in self:
-            line.associated_components = ''
-            line.associated_peripherals = ''
-            line.associated_complements = ''
-            
-            # Solo procesar si es un producto principal y tiene lote
-            if not line.lot_id or line.supply_kind != 'parent':
-                continue
-            
-            if not hasattr(line.lot_id, 'lot_supply_line_ids') or not line.lot_id.lot_supply_line_ids:
-                continue
-            
-            # Agrupar elementos asociados por tipo
-            components = []
-            peripherals = []
-            complements = []
-            
-            for supply_line in line.lot_id.lot_supply_line_ids:
-                if not supply_line.related_lot_id:
-                    continue
-                
-                serial_name = supply_line.related_lot_id.name or ''
-                if not serial_name:
-                    continue
-                
-                if supply_line.item_type == 'component':
-                    components.append(serial_name)
-                elif supply_line.item_type == 'peripheral':
-                    peripherals.append(serial_name)
-                elif supply_line.item_type == 'complement':
-                    complements.append(serial_name)
-                elif supply_line.item_type in ('monitor', 'ups'):
-                    # Monitores y UPS se muestran como periféricos
-                    peripherals.append(serial_name)
-            
+            by_kind = elements.get(line.lot_id.id, {}) if line.id in principal_line_ids else {}
             # Unir los números de serie con comas
-            line.associated_components = ', '.join(components) if components else ''
-            line.associated_peripherals = ', '.join(peripherals) if peripherals else ''
-            line.associated_complements = ', '.join(complements) if complements else ''
+            line.associated_components = ', '.join(serial for _product, serial in by_kind.get('component', []))
+            line.associated_peripherals = ', '.join(serial for _product, serial in by_kind.get('peripheral', []))
+            line.associated_complements = ', '.join(serial for _product, serial in by_kind.get('complement', []))
 
     @api.model_create_multi
     def create(self, vals_list):
@@ -675,9 +649,8 @@ class StockMoveLine(models.Model):
                     vals_pl["principal_product_id"] = principal_product.id
                 principal_lots.write(vals_pl)
 
-                for lot in principal_lots:
-                    if lot and lot.exists() and hasattr(lot, "lot_supply_line_ids") and not lot.lot_supply_line_ids:
-                        lot.action_initialize_supply_lines()
+                # Idempotente: solo inicializa los lotes que aún no tienen líneas
+                principal_lots._initialize_supply_lines()
 
             # CORRECCIÓN: Validar que lot_id existe antes de filtrar
             child_lines = lines.filtered(
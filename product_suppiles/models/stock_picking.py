@@ -5,6 +5,10 @@ import logging
 
 _logger = logging.getLogger(__name__)
 
+DEFER_CHAIN_CONFIRMATION_PARAM = 'product_suppiles.defer_chain_confirmation'
+# Intentos del cron antes de dejar de reintentar la confirmación diferida de un picking
+CHAIN_CONFIRMATION_MAX_ATTEMPTS = 5
+
 
 def _run_consolidation_loop(picking, max_iter=10):
     """Ejecuta consolidación en bucle hasta que no se elimine ninguna línea. Retorna total eliminado."""
@@ -19,6 +23,22 @@ def _run_consolidation_loop(picking, max_iter=10):
 class StockPicking(models.Model):
     _inherit = "stock.picking"
 
+    supplies_pending_confirmation = fields.Boolean(
+        string="Confirmación pendiente (cadena)",
+        copy=False,
+        index=True,
+        help="Picking destino de una validación cuya confirmación quedó diferida al cron.",
+    )
+    supplies_confirmation_attempts = fields.Integer(
+        string="Intentos de confirmación (cadena)",
+        copy=False,
+        help="Intentos fallidos del cron al confirmar este picking diferido.",
+    )
+    supplies_confirmation_error = fields.Char(
+        string="Último error de confirmación (cadena)",
+        copy=False,
+    )
+
     # Campo computed para mostrar solo líneas principales
     move_ids_main_only = fields.One2many(
         'stock.move',
@@ -129,36 +149,103 @@ class StockPicking(models.Model):
         except Exception as e:
             _logger.warning("Error al limpiar fechas Renting en entregas al cliente: %s", str(e))
         
-        # Después de validar, intentar confirmar pickings destino que estén en borrador
+        # Después de validar, confirmar en lote los pickings destino que estén en borrador
         try:
-            for picking in self:
-                if not picking or not picking.exists():
-                    continue
-                
-                # Buscar movimientos que tienen move_dest_ids (siguiente etapa en la cadena)
-                moves_with_dest = picking.move_ids.filtered(
-                    lambda m: m.move_dest_ids and m.state == 'done'
-                )
-                
-                if moves_with_dest:
-                    # Para cada movimiento destino, confirmar su picking si está en borrador
-                    for move in moves_with_dest:
-                        for dest_move in move.move_dest_ids:
-                            try:
-                                if dest_move.picking_id and dest_move.picking_id.exists():
-                                    dest_picking = dest_move.picking_id
-                                    if dest_picking.state == 'draft':
-                                        _logger.info("Confirmando automáticamente picking %s creado desde move_dest_ids", 
-                                                   dest_picking.name or dest_picking.id)
-                                        dest_picking.action_confirm()
-                            except Exception as e:
-                                _logger.warning("Error al confirmar picking destino: %s", str(e))
-                                continue
+            self._confirm_chained_destination_pickings()
         except Exception as e:
             _logger.warning("Error al procesar confirmación automática de pickings destino: %s", str(e))
         
         return res
 
+    def _get_draft_destination_pickings(self):
+        """Pickings en borrador de la siguiente etapa de la cadena (move_dest_ids), sin duplicados."""
+        done_moves = self.move_ids.filtered(lambda m: m.state == 'done' and m.move_dest_ids)
+        return done_moves.move_dest_ids.picking_id.filtered(lambda p: p.state == 'draft')
+
+    def _confirm_chained_destination_pickings(self):
+        """Confirmar los pickings destino con un solo action_confirm, o diferirlo al cron.
+
+        Con el parámetro ``product_suppiles.defer_chain_confirmation`` activo solo se marcan
+        los pickings y se dispara el cron, de modo que la validación retorna de inmediato.
+        """
+        dest_pickings = self._get_draft_destination_pickings()
+        if not dest_pickings:
+            return
+        defer = self.env['ir.config_parameter'].sudo().get_param(DEFER_CHAIN_CONFIRMATION_PARAM)
+        if defer and defer.lower() not in ('0', 'false'):
+            dest_pickings.sudo().write({
+                'supplies_pending_confirmation': True,
+                'supplies_confirmation_attempts': 0,
+                'supplies_confirmation_error': False,
+            })
+            cron = self.env.ref('product_suppiles.ir_cron_confirm_chained_pickings', raise_if_not_found=False)
+            if cron:
+                cron._trigger()
+            _logger.info("Confirmación diferida de %s picking(s) destino: %s", len(dest_pickings), dest_pickings.mapped('name'))
+            return
+        dest_pickings._confirm_pickings_batch()
+
+    def _confirm_pickings_batch(self):
+        """action_confirm en lote; si falla, reintentar picking por picking para aislar el error.
+
+        :return: {picking: mensaje de error} de los pickings que no se pudieron confirmar
+        """
+        _logger.info("Confirmando automáticamente %s picking(s) creados desde move_dest_ids: %s",
+                     len(self), self.mapped('name'))
+        try:
+            with self.env.cr.savepoint():
+                self.action_confirm()
+            return {}
+        except Exception as e:
+            _logger.warning("Error al confirmar pickings destino en lote, reintentando uno a uno: %s", str(e))
+        errors = {}
+        for picking in self:
+            try:
+                with self.env.cr.savepoint():
+                    picking.action_confirm()
+            except Exception as e:
+                _logger.warning("Error al confirmar picking destino %s: %s", picking.name or picking.id, str(e))
+                errors[picking] = str(e)
+        return errors
+
+    @api.model
+    def _cron_confirm_chained_pickings(self, limit=500):
+        """Confirmar los pickings destino marcados por validaciones en modo diferido.
+
+        Los pickings con menos intentos fallidos van primero, para que los que fallan
+        siempre no retrasen a los recién marcados. Tras CHAIN_CONFIRMATION_MAX_ATTEMPTS
+        fallos se deja de reintentar y se registra el error en el chatter del picking.
+        """
+        pickings = self.search(
+            [('supplies_pending_confirmation', '=', True)],
+            order='supplies_confirmation_attempts, id',
+            limit=limit,
+        )
+        if not pickings:
+            return
+        errors = pickings.filtered(lambda p: p.state == 'draft')._confirm_pickings_batch()
+        for picking in pickings.filtered(lambda p: p.state == 'draft' and p not in errors):
+            errors[picking] = _("El picking sigue en borrador después de confirmarlo.")
+        # Los que salieron de borrador ya no están pendientes
+        pickings.filtered(lambda p: p.state != 'draft').write({
+            'supplies_pending_confirmation': False,
+            'supplies_confirmation_attempts': 0,
+            'supplies_confirmation_error': False,
+        })
+        for picking, error in errors.items():
+            attempts = picking.supplies_confirmation_attempts + 1
+            vals = {'supplies_confirmation_attempts': attempts, 'supplies_confirmation_error': error[:500]}
+            if attempts >= CHAIN_CONFIRMATION_MAX_ATTEMPTS:
+                vals['supplies_pending_confirmation'] = False
+                _logger.error("Picking %s: se deja de reintentar la confirmación diferida tras %s intentos: %s",
+                              picking.name or picking.id, attempts, error)
+                picking.message_post(body=_(
+                    "No se pudo confirmar automáticamente este picking tras %(attempts)s intentos. "
+                    "Confírmelo manualmente. Último error: %(error)s",
+                    attempts=attempts, error=error,
+                ))
+            picking.write(vals)
+
     def _is_client_stock_location(self, location):
         """
         True si la ubicación es "stock del cliente": uso customer, o (sub)ubicación de un almacén con partner.
@@ -379,62 +466,45 @@ class StockPicking(models.Model):
             },
         }
 
+    def _prepare_supplies_purchase_history_vals(self):
+        """Valores de historial para los movimientos de componentes/periféricos/complementos recibidos.
+
+        Recorre los movimientos de todos los pickings de entrada como un único recordset, de modo
+        que el ORM precarga en bloque líneas de compra, órdenes y productos padre.
+        """
+        incoming = self.filtered(lambda p: p.picking_type_id.code == "incoming")
+        moves = incoming.move_ids_without_package.filtered(
+            lambda m: m.supply_kind in ("component", "peripheral", "complement")
+        )
+        vals_list = []
+        for move in moves:
+            po_line = move.purchase_line_id
+            parent_prod = move.supply_parent_product_id or po_line.product_id
+            po = po_line.order_id
+            # vendor/fecha/estado son campos relacionados de la orden de compra (obligatoria)
+            if not parent_prod or not po:
+                continue
+            vals_list.append({
+                "parent_product_tmpl_id": parent_prod.product_tmpl_id.id,
+                "item_type": move.supply_kind,
+                "product_id": move.product_id.id,
+                "quantity": move.quantity or move.product_uom_qty,
+                "uom_id": move.product_uom.id,
+                "purchase_id": po.id,
+                "purchase_line_id": po_line.id,
+            })
+        return vals_list
+
     def _log_supplies_purchase_history(self):
-        """Registra el historial de compras de componentes/periféricos/complementos."""
+        """Registra el historial de compras de componentes/periféricos/complementos con un solo create."""
         try:
-            History = self.env["supplies.item.history"]
-
-            # CORRECCIÓN: Validar que picking_type_id existe antes de acceder a code
-            for picking in self.filtered(lambda p: p.picking_type_id and p.picking_type_id.exists() and p.picking_type_id.code == "incoming"):
-                try:
-                    default_date = picking.date_done or fields.Datetime.now()
-                    partner = picking.partner_id
-
-                    for move in picking.move_ids_without_package:
-                        try:
-                            kind = move.supply_kind
-                            if kind not in ("component", "peripheral", "complement"):
-                                continue
-
-                            # CORRECCIÓN: Validar que purchase_line_id existe antes de acceder
-                            parent_prod = False
-                            if move.supply_parent_product_id and move.supply_parent_product_id.exists():
-                                parent_prod = move.supply_parent_product_id
-                            elif move.purchase_line_id and move.purchase_line_id.exists() and move.purchase_line_id.product_id:
-                                parent_prod = move.purchase_line_id.product_id
-                            parent_tmpl = parent_prod.product_tmpl_id if parent_prod and parent_prod.exists() else False
-
-                            # CORRECCIÓN: Validar que purchase_line_id y order_id existen antes de acceder
-                            po = False
-                            if move.purchase_line_id and move.purchase_line_id.exists():
-                                if move.purchase_line_id.order_id and move.purchase_line_id.order_id.exists():
-                                    po = move.purchase_line_id.order_id
-                            po_date = getattr(po, "date_order", False) if po else default_date
-                            vendor = getattr(po, "partner_id", False) if po else partner
-
-                            qty = move.quantity or move.product_uom_qty
-                            uom = move.product_uom
-                            if parent_tmpl:
-                                vals = {
-                                    "parent_product_tmpl_id": parent_tmpl.id if parent_tmpl else False,
-                                    "item_type": kind, 
-                                    "product_id": move.product_id.id,
-                                    "quantity": qty,
-                                    "uom_id": uom.id if uom else False,
-                                    "purchase_id": po.id if po else False,
-                                    "purchase_date": po_date,
-                                    "vendor_id": vendor.id if vendor else False,
-                                    "state": picking.state, 
-                                }
-                                History.create(vals)
-                        except Exception as e:
-                            _logger.warning("Error al registrar historial para move %s: %s", move.id if move else 'N/A', str(e))
-                            continue
-                except Exception as e:
-                    _logger.warning("Error al procesar historial para picking %s: %s", picking.id if picking else 'N/A', str(e))
-                    continue
+            vals_list = self._prepare_supplies_purchase_history_vals()
+            if vals_list:
+                # Savepoint: un fallo del historial no debe abortar la validación del picking
+                with self.env.cr.savepoint():
+                    self.env["supplies.item.history"].create(vals_list)
         except Exception as e:
-            _logger.warning("Error al inicializar historial de compras: %s", str(e))
+            _logger.warning("Error al registrar historial de compras para pickings %s: %s", self.ids, str(e))
 
 
     def action_assign_supplies_relations(self):
@@ -477,24 +547,16 @@ class StockPicking(models.Model):
                 return []
 
             out = []
-
-            def _collect(lines, kind):
-                for item in (lines or []):
-                    pr = item["product"]
-                    uom = item["uom"]
-                    qty = (item.get("qty") or 0.0) * qty_parent
-                    if uom != pr.uom_id:
-                        qty = uom._compute_quantity(qty, pr.uom_id, rounding_method="HALF-UP")
-                    out.append((kind, pr, qty, pr.uom_id))
-
-            if getattr(tmpl, "is_composite", False):
-                _collect(tmpl._explode_components(1.0, uom_parent), "component")
-            if getattr(tmpl, "use_peripherals", False):
-                _collect(tmpl._explode_peripherals(1.0, uom_parent), "peripheral")
             # Para complementos: solo crear si no se deben omitir
             # Esto evita duplicar complementos que ya fueron recibidos
-            if getattr(tmpl, "use_complements", False) and not skip_complements:
-                _collect(tmpl._explode_complements(1.0, uom_parent), "complement")
+            item_types = ("component", "peripheral") if skip_complements else ("component", "peripheral", "complement")
+            for kind, item in tmpl._explode_many([(tmpl, 1.0, uom_parent)], item_types)[0]:
+                pr = item["product"]
+                uom = item["uom"]
+                qty = (item.get("qty") or 0.0) * qty_parent
+                if uom != pr.uom_id:
+                    qty = uom._compute_quantity(qty, pr.uom_id, rounding_method="HALF-UP")
+                out.append((kind, pr, qty, pr.uom_id))
 
             return out
 
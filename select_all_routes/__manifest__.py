@@ -9,6 +9,7 @@
     'depends': [
         'product', 
         'stock',
+        'mass_routes_manager',
     ],
     'data': [
         # La vista XML es crucial para que Odoo muestre los botones
@@ -8,8 +8,8 @@ class ProductTemplate(models.Model):
         """Selecciona todas las rutas de stock disponibles para los productos seleccionados."""
         self.ensure_one() # Solo se ejecuta para un registro
         all_routes = self.env['stock.route'].search([])
-        # Comando (6, 0, [IDs]) = Reemplaza las rutas existentes por las nuevas
-        self.write({'route_ids': [(6, 0, all_routes.ids)]})
+        # Reemplaza las rutas existentes por las nuevas (solo inserta/elimina la diferencia)
+        self.env['product.route.assignment'].assign(self, all_routes, mode='set')
         
         # Devuelve una acción para recargar la vista, mostrando el cambio inmediatamente
         return {
@@ -20,8 +20,8 @@ class ProductTemplate(models.Model):
     def action_deselect_all_routes(self):
         """Deselecciona (elimina) todas las rutas de stock de los productos seleccionados."""
         self.ensure_one() # Solo se ejecuta para un registro
-        # Comando (5, 0, 0) = Elimina todos los registros de la lista de Many2many
-        self.write({'route_ids': [(5, 0, 0)]})
+        # Elimina todas las rutas del producto
+        self.env['product.route.assignment'].assign(self, self.env['stock.route'], mode='set')
         
         # Devuelve una acción para recargar la vista
         return {
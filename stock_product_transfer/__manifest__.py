@@ -25,6 +25,7 @@ Características:
         'base',
         'stock',
         'product',
+        'product_suppiles',  # Líneas de suministro y campos de asociación de stock.lot
     ],
     'data': [
         'security/ir.model.access.csv',
@@ -204,6 +204,10 @@ class ProductTransferWizard(models.TransientModel):
         try:
             result = self._convert_generic_to_specific()
 
+            # La conversión reescribe líneas de suministro y quants por SQL: conciliar los
+            # campos almacenados de asociación/ubicación solo de los lotes que tocó
+            self.env['stock.lot'].sudo()._backfill_association_fields(lot_ids=result['touched_lot_ids'])
+
             # Mostrar mensaje de éxito
             message = _('✅ Conversión completada exitosamente.')
             message += _('\nProducto genérico eliminado: %s (Serial: %s)') % (
@@ -942,6 +946,16 @@ class ProductTransferWizard(models.TransientModel):
                 # Verificar si es una línea eliminada temporalmente (tiene item_type) o una línea existente
                 if 'item_type' in supply_line_data:
                     # Es una línea eliminada temporalmente, restaurarla
+                    if supply_line_data['related_lot_id']:
+                        # Un serial solo puede estar asociado una vez (índice único)
+                        self.env.cr.execute(
+                            "SELECT 1 FROM stock_lot_supply_line WHERE related_lot_id = %s LIMIT 1",
+                            (supply_line_data['related_lot_id'],)
+                        )
+                        if self.env.cr.fetchone():
+                            _logger.warning('El serial (ID: %s) ya está asociado a otra línea; la línea %s se restaura sin serial',
+                                            supply_line_data['related_lot_id'], supply_line_data.get('id'))
+                            supply_line_data['related_lot_id'] = None
                     try:
                         self.env.cr.execute("""
                             INSERT INTO stock_lot_supply_line 
@@ -1688,6 +1702,10 @@ class ProductTransferWizard(models.TransientModel):
         
         # PASO 7: Restaurar relaciones de supply_line para el nuevo lote
         if generic_supply_lines and 'stock.lot.supply.line' in self.env:
+            # Un serial solo puede estar asociado una vez (índice único): validar antes del SQL
+            self.env['stock.lot.supply.line'].browse()._check_related_lots_available(
+                [sl_data['related_lot_id'] for sl_data in generic_supply_lines]
+            )
             for sl_data in generic_supply_lines:
                 # Crear línea usando SQL directo para evitar auto-asignación
                 self.env.cr.execute("""
@@ -1710,6 +1728,9 @@ class ProductTransferWizard(models.TransientModel):
         
         # PASO 7b: Restaurar asociaciones donde el genérico era COMPONENTE de otro producto (evitar doble trabajo al técnico)
         if relations_to_restore and 'stock.lot.supply.line' in self.env:
+            self.env['stock.lot.supply.line'].browse()._check_related_lots_available(
+                [new_lot.id] * len(relations_to_restore)
+            )
             for rel in relations_to_restore:
                 self.env.cr.execute("""
                     INSERT INTO stock_lot_supply_line 
@@ -1882,6 +1903,16 @@ class ProductTransferWizard(models.TransientModel):
                         # La relación puede existir aunque el componente esté en otra ubicación temporalmente
                         _logger.info('ℹ️ El nuevo lote no está en la ubicación del principal (%s), pero se creará la relación de todas formas', principal_location.display_name)
                 
+                # El PASO 7b ya restauró la asociación (un serial solo se asocia una vez):
+                # solo corregir el producto al destino (específico)
+                self.env.cr.execute("""
+                    UPDATE stock_lot_supply_line
+                       SET product_id = %s, write_uid = %s, write_date = NOW()
+                     WHERE lot_id = %s AND related_lot_id = %s
+                """, (self.destination_product_id.id, self.env.user.id, rel_data['lot_id'], new_lot.id))
+                if self.env.cr.rowcount:
+                    continue
+
                 # Crear la relación usando SQL directo para evitar validaciones que puedan fallar
                 # IMPORTANTE: Usar el producto destino (específico) en lugar del producto origen (genérico)
                 try:
@@ -1929,5 +1960,11 @@ class ProductTransferWizard(models.TransientModel):
             'picking_out_id': picking_out.id,
             'new_lot_id': new_lot.id,
             'new_lot_name': new_lot.name,
+            # Lotes cuyas líneas de suministro o quants se reescribieron por SQL
+            'touched_lot_ids': sorted(
+                {new_lot.id}
+                | {sl_data['related_lot_id'] for sl_data in generic_supply_lines if sl_data['related_lot_id']}
+                | {rel_data['lot_id'] for rel_data in relations_to_restore if rel_data['lot_id']}
+            ),
         }
 
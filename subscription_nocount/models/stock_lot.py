@@ -3,6 +3,7 @@ import calendar
 import datetime
 from dateutil.relativedelta import relativedelta
 from odoo import api, fields, models, _
+from odoo.osv import expression
 from odoo.exceptions import UserError
 import logging
 
@@ -342,95 +343,30 @@ class StockLot(models.Model):
         return super(StockLot, self).name_get()
 
     @api.model
-    def _name_search(self, name='', args=None, operator='ilike', limit=100, order=None):
-        """Sobrescribe la búsqueda para buscar SOLO por inventory_plate cuando se usa desde el wizard de cambio de equipo."""
-        try:
-            # Asegurar que args sea siempre una lista válida
-            if args is None:
-                args = []
-            elif not isinstance(args, list):
-                # Si args no es una lista, intentar convertirlo
-                try:
-                    args = list(args) if args else []
-                except (TypeError, ValueError):
-                    args = []
-            
-            context = self.env.context or {}
-            
-            # DETECCIÓN CRÍTICA: Verificar el dominio PRIMERO (más confiable)
-            # Si el dominio incluye available_old_equipment_ids o available_new_equipment_ids,
-            # es DEFINITIVAMENTE desde el wizard de cambio de equipo
-            try:
-                domain_str = str(args)
-                is_wizard_context = (
-                    "available_old_equipment_ids" in domain_str or 
-                    "available_new_equipment_ids" in domain_str
-                )
-            except Exception:
-                is_wizard_context = False
-            
-            # Si no se detectó por dominio, verificar el contexto
-            if not is_wizard_context:
-                is_wizard_context = (
-                    context.get('search_by_inventory_plate_only') or 
-                    context.get('equipment_change_wizard') or
-                    context.get('active_model') == 'subscription.equipment.change.wizard'
-                )
-            
-            # Si el contexto indica que se busca por placa de inventario, buscar SOLO por inventory_plate
-            # NO buscar por serial number ni por nombre de producto
-            if is_wizard_context:
-                # Construir el dominio de búsqueda SOLO con inventory_plate
-                domain = list(args) if args else []
-                
-                if name:
-                    # CRÍTICO: Buscar SOLO por placa de inventario (inventory_plate)
-                    # NO buscar por 'name' (serial) ni por 'product_id.name'
-                    # Usar 'ilike' para búsqueda parcial
-                    search_domain = [
-                        ('inventory_plate', 'ilike', name),
-                    ]
-                    # Combinar con los args existentes usando AND
-                    if domain:
-                        domain = ['&'] + search_domain + domain
-                    else:
-                        domain = search_domain
-                
-                # IMPORTANTE: Buscar directamente usando _search del modelo base de Odoo
-                # Esto evita completamente el método _name_search de product_suppiles
-                # que busca por serial y producto
-                lot_ids = self.env['stock.lot']._search(domain, limit=limit, order=order or 'inventory_plate, name')
-                
-                # Convertir los IDs a tuplas (id, display_name) usando name_get
-                # con el contexto del wizard para obtener solo la placa
-                if lot_ids:
-                    lots = self.env['stock.lot'].browse(lot_ids)
-                    # Forzar el contexto del wizard para que name_get muestre solo la placa
-                    wizard_context = {
-                        'equipment_change_wizard': True,
-                        'search_by_inventory_plate_only': True,
-                        'active_model': 'subscription.equipment.change.wizard',
-                    }
-                    # Actualizar con el contexto existente
-                    wizard_context.update(context)
-                    result = lots.with_context(wizard_context).name_get()
-                else:
-                    result = []
-                
-                return result
-            
-            # Si no es desde el wizard, usar el método original del módulo product_suppiles
-            # Asegurar que args sea una lista válida antes de pasarlo
-            return super(StockLot, self)._name_search(name=name, args=args, operator=operator, limit=limit, order=order)
-        except Exception as e:
-            # Si hay algún error, intentar usar el método original como fallback
-            _logger.error("Error en _name_search de stock.lot: %s", str(e))
-            try:
-                return super(StockLot, self)._name_search(name=name, args=args or [], operator=operator, limit=limit, order=order)
-            except Exception:
-                # Si incluso el fallback falla, retornar lista vacía
-                _logger.error("Error crítico en _name_search, retornando lista vacía")
-                return []
+    def _name_search(self, name, domain=None, operator='ilike', limit=None, order=None):
+        """Buscar SOLO por inventory_plate cuando se usa desde el wizard de cambio de equipo.
+
+        Fuera del wizard se usa la búsqueda indexada y ordenada de product_suppiles (search_key).
+        """
+        domain = list(domain or [])
+        context = self.env.context or {}
+
+        # El dominio del wizard incluye available_old_equipment_ids o available_new_equipment_ids
+        domain_str = str(domain)
+        is_wizard_context = (
+            "available_old_equipment_ids" in domain_str
+            or "available_new_equipment_ids" in domain_str
+            or context.get('search_by_inventory_plate_only')
+            or context.get('equipment_change_wizard')
+            or context.get('active_model') == 'subscription.equipment.change.wizard'
+        )
+        if not is_wizard_context:
+            return super(StockLot, self)._name_search(name, domain, operator, limit=limit, order=order)
+
+        # Solo placa de inventario (índice trigram); NO por serial ni por nombre de producto
+        if name:
+            domain = expression.AND([domain, [('inventory_plate', 'ilike', name)]])
+        return self._search(domain, limit=limit, order=order or 'inventory_plate, name')
 
     def action_open_subscription_equipment_changes(self):
         """Abrir el wizard de cambios de equipo con el lote actual como equipo anterior."""
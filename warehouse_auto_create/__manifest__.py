@@ -27,9 +27,11 @@ Características:
         'contacts',
         'stock',
         'custom_u',  # Requerido para el campo tipo_contacto
+        'mass_routes_manager',  # Asignación masiva de rutas a productos
     ],
     'data': [
         'security/ir.model.access.csv',
+        'data/res_partner_cron.xml',
         'views/res_partner_views.xml',
         'wizard/cleanup_routes_wizard_view.xml',
     ],
@@ -1,3 +1,3 @@
 # -*- coding: utf-8 -*-
+from . import warehouse_provisioning
 from . import res_partner
-
@@ -1,11 +1,18 @@
 # -*- coding: utf-8 -*-
 import logging
-from odoo import models, fields, api
+from collections import defaultdict
+
+from odoo import models, fields, api, Command
 from odoo.exceptions import UserError, ValidationError
 from odoo.tools.translate import _
 
 _logger = logging.getLogger(__name__)
 
+# Ubicación de proveedor asignada a los clientes (property_stock_supplier)
+SUPPLIER_LOCATION_ID = 7
+# Último contacto procesado por el cron de actualización de ubicaciones
+LOCATION_REFRESH_CURSOR_PARAM = 'warehouse_auto_create.location_refresh_last_partner_id'
+
 
 class ResPartner(models.Model):
     _inherit = 'res.partner'
@@ -52,68 +59,21 @@ class ResPartner(models.Model):
                 'Almacén: %s (Código: %s)'
             ) % (self.name, existing_warehouse.name, existing_warehouse.code))
         
-        # Obtener la compañía "Supplies de Colombia" (ID=1)
-        company = self.env['res.company'].browse(1)
-        if not company.exists():
-            raise UserError(_(
-                'No se encontró la compañía "Supplies de Colombia" (ID=1).'
-            ))
+        Provisioning = self.env['warehouse.provisioning']
+        company = Provisioning._get_company()
+        template = Provisioning._get_warehouse_template(company)
         
-        # Obtener el almacén principal de la compañía para resupply_wh_ids
-        main_warehouse = self.env['stock.warehouse'].search([
-            ('company_id', '=', company.id)
-        ], limit=1)
-        
-        if not main_warehouse:
+        # Generar el código del almacén (primeros 5 caracteres en mayúsculas,
+        # con sufijo numérico si ya está ocupado)
+        codes, code_errors = Provisioning._allocate_warehouse_codes(self, company)
+        if self.id in code_errors:
             raise UserError(_(
-                'No se encontró un almacén principal para la compañía "Supplies de Colombia".'
-            ))
-        
-        # Generar el código del almacén (primeros 5 caracteres en mayúsculas)
-        warehouse_code = self.name[:5].upper().strip()
-        
-        # Validar que el código no esté vacío
-        if not warehouse_code:
-            raise UserError(_(
-                'No se pudo generar un código válido para el almacén. '
-                'El nombre del contacto debe tener al menos un carácter.'
-            ))
-        
-        # Validar que el código no esté duplicado
-        existing_code = self.env['stock.warehouse'].search([
-            ('code', '=', warehouse_code),
-            ('company_id', '=', company.id)
-        ], limit=1)
-        
-        if existing_code:
-            # Si el código está duplicado, agregar un sufijo numérico
-            counter = 1
-            base_code = warehouse_code
-            while existing_code:
-                warehouse_code = f"{base_code[:4]}{counter}"
-                existing_code = self.env['stock.warehouse'].search([
-                    ('code', '=', warehouse_code),
-                    ('company_id', '=', company.id)
-                ], limit=1)
-                counter += 1
-                if counter > 99:  # Límite de seguridad
-                    raise UserError(_(
-                        'No se pudo generar un código único para el almacén.'
-                    ))
+                'No se pudo generar un código válido para el almacén: %s'
+            ) % code_errors[self.id])
         
         try:
             # Crear el almacén
-            warehouse_vals = {
-                'name': self.name,
-                'code': warehouse_code,
-                'company_id': company.id,
-                'partner_id': self.id,
-                'reception_steps': 'one_step',
-                'delivery_steps': 'ship_only',
-                'buy_to_resupply': False,
-                'resupply_wh_ids': [(6, 0, [main_warehouse.id])],
-            }
-            
+            warehouse_vals = Provisioning._prepare_warehouse_vals(self, codes[self.id], template)
             warehouse = self.env['stock.warehouse'].create(warehouse_vals)
             
             # NO crear la ruta automáticamente al crear el almacén
@@ -140,13 +100,34 @@ class ResPartner(models.Model):
                 'Por favor, verifique los datos del contacto e intente nuevamente.'
             ) % str(e))
     
-    def _create_client_route(self, warehouse):
+    def _get_warehouse_route_code(self, warehouse):
+        """Código del almacén usado en el nombre de la ruta de entrega y de su 4ª regla."""
+        warehouse_code_upper = (warehouse.code or '').strip().upper().replace(' ', '_').rstrip('_')
+        if not warehouse_code_upper:
+            # Si no hay código, usar el nombre del almacén
+            warehouse_code_upper = warehouse.name.strip().upper().replace(' ', '_').rstrip('_')[:10]
+        return warehouse_code_upper
+    
+    def _get_warehouse_return_code(self, warehouse):
+        """Código del almacén usado en la ruta, el tipo de operación y la secuencia de devolución."""
+        warehouse_code = (warehouse.code or warehouse.name or '')[:10]
+        return warehouse_code.strip().upper().replace(' ', '_').rstrip('_') or 'DEV'
+    
+    def _get_route_provisioning_context(self, warehouse, route_context=None):
+        """Devuelve el contexto de aprovisionamiento recibido o lo resuelve para un solo almacén."""
+        if route_context is not None:
+            return route_context
+        Provisioning = self.env['warehouse.provisioning']
+        return Provisioning._get_route_context(Provisioning._get_company(), warehouse)
+    
+    def _prepare_client_route_vals(self, warehouse, route_context, sequence):
         """
-        Crea una ruta (stock.route) para el cliente con la estructura especificada.
+        Valores de la ruta de entrega del cliente con sus 4 reglas anidadas,
+        para crearla con un solo create().
         
         Parámetros de la ruta:
         - name: SUPP_ALISTAMIENTO_SALIDA_TRANSPORTE_[CODIGO_ALMACEN]
-        - sequence: incrementar en 1, empezar en 5
+        - sequence: reservada en bloque por warehouse.provisioning (empieza en 5)
         - company_id: Supplies de Colombia (ID=1)
         - product_categ_selectable: False
         - product_selectable: True
@@ -154,119 +135,59 @@ class ResPartner(models.Model):
         - warehouse_selectable: False
         - sale_selectable: True
         """
-        _logger.info("=" * 80)
-        _logger.info(f"INICIO _create_client_route - Almacén: {warehouse.name} (ID: {warehouse.id}, Código: {warehouse.code})")
-        _logger.info("=" * 80)
-        
+        route_name = f'SUPP_ALISTAMIENTO_SALIDA_TRANSPORTE_{self._get_warehouse_route_code(warehouse)}'
         try:
-            # Obtener la compañía "Supplies de Colombia" (ID=1)
-            company = self.env['res.company'].browse(1)
-            if not company.exists():
-                _logger.error("ERROR: No se encontró la compañía 'Supplies de Colombia' (ID=1)")
-                raise UserError(_('No se encontró la compañía "Supplies de Colombia" (ID=1).'))
-            _logger.info(f"Compañía encontrada: {company.name} (ID: {company.id})")
-            
-            # Obtener el código del almacén y limpiarlo
-            warehouse_code = warehouse.code or ''
-            _logger.info(f"Código del almacén original: '{warehouse_code}'")
-            warehouse_code_upper = warehouse_code.strip().upper().replace(' ', '_').rstrip('_')
-            
-            if not warehouse_code_upper:
-                # Si no hay código, usar el nombre del almacén
-                warehouse_code_upper = warehouse.name.strip().upper().replace(' ', '_').rstrip('_')[:10]
-                _logger.warning(f"No había código, usando nombre del almacén: '{warehouse_code_upper}'")
-            
-            # Construir el nombre de la ruta
-            route_name = f'SUPP_ALISTAMIENTO_SALIDA_TRANSPORTE_{warehouse_code_upper}'
-            _logger.info(f"Nombre de ruta generado: '{route_name}'")
-            
-            # Verificar si ya existe una ruta con este nombre
-            # Usar sudo() para asegurar que se busque correctamente
-            _logger.info(f"Buscando ruta existente con nombre: '{route_name}'")
-            existing_route = self.env['stock.route'].sudo().search([
-                ('name', '=', route_name),
-                ('company_id', '=', company.id)
-            ], limit=1)
-            
-            if existing_route:
-                _logger.info(f"Ruta '{route_name}' ya existe (ID: {existing_route.id}), retornando sin crear")
-                return existing_route
-            
-            # Obtener el siguiente número de secuencia (empezar en 5)
-            # Buscar la última ruta creada para obtener el siguiente número
-            # Usar sudo() para asegurar que se busque correctamente
-            _logger.info("Buscando última ruta para obtener secuencia")
-            last_route = self.env['stock.route'].sudo().search([
-                ('company_id', '=', company.id)
-            ], order='sequence desc', limit=1)
-            
-            if last_route and last_route.sequence >= 5:
-                next_sequence = last_route.sequence + 1
-                _logger.info(f"Última secuencia encontrada: {last_route.sequence}, siguiente: {next_sequence}")
-            else:
-                next_sequence = 5
-                _logger.info(f"No se encontró ruta con secuencia >= 5, usando secuencia inicial: {next_sequence}")
-            
-            # Crear la ruta
-            route_vals = {
-                'name': route_name,
-                'sequence': next_sequence,
-                'company_id': company.id,
-                'product_categ_selectable': False,
-                'product_selectable': True,
-                'packaging_selectable': False,
-                'warehouse_selectable': False,
-                'sale_selectable': True,
-                'active': True,
-            }
-            
-            # Crear la ruta con sudo() para asegurar permisos
-            _logger.info(f"Creando ruta con valores: {route_vals}")
-            try:
-                route = self.env['stock.route'].sudo().create(route_vals)
-                _logger.info(f"Ruta creada exitosamente: {route} (ID: {route.id if route else 'None'})")
-            except Exception as create_error:
-                _logger.error(f"ERROR al crear la ruta '{route_name}': {str(create_error)}", exc_info=True)
-                raise
-            
-            # Verificar que la ruta se creó correctamente
-            if not route or not route.id:
-                _logger.error(f"Fallo al crear la ruta: {route_name}. El objeto route es nulo o no tiene ID.")
-                raise UserError(_('Error: No se pudo crear la ruta "%s".') % route_name)
-            
-            # Crear las 4 reglas de stock asociadas a la ruta
-            _logger.info(f"Iniciando creación de reglas de stock para la ruta '{route_name}' (ID: {route.id})")
-            try:
-                self._create_route_rules(route, warehouse, company)
-                _logger.info(f"Reglas de stock creadas exitosamente para la ruta '{route_name}'")
-            except Exception as rules_error:
-                # Si hay error al crear las reglas, eliminar la ruta creada y relanzar el error
-                _logger.error(f"ERROR al crear las reglas de stock para la ruta '{route_name}': {str(rules_error)}", exc_info=True)
-                _logger.error(f"Eliminando ruta '{route_name}' (ID: {route.id}) debido a error en reglas")
-                try:
-                    route.sudo().unlink()
-                    _logger.info(f"Ruta '{route_name}' eliminada correctamente")
-                except Exception as unlink_error:
-                    _logger.error(f"ERROR al eliminar la ruta '{route_name}': {str(unlink_error)}")
-                raise UserError(_(
-                    'Error al crear las reglas de stock para la ruta "%s": %s\n'
-                    'La ruta no se creó. Por favor, verifique los tipos de operación necesarios.'
-                ) % (route_name, str(rules_error)))
-            
-            # Invalidar caché para asegurar que la ruta se muestre
-            self.env.invalidate_all()
-            _logger.info(f"Caché invalidada después de crear la ruta '{route_name}' (ID: {route.id})")
-            _logger.info(f"FIN _create_client_route - Ruta creada exitosamente: '{route_name}' (ID: {route.id})")
-            _logger.info("=" * 80)
-            
-            return route
-        except Exception as e:
-            _logger.error(f"ERROR CRÍTICO en _create_client_route para almacén {warehouse.name}: {str(e)}", exc_info=True)
-            raise
+            rules_vals = self._prepare_route_rules_vals(warehouse, route_context)
+        except UserError as rules_error:
+            raise UserError(_(
+                'Error al crear las reglas de stock para la ruta "%s": %s\n'
+                'La ruta no se creó. Por favor, verifique los tipos de operación necesarios.'
+            ) % (route_name, str(rules_error)))
+        return {
+            'name': route_name,
+            'sequence': sequence,
+            'company_id': route_context['company'].id,
+            'product_categ_selectable': False,
+            'product_selectable': True,
+            'packaging_selectable': False,
+            'warehouse_selectable': False,
+            'sale_selectable': True,
+            'active': True,
+            'rule_ids': [Command.create(vals) for vals in rules_vals],
+        }
+    
+    def _create_client_route(self, warehouse, route_context=None, sequence=None):
+        """
+        Crea la ruta de entrega (stock.route) del cliente y sus 4 reglas con un
+        solo create(). Si la ruta ya existe, la retorna sin crear nada.
+        
+        :param route_context: contexto de aprovisionamiento compartido
+            (warehouse.provisioning._get_route_context); se resuelve si no se indica
+        :param sequence: secuencia de la ruta; se reserva si no se indica
+        """
+        route_context = self._get_route_provisioning_context(warehouse, route_context)
+        company = route_context['company']
+        route_name = f'SUPP_ALISTAMIENTO_SALIDA_TRANSPORTE_{self._get_warehouse_route_code(warehouse)}'
+        existing_route = self.env['stock.route'].sudo().search([
+            ('name', '=', route_name),
+            ('company_id', '=', company.id)
+        ], limit=1)
+        if existing_route:
+            _logger.info("Ruta '%s' ya existe (ID: %s), retornando sin crear", route_name, existing_route.id)
+            return existing_route
+        
+        if sequence is None:
+            sequence = next(self.env['warehouse.provisioning']._reserve_route_sequences(company, 1))
+        route = self.env['stock.route'].sudo().create(
+            self._prepare_client_route_vals(warehouse, route_context, sequence)
+        )
+        _logger.info("Ruta '%s' creada con %s reglas (ID: %s)", route_name, len(route.rule_ids), route.id)
+        return route
     
-    def _create_route_rules(self, route, warehouse, company):
+    def _prepare_route_rules_vals(self, warehouse, route_context):
         """
-        Crea las 4 reglas de stock (stock.rule) asociadas a la ruta.
+        Valores de las 4 reglas de stock (stock.rule) de la ruta de entrega,
+        sin route_id.
         
         Reglas:
         1. Existencias - Alistamiento (make_to_stock)
@@ -282,202 +203,72 @@ class ResPartner(models.Model):
            - location_src_id: Supp/Transporte
            - location_dest_id: almacén de existencias del almacén (lot_stock_id)
         """
-        _logger.info("=" * 80)
-        _logger.info(f"INICIO _create_route_rules - Ruta: {route.name} (ID: {route.id}), Almacén: {warehouse.name}")
-        _logger.info("=" * 80)
-        
-        try:
-            # Buscar los tipos de operación necesarios
-            _logger.info("Buscando tipos de operación necesarios...")
-            picking_types = self._get_picking_types_for_rules(company)
-            _logger.info(f"Tipos de operación encontrados: Alistamiento={picking_types['alistamiento'].id if picking_types['alistamiento'] else 'NO ENCONTRADO'}, Salida={picking_types['salida'].id if picking_types['salida'] else 'NO ENCONTRADO'}, Transporte={picking_types['transporte'].id if picking_types['transporte'] else 'NO ENCONTRADO'}")
-            
-            if not all(picking_types.values()):
-                missing = [k for k, v in picking_types.items() if not v]
-                missing_names = {
-                    'alistamiento': 'SUPPLIES DE COLOMBIA SAS: Alistamiento',
-                    'salida': 'SUPPLIES DE COLOMBIA SAS: Salida',
-                    'transporte': 'SUPPLIES DE COLOMBIA SAS: Transporte'
-                }
-                missing_list = [missing_names.get(k, k) for k in missing]
-                _logger.error(f"ERROR: No se encontraron los siguientes tipos de operación: {', '.join(missing_list)}")
-                raise UserError(_(
-                    'No se encontraron los siguientes tipos de operación: %s\n'
-                    'Por favor, verifique que existan en el sistema con estos nombres exactos.'
-                ) % ', '.join(missing_list))
-        
-            # Obtener el código del almacén para la cuarta regla
-            warehouse_code = warehouse.code or ''
-            warehouse_code_upper = warehouse_code.strip().upper().replace(' ', '_').rstrip('_')
-            
-            if not warehouse_code_upper:
-                warehouse_code_upper = warehouse.name.strip().upper().replace(' ', '_').rstrip('_')[:10]
-            
-            _logger.info(f"Código del almacén para regla 4: '{warehouse_code_upper}'")
-            
-            # Obtener el tipo de operación de entrega del almacén (out_type_id)
-            _logger.info("Buscando tipo de operación de entrega del almacén (out_type_id)...")
-            warehouse_out_type = warehouse.out_type_id
-            if not warehouse_out_type:
-                _logger.error(f"ERROR: No se encontró el tipo de operación de entrega para el almacén '{warehouse.name}' (ID: {warehouse.id})")
-                raise UserError(_(
-                    'No se encontró el tipo de operación de entrega para el almacén "%s".'
-                ) % warehouse.name)
-            _logger.info(f"Tipo de operación de entrega encontrado: {warehouse_out_type.name} (ID: {warehouse_out_type.id})")
-            
-            # Obtener la ubicación de existencias del almacén (lot_stock_id)
-            _logger.info("Buscando ubicación de existencias del almacén (lot_stock_id)...")
-            stock_location = warehouse.lot_stock_id
-            if not stock_location:
-                _logger.error(f"ERROR: No se encontró la ubicación de existencias (lot_stock_id) para el almacén '{warehouse.name}' (ID: {warehouse.id})")
-                raise UserError(_(
-                    'No se encontró la ubicación de existencias (lot_stock_id) para el almacén "%s".'
-                ) % warehouse.name)
-            _logger.info(f"Ubicación de existencias encontrada: {stock_location.complete_name} (ID: {stock_location.id})")
-            
-            # Buscar las ubicaciones por su nombre completo (complete_name)
-            # Usar sudo() para asegurar permisos y evitar errores de transacción
-            _logger.info("Buscando ubicaciones del sistema (Supp/Existencias, Supp/Alistamiento, Supp/Salida, Supp/Transporte)...")
-            try:
-                location_existencias = self.env['stock.location'].sudo().search([
-                    ('complete_name', '=', 'Supp/Existencias'),
-                    ('company_id', '=', company.id)
-                ], limit=1)
-                _logger.info(f"Ubicación Existencias: {'ENCONTRADA' if location_existencias else 'NO ENCONTRADA'} - {location_existencias.complete_name if location_existencias else 'N/A'}")
-                
-                location_alistamiento = self.env['stock.location'].sudo().search([
-                    ('complete_name', '=', 'Supp/Alistamiento'),
-                    ('company_id', '=', company.id)
-                ], limit=1)
-                _logger.info(f"Ubicación Alistamiento: {'ENCONTRADA' if location_alistamiento else 'NO ENCONTRADA'} - {location_alistamiento.complete_name if location_alistamiento else 'N/A'}")
-                
-                location_salida = self.env['stock.location'].sudo().search([
-                    ('complete_name', '=', 'Supp/Salida'),
-                    ('company_id', '=', company.id)
-                ], limit=1)
-                _logger.info(f"Ubicación Salida: {'ENCONTRADA' if location_salida else 'NO ENCONTRADA'} - {location_salida.complete_name if location_salida else 'N/A'}")
-                
-                location_transporte = self.env['stock.location'].sudo().search([
-                    ('complete_name', '=', 'Supp/Transporte'),
-                    ('company_id', '=', company.id)
-                ], limit=1)
-                _logger.info(f"Ubicación Transporte: {'ENCONTRADA' if location_transporte else 'NO ENCONTRADA'} - {location_transporte.complete_name if location_transporte else 'N/A'}")
-            except Exception as e:
-                _logger.error(f"ERROR al buscar ubicaciones: {str(e)}", exc_info=True)
-                raise UserError(_('Error al buscar ubicaciones: %s') % str(e))
-            
-            # Validar que todas las ubicaciones existan
-            if not location_existencias:
-                _logger.error("ERROR: No se encontró la ubicación 'Supp/Existencias'")
-                raise UserError(_('No se encontró la ubicación "Supp/Existencias".'))
-            if not location_alistamiento:
-                _logger.error("ERROR: No se encontró la ubicación 'Supp/Alistamiento'")
-                raise UserError(_('No se encontró la ubicación "Supp/Alistamiento".'))
-            if not location_salida:
-                _logger.error("ERROR: No se encontró la ubicación 'Supp/Salida'")
-                raise UserError(_('No se encontró la ubicación "Supp/Salida".'))
-            if not location_transporte:
-                _logger.error("ERROR: No se encontró la ubicación 'Supp/Transporte'")
-                raise UserError(_('No se encontró la ubicación "Supp/Transporte".'))
-            
-            _logger.info(f"Todas las ubicaciones encontradas correctamente:")
-            _logger.info(f"  - Existencias: {location_existencias.complete_name} (ID: {location_existencias.id})")
-            _logger.info(f"  - Alistamiento: {location_alistamiento.complete_name} (ID: {location_alistamiento.id})")
-            _logger.info(f"  - Salida: {location_salida.complete_name} (ID: {location_salida.id})")
-            _logger.info(f"  - Transporte: {location_transporte.complete_name} (ID: {location_transporte.id})")
-            _logger.info(f"  - Stock Almacén: {stock_location.complete_name} (ID: {stock_location.id})")
-        
-            # Regla 1: Existencias - Alistamiento
-            _logger.info("Creando Regla 1: Existencias - Alistamiento")
-            rule1_vals = {
-                'name': 'Existencias - Alistamiento',
-                'action': 'pull',
-                'picking_type_id': picking_types['alistamiento'].id,
-                'location_src_id': location_existencias.id,
-                'location_dest_id': location_alistamiento.id,
-                'procure_method': 'make_to_stock',
-                'company_id': company.id,
-                'route_id': route.id,
-                'active': True,
+        company = route_context['company']
+        picking_types = route_context['picking_types']
+        if not all(picking_types.values()):
+            missing_names = {
+                'alistamiento': 'SUPPLIES DE COLOMBIA SAS: Alistamiento',
+                'salida': 'SUPPLIES DE COLOMBIA SAS: Salida',
+                'transporte': 'SUPPLIES DE COLOMBIA SAS: Transporte'
             }
-            _logger.info(f"Valores Regla 1: {rule1_vals}")
-            try:
-                rule1 = self.env['stock.rule'].sudo().create(rule1_vals)
-                _logger.info(f"Regla 1 creada exitosamente (ID: {rule1.id})")
-            except Exception as e:
-                _logger.error(f"ERROR al crear Regla 1: {str(e)}", exc_info=True)
-                raise
-            
-            # Regla 2: Alistamiento - Salida
-            _logger.info("Creando Regla 2: Alistamiento - Salida")
-            rule2_vals = {
-                'name': 'Alistamiento - Salida',
-                'action': 'pull',
-                'picking_type_id': picking_types['salida'].id,
-                'location_src_id': location_alistamiento.id,
-                'location_dest_id': location_salida.id,
-                'procure_method': 'make_to_order',
-                'company_id': company.id,
-                'route_id': route.id,
-                'active': True,
-            }
-            _logger.info(f"Valores Regla 2: {rule2_vals}")
-            try:
-                rule2 = self.env['stock.rule'].sudo().create(rule2_vals)
-                _logger.info(f"Regla 2 creada exitosamente (ID: {rule2.id})")
-            except Exception as e:
-                _logger.error(f"ERROR al crear Regla 2: {str(e)}", exc_info=True)
-                raise
-            
-            # Regla 3: Salida - Transporte
-            _logger.info("Creando Regla 3: Salida - Transporte")
-            rule3_vals = {
-                'name': 'Salida - Transporte',
-                'action': 'pull',
-                'picking_type_id': picking_types['transporte'].id,
-                'location_src_id': location_salida.id,
-                'location_dest_id': location_transporte.id,
-                'procure_method': 'make_to_order',
-                'company_id': company.id,
-                'route_id': route.id,
-                'active': True,
-            }
-            _logger.info(f"Valores Regla 3: {rule3_vals}")
-            try:
-                rule3 = self.env['stock.rule'].sudo().create(rule3_vals)
-                _logger.info(f"Regla 3 creada exitosamente (ID: {rule3.id})")
-            except Exception as e:
-                _logger.error(f"ERROR al crear Regla 3: {str(e)}", exc_info=True)
-                raise
-            
-            # Regla 4: Transporte - [CODIGO_ALMACEN]
-            _logger.info(f"Creando Regla 4: Transporte - {warehouse_code_upper}")
-            rule4_vals = {
-                'name': f'Transporte - {warehouse_code_upper}',
-                'action': 'pull',
-                'picking_type_id': warehouse_out_type.id,
-                'location_src_id': location_transporte.id,
-                'location_dest_id': stock_location.id,  # Ubicación de existencias del almacén
-                'procure_method': 'make_to_order',
-                'company_id': company.id,
-                'route_id': route.id,
-                'active': True,
-            }
-            _logger.info(f"Valores Regla 4: {rule4_vals}")
-            try:
-                rule4 = self.env['stock.rule'].sudo().create(rule4_vals)
-                _logger.info(f"Regla 4 creada exitosamente (ID: {rule4.id})")
-            except Exception as e:
-                _logger.error(f"ERROR al crear Regla 4: {str(e)}", exc_info=True)
-                raise
-            
-            _logger.info(f"Todas las reglas de stock creadas exitosamente para la ruta {route.name} (ID: {route.id})")
-            _logger.info("=" * 80)
-            _logger.info(f"FIN _create_route_rules - 4 reglas creadas exitosamente")
-            _logger.info("=" * 80)
-        except Exception as e:
-            _logger.error(f"ERROR CRÍTICO en _create_route_rules para ruta {route.name}: {str(e)}", exc_info=True)
-            raise
+            missing_list = [missing_names.get(k, k) for k, v in picking_types.items() if not v]
+            raise UserError(_(
+                'No se encontraron los siguientes tipos de operación: %s\n'
+                'Por favor, verifique que existan en el sistema con estos nombres exactos.'
+            ) % ', '.join(missing_list))
+        
+        # Tipo de operación de entrega del almacén (out_type_id) para la cuarta regla
+        warehouse_out_type = warehouse.out_type_id
+        if not warehouse_out_type:
+            raise UserError(_(
+                'No se encontró el tipo de operación de entrega para el almacén "%s".'
+            ) % warehouse.name)
+        
+        # Ubicación de existencias del almacén (lot_stock_id)
+        stock_location = warehouse.lot_stock_id
+        if not stock_location:
+            raise UserError(_(
+                'No se encontró la ubicación de existencias (lot_stock_id) para el almacén "%s".'
+            ) % warehouse.name)
+        
+        locations = route_context['locations']
+        for name, location in locations.items():
+            if not location:
+                raise UserError(_('No se encontró la ubicación "%s".') % name)
+        location_existencias = locations['Supp/Existencias']
+        location_alistamiento = locations['Supp/Alistamiento']
+        location_salida = locations['Supp/Salida']
+        location_transporte = locations['Supp/Transporte']
+        
+        rules_data = [
+            ('Existencias - Alistamiento', picking_types['alistamiento'], location_existencias, location_alistamiento, 'make_to_stock'),
+            ('Alistamiento - Salida', picking_types['salida'], location_alistamiento, location_salida, 'make_to_order'),
+            ('Salida - Transporte', picking_types['transporte'], location_salida, location_transporte, 'make_to_order'),
+            (f'Transporte - {self._get_warehouse_route_code(warehouse)}', warehouse_out_type, location_transporte, stock_location, 'make_to_order'),
+        ]
+        return [{
+            'name': name,
+            'action': 'pull',
+            'picking_type_id': picking_type.id,
+            'location_src_id': location_src.id,
+            'location_dest_id': location_dest.id,
+            'procure_method': procure_method,
+            'company_id': company.id,
+            'active': True,
+        } for name, picking_type, location_src, location_dest, procure_method in rules_data]
+    
+    def _create_route_rules(self, route, warehouse, company, route_context=None):
+        """
+        Crea las 4 reglas de stock (stock.rule) de la ruta de entrega con un solo
+        create(). Ver _prepare_route_rules_vals.
+        """
+        route_context = self._get_route_provisioning_context(warehouse, route_context)
+        rules = self.env['stock.rule'].sudo().create([
+            dict(vals, route_id=route.id)
+            for vals in self._prepare_route_rules_vals(warehouse, route_context)
+        ])
+        _logger.info("%s reglas creadas para la ruta %s (ID: %s)", len(rules), route.name, route.id)
+        return rules
     
     def _get_picking_types_for_rules(self, company):
         """
@@ -590,25 +381,34 @@ class ResPartner(models.Model):
             ], limit=1)
         return pt
     
-    def _get_or_create_client_return_picking_type(self, warehouse, company, location_src, location_dest):
+    def _get_or_create_client_return_picking_type(self, warehouse, company, location_src, location_dest, route_context=None):
         """
         Crea si no existe el tipo de operación de DEVOLUCIÓN propio del cliente
         (ej. "Blindex: Devoluciones Blindex"), con origen cliente → Supp/Transporte.
         Así la primera regla de la ruta de devolución no usa Órdenes de entrega.
+        
+        Si el almacén está precargado en el contexto de aprovisionamiento, el tipo
+        de operación y la secuencia se toman de ahí sin nuevas búsquedas.
         """
         if not warehouse:
             return self.env['stock.picking.type']
-        pt = self._get_client_return_picking_type(warehouse)
+        warehouse_code = self._get_warehouse_return_code(warehouse)
+        seq_code = 'stock.picking.devolucion.%s' % warehouse_code
+        if route_context and warehouse.id in route_context['prefetched_warehouse_ids']:
+            pt = route_context['client_return_types'].get(warehouse.id)
+            sequence = route_context['return_sequences'].get(seq_code) or self.env['ir.sequence']
+        else:
+            pt = self._get_client_return_picking_type(warehouse)
+            sequence = None
         if pt:
             return pt
         warehouse_name = (warehouse.name or '').strip()
-        warehouse_code = (warehouse.code or warehouse.name or '')[:10].strip().upper().replace(' ', '_').rstrip('_') or 'DEV'
         type_name = _('%s: Devoluciones %s') % (warehouse_name, warehouse_name)
-        seq_code = 'stock.picking.devolucion.%s' % warehouse_code
-        sequence = self.env['ir.sequence'].sudo().search([
-            ('code', '=', seq_code),
-            ('company_id', 'in', [False, company.id]),
-        ], limit=1)
+        if sequence is None:
+            sequence = self.env['ir.sequence'].sudo().search([
+                ('code', '=', seq_code),
+                ('company_id', 'in', [False, company.id]),
+            ], limit=1)
         if not sequence:
             sequence = self.env['ir.sequence'].sudo().create({
                 'name': _('Devoluciones %s') % warehouse_name,
@@ -698,15 +498,39 @@ class ResPartner(models.Model):
             _logger.info("Usando tipo 'Transporte' como fallback para regla Transporte - Devolución")
         return result
     
-    def _create_client_return_route(self, warehouse, company):
+    def _prepare_client_return_route_vals(self, warehouse, route_context, sequence):
+        """
+        Valores de la ruta de devolución del cliente con sus 4 reglas anidadas,
+        para crearla con un solo create(). Nombre: SUPP_DEVOLUCION_[CODIGO_ALMACEN].
+        """
+        route_name = f'SUPP_DEVOLUCION_{self._get_warehouse_return_code(warehouse)}'
+        try:
+            rules_vals = self._prepare_return_route_rules_vals(warehouse, route_context)
+        except Exception as e:
+            _logger.error(f"Error al crear reglas de devolución: {e}", exc_info=True)
+            raise UserError(_('Error al crear reglas de la ruta de devolución "%s": %s') % (route_name, str(e)))
+        return {
+            'name': route_name,
+            'sequence': sequence,
+            'company_id': route_context['company'].id,
+            'product_categ_selectable': False,
+            'product_selectable': True,
+            'packaging_selectable': False,
+            'warehouse_selectable': False,
+            'sale_selectable': False,
+            'active': True,
+            'rule_ids': [Command.create(vals) for vals in rules_vals],
+        }
+    
+    def _create_client_return_route(self, warehouse, company, route_context=None, sequence=None):
         """
         Crea la ruta de devolución (cliente → Supp): desde almacén del cliente
         hasta Supp/Existencias pasando por Transporte → Devolución → Verificación.
-        Nombre: SUPP_DEVOLUCION_[CODIGO_ALMACEN].
+        Nombre: SUPP_DEVOLUCION_[CODIGO_ALMACEN]. La ruta y sus reglas se crean
+        con un solo create().
         """
-        warehouse_code = (warehouse.code or warehouse.name or '')[:10]
-        warehouse_code_upper = warehouse_code.strip().upper().replace(' ', '_').rstrip('_') or 'DEV'
-        route_name = f'SUPP_DEVOLUCION_{warehouse_code_upper}'
+        route_context = self._get_route_provisioning_context(warehouse, route_context)
+        route_name = f'SUPP_DEVOLUCION_{self._get_warehouse_return_code(warehouse)}'
         _logger.info(f"Creando ruta de devolución: {route_name}")
         existing = self.env['stock.route'].sudo().search([
             ('name', '=', route_name),
@@ -715,65 +539,35 @@ class ResPartner(models.Model):
         if existing:
             _logger.info(f"Ruta de devolución '{route_name}' ya existe (ID: {existing.id})")
             return existing
-        last_route = self.env['stock.route'].sudo().search(
-            [('company_id', '=', company.id)],
-            order='sequence desc', limit=1
+        if sequence is None:
+            sequence = next(self.env['warehouse.provisioning']._reserve_route_sequences(company, 1))
+        route = self.env['stock.route'].sudo().create(
+            self._prepare_client_return_route_vals(warehouse, route_context, sequence)
         )
-        next_seq = (last_route.sequence + 1) if last_route and last_route.sequence >= 5 else 5
-        route_vals = {
-            'name': route_name,
-            'sequence': next_seq,
-            'company_id': company.id,
-            'product_categ_selectable': False,
-            'product_selectable': True,
-            'packaging_selectable': False,
-            'warehouse_selectable': False,
-            'sale_selectable': False,
-            'active': True,
-        }
-        route = self.env['stock.route'].sudo().create(route_vals)
-        try:
-            self._create_return_route_rules(route, warehouse, company)
-        except Exception as e:
-            _logger.error(f"Error al crear reglas de devolución: {e}", exc_info=True)
-            try:
-                route.sudo().unlink()
-            except Exception:
-                pass
-            raise UserError(_('Error al crear reglas de la ruta de devolución "%s": %s') % (route_name, str(e)))
-        self.env.invalidate_all()
         _logger.info(f"Ruta de devolución creada: {route_name} (ID: {route.id})")
         return route
     
-    def _create_return_route_rules(self, route, warehouse, company):
+    def _prepare_return_route_rules_vals(self, warehouse, route_context):
         """
-        Crea las 4 reglas de la ruta de devolución (como el ejemplo Devolución Blindex):
+        Valores de las 4 reglas de la ruta de devolución (como el ejemplo Devolución Blindex),
+        sin route_id:
         1. [Almacén cliente] → Supp/Transporte   (pull)
         2. Supp/Transporte → Supp/Devolución      (pull)
         3. Supp/Devolución → Supp/Verificación    (pull)
         4. Supp/Verificación → Supp/Existencias   (pull)
         """
+        company = route_context['company']
         stock_location = warehouse.lot_stock_id
         if not stock_location:
             raise UserError(_('No se encontró la ubicación de existencias del almacén "%s".') % warehouse.name)
-        locs = {}
-        for name in ('Supp/Transporte', 'Supp/Devolución', 'Supp/Verificación', 'Supp/Existencias'):
-            loc = self.env['stock.location'].sudo().search([
-                ('complete_name', '=', name),
-                ('company_id', '=', company.id),
-            ], limit=1)
-            if not loc:
-                # Fallback: buscar por nombre del segmento (p. ej. sin tilde: Devolucion)
-                segment = name.split('/')[-1]
-                loc = self.env['stock.location'].sudo().search([
-                    ('company_id', '=', company.id),
-                    ('complete_name', 'ilike', segment),
-                ], limit=1)
+        locs = route_context['return_locations']
+        for name, loc in locs.items():
             if not loc:
                 raise UserError(_('No se encontró la ubicación "%s". Créela en Inventario → Configuración → Ubicaciones.') % name)
-            locs[name] = loc
         transport, devol, verif, exist = locs['Supp/Transporte'], locs['Supp/Devolución'], locs['Supp/Verificación'], locs['Supp/Existencias']
-        pts = self._get_picking_types_for_return_rules(company)
+        if not route_context['main_warehouse']:
+            raise UserError(_('No se encontró el almacén principal de Supp (sin partner).'))
+        pts = route_context['return_picking_types']
         # Regla 2 (Transporte → Devolución) usa "Devoluciones en Transporte" si existe, si no "Transporte"
         pt_transporte_devolucion = pts.get('devoluciones_transporte') or pts['transporte']
         if not pt_transporte_devolucion:
@@ -785,7 +579,7 @@ class ResPartner(models.Model):
         # Regla 1: crear o usar tipo de operación de DEVOLUCIÓN propio del cliente (no Órdenes de entrega)
         # Ej.: "Blindex: Devoluciones Blindex" con origen cliente → Supp/Transporte
         client_return_type = self._get_or_create_client_return_picking_type(
-            warehouse, company, stock_location, transport
+            warehouse, company, stock_location, transport, route_context=route_context
         )
         rules_data = [
             (_('Cliente - Transporte'), stock_location.id, transport.id, client_return_type.id),
@@ -793,19 +587,29 @@ class ResPartner(models.Model):
             (_('Devolución - Verificación'), devol.id, verif.id, pts['devolucion'].id),
             (_('Verificación - Existencias'), verif.id, exist.id, pts['verificacion'].id),
         ]
-        for name, src_id, dest_id, picking_type_id in rules_data:
-            self.env['stock.rule'].sudo().create({
-                'name': name,
-                'action': 'pull',
-                'picking_type_id': picking_type_id,
-                'location_src_id': src_id,
-                'location_dest_id': dest_id,
-                'procure_method': 'make_to_order',
-                'company_id': company.id,
-                'route_id': route.id,
-                'active': True,
-            })
+        return [{
+            'name': name,
+            'action': 'pull',
+            'picking_type_id': picking_type_id,
+            'location_src_id': src_id,
+            'location_dest_id': dest_id,
+            'procure_method': 'make_to_order',
+            'company_id': company.id,
+            'active': True,
+        } for name, src_id, dest_id, picking_type_id in rules_data]
+    
+    def _create_return_route_rules(self, route, warehouse, company, route_context=None):
+        """
+        Crea las 4 reglas de la ruta de devolución con un solo create().
+        Ver _prepare_return_route_rules_vals.
+        """
+        route_context = self._get_route_provisioning_context(warehouse, route_context)
+        rules = self.env['stock.rule'].sudo().create([
+            dict(vals, route_id=route.id)
+            for vals in self._prepare_return_route_rules_vals(warehouse, route_context)
+        ])
         _logger.info("Reglas de ruta de devolución creadas correctamente.")
+        return rules
     
     def action_view_warehouse(self):
         """
@@ -842,6 +646,9 @@ class ResPartner(models.Model):
         """
         Marca todas las rutas seleccionables en todos los productos (misma lógica
         que "Seleccionar TODAS las Rutas" desde Inventario → Productos → Acciones).
+        
+        Solo se insertan/eliminan los pares producto-ruta que difieren, por lotes
+        (product.route.assignment).
         """
         ProductTemplate = self.env['product.template'].sudo()
         all_routes = self.env['stock.route'].search([
@@ -872,13 +679,14 @@ class ResPartner(models.Model):
                     'sticky': False,
                 },
             }
-        products.write({'route_ids': [(6, 0, all_routes.ids)]})
+        result = self.env['product.route.assignment'].assign(products, all_routes, mode='set')
         return {
             'type': 'ir.actions.client',
             'tag': 'display_notification',
             'params': {
                 'title': _('Rutas marcadas'),
-                'message': _('Se marcaron %s ruta(s) en %s producto(s).') % (len(all_routes), len(products)),
+                'message': _('Se marcaron %s ruta(s) en %s producto(s) (%s asignaciones nuevas, %s eliminadas).') % (
+                    len(all_routes), len(products), result['inserted'], result['deleted']),
                 'type': 'success',
                 'sticky': False,
             },
@@ -891,67 +699,71 @@ class ResPartner(models.Model):
         - Regla 1 "Cliente - Transporte": tipo de operación de DEVOLUCIÓN del cliente
           (ej. "Blindex: Devoluciones Blindex"), no Órdenes de entrega.
         - Reglas 2, 3, 4: tipos del almacén principal Supp (Transporte, Devolución, Verificación).
+        
+        Las reglas se leen con una sola búsqueda, se comparan con el tipo esperado
+        y solo se escriben las que difieren, agrupadas por tipo de operación.
         """
-        company = self.env['res.company'].browse(1)
-        if not company.exists():
-            raise UserError(_('No se encontró la compañía (ID=1).'))
-        partner = self.env['res.partner'].browse(1)
-        main_wh = partner._get_main_supp_warehouse(company)
-        if not main_wh:
+        Provisioning = self.env['warehouse.provisioning']
+        company = Provisioning._get_company()
+        rule_names_to_supp_type = ['Transporte - Devolución', 'Devolución - Verificación', 'Verificación - Existencias']
+        rules = self.env['stock.rule'].sudo().search([
+            ('route_id.name', 'like', 'SUPP_DEVOLUCION_%'),
+            ('route_id.company_id', '=', company.id),
+            ('name', 'in', ['Cliente - Transporte'] + rule_names_to_supp_type),
+        ])
+        first_rules = rules.filtered(lambda r: r.name == 'Cliente - Transporte')
+        warehouse_by_location = {}
+        for warehouse in self.env['stock.warehouse'].sudo().search([
+            ('lot_stock_id', 'in', first_rules.location_src_id.ids),
+        ]):
+            warehouse_by_location.setdefault(warehouse.lot_stock_id.id, warehouse)
+        
+        route_context = Provisioning._get_route_context(
+            company, self.env['stock.warehouse'].union(*warehouse_by_location.values()))
+        if not route_context['main_warehouse']:
             raise UserError(_('No se encontró el almacén principal Supp (sin partner).'))
-        pts = partner._get_picking_types_for_return_rules(company)
+        pts = route_context['return_picking_types']
         pt_transporte_devolucion = pts.get('devoluciones_transporte') or pts['transporte']
         if not pt_transporte_devolucion or not pts.get('devolucion') or not pts.get('verificacion'):
             raise UserError(_(
                 'Faltan tipos de operación del almacén Supp (Devoluciones en Transporte o Transporte, Devolución, Verificación). '
                 'Verifique en Inventario → Tipos de operación que existan para SUPPLIES DE COLOMBIA SAS.'
             ))
-        routes = self.env['stock.route'].sudo().search([
-            ('name', 'like', 'SUPP_DEVOLUCION_%'),
-            ('company_id', '=', company.id),
-        ])
-        updated = 0
+        supp_type_by_rule_name = dict(zip(rule_names_to_supp_type, [
+            pt_transporte_devolucion.id, pts['devolucion'].id, pts['verificacion'].id,
+        ]))
+        
         errors = []
-        rule_names_to_supp_type = [
-            ('Transporte - Devolución', pt_transporte_devolucion.id),
-            ('Devolución - Verificación', pts['devolucion'].id),
-            ('Verificación - Existencias', pts['verificacion'].id),
-        ]
-        for route in routes:
-            # Regla 1: Cliente - Transporte -> tipo de operación de DEVOLUCIÓN del cliente (no Órdenes de entrega)
-            first_rule = self.env['stock.rule'].sudo().search([
-                ('route_id', '=', route.id),
-                ('name', '=', 'Cliente - Transporte'),
-            ], limit=1)
-            if first_rule:
-                src_loc = first_rule.location_src_id
-                warehouse = self.env['stock.warehouse'].sudo().search([
-                    ('lot_stock_id', '=', src_loc.id),
-                ], limit=1)
-                if warehouse:
-                    # Crear tipo "X: Devoluciones X" si no existe y asignarlo
-                    client_return_type = partner._get_or_create_client_return_picking_type(
-                        warehouse, company,
-                        first_rule.location_src_id,
-                        first_rule.location_dest_id,
+        client_return_types = {}
+        rules_by_type = defaultdict(lambda: self.env['stock.rule'].sudo())
+        for rule in rules:
+            if rule.name == 'Cliente - Transporte':
+                # Regla 1 -> tipo de operación de DEVOLUCIÓN del cliente (no Órdenes de entrega)
+                warehouse = warehouse_by_location.get(rule.location_src_id.id)
+                if not warehouse:
+                    errors.append(_('Ruta %s: no se encontró almacén con lot_stock_id = %s') % (
+                        rule.route_id.name, rule.location_src_id.complete_name))
+                    continue
+                if warehouse.id not in client_return_types:
+                    # Crear tipo "X: Devoluciones X" si no existe
+                    client_return_types[warehouse.id] = self._get_or_create_client_return_picking_type(
+                        warehouse, company, rule.location_src_id, rule.location_dest_id,
+                        route_context=route_context,
                     )
-                    if client_return_type and first_rule.picking_type_id.id != client_return_type.id:
-                        first_rule.sudo().write({'picking_type_id': client_return_type.id})
-                        updated += 1
-                        _logger.info('Ruta %s: regla Cliente-Transporte → %s (devolución)', route.name, client_return_type.name)
-                else:
-                    errors.append(_('Ruta %s: no se encontró almacén con lot_stock_id = %s') % (route.name, src_loc.complete_name))
-            # Reglas 2, 3, 4: tipos del almacén Supp (no B&S)
-            for rule_name, correct_picking_type_id in rule_names_to_supp_type:
-                rule = self.env['stock.rule'].sudo().search([
-                    ('route_id', '=', route.id),
-                    ('name', '=', rule_name),
-                ], limit=1)
-                if rule and rule.picking_type_id.id != correct_picking_type_id:
-                    rule.sudo().write({'picking_type_id': correct_picking_type_id})
-                    updated += 1
-                    _logger.info('Ruta %s: regla %s → tipo Supp', route.name, rule_name)
-        msg = [_('Proceso completado.'), _('✅ Reglas corregidas: %s') % updated]
+                correct_picking_type_id = client_return_types[warehouse.id].id
+            else:
+                # Reglas 2, 3, 4: tipos del almacén Supp (no B&S)
+                correct_picking_type_id = supp_type_by_rule_name[rule.name]
+            if correct_picking_type_id and rule.picking_type_id.id != correct_picking_type_id:
+                rules_by_type[correct_picking_type_id] |= rule
+        
+        updated = 0
+        for picking_type_id, rules_to_fix in rules_by_type.items():
+            rules_to_fix.write({'picking_type_id': picking_type_id})
+            updated += len(rules_to_fix)
+        _logger.info('Rutas de devolución: %s reglas revisadas, %s corregidas', len(rules), updated)
+        
+        msg = [_('Proceso completado.'), _('✅ Reglas corregidas: %s de %s revisadas') % (updated, len(rules))]
         if errors:
             msg.append(_('⚠️ Advertencias: %s') % len(errors))
             for e in errors[:5]:
@@ -969,9 +781,117 @@ class ResPartner(models.Model):
             }
         }
     
+    @api.model
+    def _get_supplier_location(self):
+        """Ubicación de proveedor (ID 7) que se asigna a todos los clientes."""
+        supplier_location = self.env['stock.location'].browse(SUPPLIER_LOCATION_ID)
+        if not supplier_location.exists():
+            raise UserError(_(
+                'No se encontró la ubicación del proveedor con ID 7. '
+                'Por favor, verifique que la ubicación existe en el sistema.'
+            ))
+        return supplier_location
+    
+    @api.model
+    def _get_client_location_drift(self, company, supplier_location, after_id=0, limit=None, partner_ids=None):
+        """
+        Clientes (empresas de tipo "cliente" o "ambos" con almacén) cuyas ubicaciones
+        de cliente o proveedor en la compañía no son las esperadas, con una sola
+        consulta de comparación.
+        
+        :return: lista de (partner_id, ubicación de existencias del almacén) ordenada por id
+        """
+        self.flush_model(['is_company', 'active', 'tipo_contacto', 'property_stock_customer', 'property_stock_supplier'])
+        self.env['stock.warehouse'].flush_model(['partner_id', 'active', 'sequence', 'lot_stock_id'])
+        self.env.cr.execute(f"""
+            SELECT p.id, w.lot_stock_id
+              FROM res_partner p
+              JOIN LATERAL (
+                    SELECT wh.lot_stock_id
+                      FROM stock_warehouse wh
+                     WHERE wh.partner_id = p.id
+                       AND wh.active
+                  ORDER BY wh.sequence, wh.id
+                     LIMIT 1
+              ) w ON w.lot_stock_id IS NOT NULL
+             WHERE p.is_company
+               AND p.active
+               AND p.tipo_contacto IN ('cliente', 'ambos')
+               AND p.id > %(after_id)s
+               {'AND p.id = ANY(%(partner_ids)s)' if partner_ids is not None else ''}
+               AND ((p.property_stock_customer ->> %(company_key)s)::int IS DISTINCT FROM w.lot_stock_id
+                    OR (p.property_stock_supplier ->> %(company_key)s)::int IS DISTINCT FROM %(supplier_id)s)
+          ORDER BY p.id
+             LIMIT %(limit)s
+        """, {
+            'after_id': after_id,
+            'partner_ids': list(partner_ids or []),
+            'company_key': str(company.id),
+            'supplier_id': supplier_location.id,
+            'limit': limit,
+        })
+        return self.env.cr.fetchall()
+    
+    @api.model
+    def _refresh_client_locations(self, after_id=0, chunk_size=500, max_chunks=None, partner_ids=None):
+        """
+        Corrige por lotes, en orden de id, las ubicaciones de los clientes que
+        difieren de las esperadas:
+        - property_stock_customer: ubicación de existencias del almacén del cliente
+        - property_stock_supplier: ubicación con ID 7
+        
+        Cada lote se escribe en su propio savepoint. El trabajo puede reanudarse
+        desde `last_id`.
+        
+        :return: {'changed': n, 'errors': [...], 'last_id': id, 'done': bool}
+        """
+        company = self.env['warehouse.provisioning']._get_company()
+        supplier_location = self._get_supplier_location()
+        result = {'changed': 0, 'errors': [], 'last_id': after_id, 'done': False}
+        chunks = 0
+        while max_chunks is None or chunks < max_chunks:
+            drift = self._get_client_location_drift(
+                company, supplier_location, after_id=result['last_id'], limit=chunk_size, partner_ids=partner_ids)
+            chunks += 1
+            if drift:
+                partners_by_location = defaultdict(list)
+                for partner_id, location_id in drift:
+                    partners_by_location[location_id].append(partner_id)
+                try:
+                    with self.env.cr.savepoint():
+                        for location_id, ids in partners_by_location.items():
+                            self.browse(ids).with_context(allowed_company_ids=[company.id]).write({
+                                'property_stock_customer': location_id,
+                                'property_stock_supplier': supplier_location.id,
+                            })
+                    result['changed'] += len(drift)
+                except Exception as e:
+                    _logger.error("Error al actualizar ubicaciones de %s contactos: %s", len(drift), e, exc_info=True)
+                    result['errors'].append(_('Contactos (IDs %s a %s): %s') % (drift[0][0], drift[-1][0], str(e)))
+                result['last_id'] = drift[-1][0]
+            if len(drift) < chunk_size:
+                result['done'] = True
+                break
+        _logger.info("Ubicaciones de clientes: %s contactos actualizados en %s lote(s), %s errores",
+                     result['changed'], chunks, len(result['errors']))
+        return result
+    
+    @api.model
+    def _cron_refresh_client_locations(self, chunk_size=500, max_chunks=20):
+        """
+        Trabajo reanudable: corrige un bloque de lotes y guarda el último contacto
+        procesado; si quedan contactos, vuelve a disparar el cron.
+        """
+        Param = self.env['ir.config_parameter'].sudo()
+        after_id = int(Param.get_param(LOCATION_REFRESH_CURSOR_PARAM, 0) or 0)
+        result = self._refresh_client_locations(after_id=after_id, chunk_size=chunk_size, max_chunks=max_chunks)
+        Param.set_param(LOCATION_REFRESH_CURSOR_PARAM, 0 if result['done'] else result['last_id'])
+        if not result['done']:
+            self.env.ref('warehouse_auto_create.ir_cron_refresh_client_locations')._trigger()
+    
     def action_update_location(self):
         """
-        Actualiza las ubicaciones de stock del contacto:
+        Actualiza las ubicaciones de stock del contacto, solo si difieren:
         - property_stock_customer: se actualiza a la ubicación del almacén creado
         - property_stock_supplier: se actualiza a la ubicación con ID 7 (formato {"1": 7})
         """
@@ -1000,60 +920,50 @@ class ResPartner(models.Model):
                 'Por favor, cree el almacén primero usando el botón "Crear Almacén".'
             ))
         
-        try:
-            # Obtener la ubicación del almacén (lot_stock_id es la ubicación principal del almacén)
-            customer_location = warehouse.lot_stock_id
-            
-            if not customer_location:
-                raise UserError(_(
-                    'No se encontró la ubicación del almacén "%s".'
-                ) % warehouse.name)
-            
-            # Obtener la compañía "Supplies de Colombia" (ID=1)
-            company = self.env['res.company'].browse(1)
-            if not company.exists():
-                raise UserError(_(
-                    'No se encontró la compañía "Supplies de Colombia" (ID=1).'
-                ))
-            
-            # Actualizar property_stock_supplier con la ubicación ID 7
-            # El formato {"1": 7} significa ubicación ID 7 para la compañía ID 1
-            supplier_location = self.env['stock.location'].browse(7)
-            
-            if not supplier_location.exists():
-                raise UserError(_(
-                    'No se encontró la ubicación del proveedor con ID 7. '
-                    'Por favor, verifique que la ubicación existe en el sistema.'
-                ))
-            
-            # Actualizar las propiedades usando write() con el contexto de la compañía
-            # Esto asegura que las propiedades se guarden correctamente por compañía
-            self.with_context(allowed_company_ids=[company.id]).write({
-                'property_stock_customer': customer_location.id,
-                'property_stock_supplier': supplier_location.id,
-            })
-            
-            # Mensaje de confirmación
+        # Obtener la ubicación del almacén (lot_stock_id es la ubicación principal del almacén)
+        customer_location = warehouse.lot_stock_id
+        if not customer_location:
+            raise UserError(_(
+                'No se encontró la ubicación del almacén "%s".'
+            ) % warehouse.name)
+        supplier_location = self._get_supplier_location()
+        
+        result = self._refresh_client_locations(partner_ids=self.ids)
+        if result['errors']:
+            raise UserError(_(
+                'Error al actualizar las ubicaciones: %s\n\n'
+                'Por favor, verifique los datos e intente nuevamente.'
+            ) % result['errors'][0])
+        
+        if not result['changed']:
             return {
                 'type': 'ir.actions.client',
                 'tag': 'display_notification',
                 'params': {
-                    'title': _('Ubicaciones Actualizadas Exitosamente'),
+                    'title': _('Ubicaciones al Día'),
                     'message': _(
-                        'Se han actualizado las ubicaciones para el contacto "%s":\n'
-                        '- Ubicación Cliente: %s (ID: %s)\n'
-                        '- Ubicación Proveedor: %s (ID: 7)'
-                    ) % (self.name, customer_location.complete_name, customer_location.id, supplier_location.complete_name),
-                    'type': 'success',
+                        'Las ubicaciones del contacto "%s" ya estaban actualizadas.'
+                    ) % self.name,
+                    'type': 'info',
                     'sticky': False,
                 }
             }
-            
-        except Exception as e:
-            raise UserError(_(
-                'Error al actualizar las ubicaciones: %s\n\n'
-                'Por favor, verifique los datos e intente nuevamente.'
-            ) % str(e))
+        
+        # Mensaje de confirmación
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Ubicaciones Actualizadas Exitosamente'),
+                'message': _(
+                    'Se han actualizado las ubicaciones para el contacto "%s":\n'
+                    '- Ubicación Cliente: %s (ID: %s)\n'
+                    '- Ubicación Proveedor: %s (ID: 7)'
+                ) % (self.name, customer_location.complete_name, customer_location.id, supplier_location.complete_name),
+                'type': 'success',
+                'sticky': False,
+            }
+        }
     
     @api.model
     def action_create_all_warehouses(self):
@@ -1061,24 +971,14 @@ class ResPartner(models.Model):
         Crea almacenes para todos los clientes de tipo "cliente" o "ambos" 
         que sean empresas y que no tengan almacén creado.
         
+        La creación se delega al motor de aprovisionamiento (warehouse.provisioning):
+        un anti-join para los clientes sin almacén y creación por lotes con savepoint.
+        
         Retorna un resumen con el número de almacenes creados exitosamente
-        y los errores encontrados.
+        y los errores encontrados por cliente.
         """
-        # Buscar todos los contactos que cumplan las condiciones:
-        # - is_company = True
-        # - tipo_contacto in ('cliente', 'ambos')
-        # - No tengan almacén asociado
-        partners = self.env['res.partner'].search([
-            ('is_company', '=', True),
-            ('tipo_contacto', 'in', ['cliente', 'ambos']),
-        ])
-        
-        # Filtrar los que no tienen almacén
-        partners_without_warehouse = partners.filtered(
-            lambda p: not self.env['stock.warehouse'].search([
-                ('partner_id', '=', p.id)
-            ], limit=1)
-        )
+        Provisioning = self.env['warehouse.provisioning']
+        partners_without_warehouse = Provisioning._get_partners_without_warehouse()
         
         if not partners_without_warehouse:
             return {
@@ -1094,94 +994,15 @@ class ResPartner(models.Model):
                 }
             }
         
-        # Obtener la compañía "Supplies de Colombia" (ID=1)
-        company = self.env['res.company'].browse(1)
-        if not company.exists():
-            raise UserError(_(
-                'No se encontró la compañía "Supplies de Colombia" (ID=1).'
-            ))
-        
-        # Obtener el almacén principal de la compañía para resupply_wh_ids
-        main_warehouse = self.env['stock.warehouse'].search([
-            ('company_id', '=', company.id)
-        ], limit=1)
-        
-        if not main_warehouse:
-            raise UserError(_(
-                'No se encontró un almacén principal para la compañía "Supplies de Colombia".'
-            ))
-        
-        # Contadores
-        created_count = 0
-        error_count = 0
+        result = Provisioning.provision_warehouses(partners_without_warehouse)
+        created_count = len(result['created'])
+        error_count = len(result['errors'])
         errors = []
-        
-        # Crear almacenes para cada contacto
-        for partner in partners_without_warehouse:
-            try:
-                # Validar que el contacto tenga nombre
-                if not partner.name:
-                    errors.append(_('Contacto sin nombre (ID: %s)') % partner.id)
-                    error_count += 1
-                    continue
-                
-                # Generar el código del almacén (primeros 5 caracteres en mayúsculas)
-                warehouse_code = partner.name[:5].upper().strip()
-                
-                # Validar que el código no esté vacío
-                if not warehouse_code:
-                    errors.append(_('Contacto "%s" (ID: %s): No se pudo generar código válido') % (partner.name, partner.id))
-                    error_count += 1
-                    continue
-                
-                # Validar que el código no esté duplicado
-                existing_code = self.env['stock.warehouse'].search([
-                    ('code', '=', warehouse_code),
-                    ('company_id', '=', company.id)
-                ], limit=1)
-                
-                if existing_code:
-                    # Si el código está duplicado, agregar un sufijo numérico
-                    counter = 1
-                    base_code = warehouse_code
-                    while existing_code:
-                        warehouse_code = f"{base_code[:4]}{counter}"
-                        existing_code = self.env['stock.warehouse'].search([
-                            ('code', '=', warehouse_code),
-                            ('company_id', '=', company.id)
-                        ], limit=1)
-                        counter += 1
-                        if counter > 99:  # Límite de seguridad
-                            errors.append(_('Contacto "%s" (ID: %s): No se pudo generar código único') % (partner.name, partner.id))
-                            error_count += 1
-                            continue
-                
-                # Crear el almacén
-                warehouse_vals = {
-                    'name': partner.name,
-                    'code': warehouse_code,
-                    'company_id': company.id,
-                    'partner_id': partner.id,
-                    'reception_steps': 'one_step',
-                    'delivery_steps': 'ship_only',
-                    'buy_to_resupply': False,
-                    'resupply_wh_ids': [(6, 0, [main_warehouse.id])],
-                }
-                
-                warehouse = self.env['stock.warehouse'].create(warehouse_vals)
-                
-                # NO crear la ruta automáticamente al crear el almacén
-                # La ruta se debe crear manualmente usando el botón "Crear Todas las Rutas y Reglas"
-                
-                created_count += 1
-                
-            except Exception as e:
-                error_count += 1
-                error_msg = str(e)
-                if partner.name:
-                    errors.append(_('Contacto "%s" (ID: %s): %s') % (partner.name, partner.id, error_msg))
-                else:
-                    errors.append(_('Contacto (ID: %s): %s') % (partner.id, error_msg))
+        for partner in partners_without_warehouse.filtered(lambda p: p.id in result['errors']):
+            if partner.name:
+                errors.append(_('Contacto "%s" (ID: %s): %s') % (partner.name, partner.id, result['errors'][partner.id]))
+            else:
+                errors.append(_('Contacto (ID: %s): %s') % (partner.id, result['errors'][partner.id]))
         
         # Preparar mensaje de resultado
         message_parts = []
@@ -1218,17 +1039,17 @@ class ResPartner(models.Model):
         Crea rutas y reglas para todos los clientes que tengan almacén
         pero que no tengan ruta creada.
         
+        Los objetos compartidos (ubicaciones de Supp, almacén principal, tipos de
+        operación y secuencias de devolución) se resuelven una sola vez en un
+        contexto de aprovisionamiento, los números de secuencia de las rutas se
+        reservan en bloque y las rutas de cada cliente (entrega y devolución,
+        con sus reglas) se crean con un solo create(). El número de consultas de
+        búsqueda no depende del número de clientes.
+        
         Retorna un resumen con el número de rutas creadas exitosamente
         y los errores encontrados.
         """
-        # Log inmediato al inicio del método para verificar que se ejecuta
-        # Usar print también para asegurar que se vea en la consola
-        print("=" * 80)
-        print("=== INICIO: action_create_all_routes ===")
-        print("=" * 80)
-        _logger.info("=" * 80)
         _logger.info("=== INICIO: action_create_all_routes ===")
-        _logger.info("=" * 80)
         try:
             # Buscar todos los contactos que cumplan las condiciones:
             # - is_company = True
@@ -1260,12 +1081,9 @@ class ResPartner(models.Model):
             ])
             _logger.info(f"Almacenes encontrados: {len(warehouses)}")
             
-            # Obtener los IDs de los partners que tienen almacén
-            partners_with_warehouse_ids = warehouses.mapped('partner_id').ids
-            
-            # Filtrar los partners que tienen almacén
-            partners_with_warehouse = partners.filtered(lambda p: p.id in partners_with_warehouse_ids)
-            _logger.info(f"Contactos con almacén: {len(partners_with_warehouse)}")
+            # Crear un diccionario para mapear partner_id -> warehouse
+            partner_warehouse_map = {w.partner_id.id: w for w in warehouses}
+            partners_with_warehouse = partners.filtered(lambda p: p.id in partner_warehouse_map)
             
             if not partners_with_warehouse:
                 _logger.warning("No se encontraron contactos con almacén asociado")
@@ -1282,12 +1100,24 @@ class ResPartner(models.Model):
                     }
                 }
             
-            # Obtener la compañía "Supplies de Colombia" (ID=1)
-            company = self.env['res.company'].browse(1)
-            if not company.exists():
-                raise UserError(_(
-                    'No se encontró la compañía "Supplies de Colombia" (ID=1).'
-                ))
+            Provisioning = self.env['warehouse.provisioning']
+            company = Provisioning._get_company()
+            route_context = Provisioning._get_route_context(company, warehouses)
+            
+            # Nombres de ruta de entrega y devolución por almacén, y las que ya existen
+            route_names = {
+                warehouse.id: (
+                    f'SUPP_ALISTAMIENTO_SALIDA_TRANSPORTE_{self._get_warehouse_route_code(warehouse)}',
+                    f'SUPP_DEVOLUCION_{self._get_warehouse_return_code(warehouse)}',
+                )
+                for warehouse in partner_warehouse_map.values()
+            }
+            existing_route_names = set(self.env['stock.route'].sudo().search([
+                ('name', 'in', [name for names in route_names.values() for name in names]),
+                ('company_id', '=', company.id),
+            ]).mapped('name'))
+            # Dos rutas como máximo por cliente
+            sequences = Provisioning._reserve_route_sequences(company, 2 * len(partners_with_warehouse))
             
             # Contadores
             routes_created_count = 0
@@ -1297,194 +1127,62 @@ class ResPartner(models.Model):
             error_count = 0
             errors = []
             
-            # Crear un diccionario para mapear partner_id -> warehouse
-            partner_warehouse_map = {w.partner_id.id: w for w in warehouses}
-            
-            # Crear rutas para cada contacto
+            Route = self.env['stock.route'].sudo()
             _logger.info(f"Iniciando creación de rutas para {len(partners_with_warehouse)} contactos")
             for partner in partners_with_warehouse:
-                # Limpiar cualquier transacción abortada antes de procesar el siguiente contacto
-                try:
-                    if self.env.cr.closed:
-                        _logger.warning(f"Cursor cerrado para contacto {partner.id}, saltando...")
-                        continue
-                    # Verificar si hay una transacción abortada y hacer rollback si es necesario
-                    self.env.cr.execute("SELECT 1")
-                except Exception as cleanup_error:
-                    _logger.warning(f"Error al verificar transacción para contacto {partner.id}: {str(cleanup_error)}")
-                    try:
-                        self.env.cr.rollback()
-                        self.env.clear()
-                    except:
-                        pass
+                warehouse = partner_warehouse_map[partner.id]
+                route_name, return_route_name = route_names[warehouse.id]
+                partner_name = partner.name or f'ID: {partner.id}'
+                delivery_vals = return_vals = False
                 
-                # Crear un savepoint para cada contacto para poder hacer rollback si hay error
-                savepoint = self.env.cr.savepoint()
-                try:
-                    # Obtener el almacén del diccionario
-                    warehouse = partner_warehouse_map.get(partner.id)
-                    
-                    if not warehouse:
-                        _logger.warning(f"Partner {partner.id} no tiene almacén en el mapa")
-                        continue
-                    
-                    # Verificar si ya existe una ruta para este almacén
-                    warehouse_code = warehouse.code or ''
-                    warehouse_code_upper = warehouse_code.strip().upper().replace(' ', '_').rstrip('_')
-                    
-                    if not warehouse_code_upper:
-                        warehouse_code_upper = warehouse.name.strip().upper().replace(' ', '_').rstrip('_')[:10]
-                    
-                    route_name = f'SUPP_ALISTAMIENTO_SALIDA_TRANSPORTE_{warehouse_code_upper}'
-                    _logger.info(f"Procesando contacto {partner.id} ({partner.name}): ruta '{route_name}'")
-                    
-                    # Buscar si ya existe una ruta para este almacén
-                    # Usar sudo() para asegurar que se busque correctamente
-                    # Hacer flush antes de buscar para evitar problemas de transacción
-                    try:
-                        self.env.cr.flush()
-                        existing_route = self.env['stock.route'].sudo().search([
-                            ('name', '=', route_name),
-                            ('company_id', '=', company.id)
-                        ], limit=1)
-                    except Exception as e:
-                        _logger.error(f"Error al buscar ruta existente para contacto {partner.id}: {str(e)}")
-                        # Hacer rollback y continuar
-                        savepoint.rollback()
-                        error_count += 1
-                        partner_name = getattr(partner, 'name', False) or f'ID: {partner.id}'
-                        errors.append(_('Contacto "%s" (ID: %s): Error al buscar ruta existente: %s') % (partner_name, partner.id, str(e)))
-                        continue
-                    
-                    if existing_route:
-                        _logger.info(f"Ruta '{route_name}' ya existe (ID: {existing_route.id})")
-                        routes_existing_count += 1
-                        # Intentar crear ruta de devolución si no existe
-                        return_route_name = f'SUPP_DEVOLUCION_{warehouse_code_upper}'
-                        existing_return = self.env['stock.route'].sudo().search([
-                            ('name', '=', return_route_name),
-                            ('company_id', '=', company.id),
-                        ], limit=1)
-                        if existing_return:
-                            return_routes_existing_count += 1
-                        else:
-                            try:
-                                partner.sudo()._create_client_return_route(warehouse, company)
-                                return_routes_created_count += 1
-                                self.env.invalidate_all()
-                            except Exception as ret_e:
-                                _logger.warning(f"Ruta de devolución para {partner.name}: {ret_e}")
-                                errors.append(_('Contacto "%s": Ruta de devolución: %s') % (partner.name, str(ret_e)))
-                                error_count += 1
-                        continue
-                    
-                    # Crear la ruta y las reglas
+                # Ruta de entrega
+                if route_name in existing_route_names:
+                    routes_existing_count += 1
+                else:
                     try:
-                        _logger.info(f"Creando ruta '{route_name}' para contacto {partner.id}")
-                        # Usar sudo() para crear la ruta con permisos completos
-                        route = partner.sudo()._create_client_route(warehouse)
-                        if route:
-                            _logger.info(f"Ruta '{route_name}' creada exitosamente (ID: {route.id})")
-                            routes_created_count += 1
-                            self.env.invalidate_all()
-                            # Crear ruta de devolución (cliente → Supp) si no existe
-                            return_route_name = f'SUPP_DEVOLUCION_{warehouse_code_upper}'
-                            existing_return = self.env['stock.route'].sudo().search([
-                                ('name', '=', return_route_name),
-                                ('company_id', '=', company.id),
-                            ], limit=1)
-                            if existing_return:
-                                return_routes_existing_count += 1
-                            else:
-                                try:
-                                    partner.sudo()._create_client_return_route(warehouse, company)
-                                    return_routes_created_count += 1
-                                    self.env.invalidate_all()
-                                except Exception as ret_e:
-                                    _logger.warning(f"Ruta de devolución para {partner.name}: {ret_e}")
-                                    errors.append(_('Contacto "%s": Ruta de devolución: %s') % (partner.name, str(ret_e)))
-                                    error_count += 1
-                        else:
-                            _logger.error(f"Ruta '{route_name}' no se creó (retornó None)")
-                            # Hacer rollback del savepoint si no se creó la ruta
-                            savepoint.rollback()
-                            error_count += 1
-                            partner_name = getattr(partner, 'name', False) or f'ID: {partner.id}'
-                            errors.append(_('Contacto "%s" (ID: %s): La ruta no se creó (retornó None)') % (partner_name, partner.id))
+                        delivery_vals = partner.sudo()._prepare_client_route_vals(warehouse, route_context, next(sequences))
                     except UserError as ue:
-                        # Si es un UserError, hacer rollback del savepoint y continuar
-                        try:
-                            savepoint.rollback()
-                        except:
-                            # Si el savepoint falla, intentar rollback de la transacción completa
-                            try:
-                                self.env.cr.rollback()
-                            except:
-                                pass
                         error_count += 1
-                        error_msg = str(ue)
-                        partner_name = getattr(partner, 'name', False) or f'ID: {partner.id}'
-                        _logger.error(f"UserError al crear ruta para contacto {partner.id}: {error_msg}")
-                        errors.append(_('Contacto "%s" (ID: %s): %s') % (partner_name, partner.id, error_msg))
-                        # Limpiar el entorno para evitar problemas de caché
-                        self.env.clear()
-                        # Continuar con el siguiente partner
+                        _logger.error(f"UserError al crear ruta para contacto {partner.id}: {ue}")
+                        errors.append(_('Contacto "%s" (ID: %s): %s') % (partner_name, partner.id, str(ue)))
                         continue
-                    except Exception as e:
-                        # Capturar otros errores y hacer rollback del savepoint
-                        try:
-                            savepoint.rollback()
-                        except:
-                            # Si el savepoint falla, intentar rollback de la transacción completa
-                            try:
-                                self.env.cr.rollback()
-                            except:
-                                pass
+                
+                # Ruta de devolución (cliente → Supp); puede crear el tipo de operación del cliente
+                if return_route_name in existing_route_names:
+                    return_routes_existing_count += 1
+                else:
+                    try:
+                        with self.env.cr.savepoint():
+                            return_vals = partner.sudo()._prepare_client_return_route_vals(warehouse, route_context, next(sequences))
+                    except Exception as ret_e:
+                        _logger.warning(f"Ruta de devolución para {partner.name}: {ret_e}")
+                        errors.append(_('Contacto "%s": Ruta de devolución: %s') % (partner.name, str(ret_e)))
                         error_count += 1
-                        error_msg = str(e)
-                        partner_name = getattr(partner, 'name', False) or f'ID: {partner.id}'
-                        _logger.error(f"Error inesperado al crear ruta para contacto {partner.id}: {error_msg}", exc_info=True)
-                        errors.append(_('Contacto "%s" (ID: %s): Error inesperado: %s') % (partner_name, partner.id, error_msg))
-                        # Limpiar el entorno para evitar problemas de caché
-                        self.env.clear()
-                        # Continuar con el siguiente partner
-                        continue
-                    
+                
+                vals_list = [vals for vals in (delivery_vals, return_vals) if vals]
+                if not vals_list:
+                    continue
+                try:
+                    with self.env.cr.savepoint():
+                        Route.create(vals_list)
                 except Exception as e:
-                    # Capturar el error y hacer rollback del savepoint
-                    try:
-                        savepoint.rollback()
-                    except:
-                        # Si el savepoint falla, intentar rollback de la transacción completa
-                        try:
-                            self.env.cr.rollback()
-                        except:
-                            pass
                     error_count += 1
-                    error_msg = str(e)
-                    partner_name = getattr(partner, 'name', False) or f'ID: {partner.id}'
-                    _logger.error(f"Error general al procesar contacto {partner.id}: {error_msg}", exc_info=True)
-                    errors.append(_('Contacto "%s" (ID: %s): Error general: %s') % (partner_name, partner.id, error_msg))
-                    # Limpiar el entorno para evitar problemas de caché
-                    self.env.clear()
-                    # Continuar con el siguiente partner
+                    _logger.error(f"Error inesperado al crear rutas para contacto {partner.id}: {e}", exc_info=True)
+                    errors.append(_('Contacto "%s" (ID: %s): Error inesperado: %s') % (partner_name, partner.id, str(e)))
                     continue
+                routes_created_count += bool(delivery_vals)
+                return_routes_created_count += bool(return_vals)
+                existing_route_names.update(vals['name'] for vals in vals_list)
             
             # Preparar mensaje de resultado
             message_parts = []
             message_parts.append(_('Proceso completado:\n'))
             
-            # Intentar verificar cuántas rutas hay en el sistema (solo si no hay errores críticos)
-            try:
-                all_supp_routes = self.env['stock.route'].sudo().search([
-                    ('name', 'like', 'SUPP_ALISTAMIENTO_SALIDA_TRANSPORTE_%'),
-                    ('company_id', '=', company.id)
-                ])
-                total_routes_in_db = len(all_supp_routes)
-                message_parts.append(_('📊 Total de rutas SUPP en el sistema: %s') % total_routes_in_db)
-            except Exception:
-                # Si hay error al contar, simplemente omitir esta información
-                pass
+            total_routes_in_db = self.env['stock.route'].sudo().search_count([
+                ('name', 'like', 'SUPP_ALISTAMIENTO_SALIDA_TRANSPORTE_%'),
+                ('company_id', '=', company.id)
+            ])
+            message_parts.append(_('📊 Total de rutas SUPP en el sistema: %s') % total_routes_in_db)
             
             if routes_created_count > 0:
                 message_parts.append(_('✅ Rutas de entrega creadas: %s') % routes_created_count)
@@ -1512,10 +1210,6 @@ class ResPartner(models.Model):
                     if len(errors) > 10:
                         message_parts.append(_('\n... y %s errores más') % (len(errors) - 10))
             
-            # Asegurar que siempre haya un mensaje
-            if len(message_parts) == 1:  # Solo "Proceso completado:"
-                message_parts.append(_('No se procesó ningún contacto.'))
-            
             # Determinar el tipo de notificación
             if routes_created_count > 0 and error_count == 0:
                 notification_type = 'success'
@@ -1525,7 +1219,6 @@ class ResPartner(models.Model):
                 notification_type = 'info'
             
             _logger.info(f"=== FIN: action_create_all_routes - Rutas creadas: {routes_created_count}, Existentes: {routes_existing_count}, Errores: {error_count} ===")
-            _logger.info(f"Mensaje a mostrar: {message_parts}")
             
             return {
                 'type': 'ir.actions.client',
@@ -1539,8 +1232,6 @@ class ResPartner(models.Model):
             }
         except Exception as e:
             # Capturar cualquier error inesperado y mostrar un mensaje
-            import traceback
-            error_trace = traceback.format_exc()
             _logger.error(f"=== ERROR CRÍTICO en action_create_all_routes: {str(e)} ===", exc_info=True)
             return {
                 'type': 'ir.actions.client',
@@ -1564,97 +1255,32 @@ class ResPartner(models.Model):
         - Tengan tipo_contacto = "cliente" o "ambos"
         - Tengan un almacén asociado
         
-        Actualiza:
+        Actualiza, solo para los contactos cuyas ubicaciones difieren:
         - property_stock_customer: ubicación del almacén creado
         - property_stock_supplier: ubicación con ID 7
-        """
-        # Buscar todos los contactos que cumplan las condiciones:
-        # - is_company = True
-        # - tipo_contacto in ('cliente', 'ambos')
-        # - Tengan almacén asociado
-        partners = self.env['res.partner'].search([
-            ('is_company', '=', True),
-            ('tipo_contacto', 'in', ['cliente', 'ambos']),
-        ])
         
-        # Filtrar los que tienen almacén
-        partners_with_warehouse = partners.filtered(
-            lambda p: self.env['stock.warehouse'].search([
-                ('partner_id', '=', p.id)
-            ], limit=1)
-        )
+        Las diferencias se detectan con una consulta de comparación y se corrigen
+        por lotes (ver _refresh_client_locations).
+        """
+        result = self._refresh_client_locations()
+        updated_count = result['changed']
+        errors = result['errors']
+        error_count = len(errors)
         
-        if not partners_with_warehouse:
+        if not updated_count and not error_count:
             return {
                 'type': 'ir.actions.client',
                 'tag': 'display_notification',
                 'params': {
                     'title': _('No hay contactos para procesar'),
                     'message': _(
-                        'No se encontraron contactos con almacén asociado para actualizar ubicaciones.'
+                        'Las ubicaciones de todos los clientes con almacén ya están actualizadas.'
                     ),
                     'type': 'info',
                     'sticky': False,
                 }
             }
         
-        # Obtener la compañía "Supplies de Colombia" (ID=1)
-        company = self.env['res.company'].browse(1)
-        if not company.exists():
-            raise UserError(_(
-                'No se encontró la compañía "Supplies de Colombia" (ID=1).'
-            ))
-        
-        # Obtener la ubicación del proveedor (ID 7)
-        supplier_location = self.env['stock.location'].browse(7)
-        if not supplier_location.exists():
-            raise UserError(_(
-                'No se encontró la ubicación del proveedor con ID 7. '
-                'Por favor, verifique que la ubicación existe en el sistema.'
-            ))
-        
-        # Contadores
-        updated_count = 0
-        error_count = 0
-        errors = []
-        
-        # Actualizar ubicaciones para cada contacto
-        for partner in partners_with_warehouse:
-            try:
-                # Buscar el almacén asociado
-                warehouse = self.env['stock.warehouse'].search([
-                    ('partner_id', '=', partner.id)
-                ], limit=1)
-                
-                if not warehouse:
-                    errors.append(_('Contacto "%s" (ID: %s): No se encontró almacén asociado') % (partner.name, partner.id))
-                    error_count += 1
-                    continue
-                
-                # Obtener la ubicación del almacén
-                customer_location = warehouse.lot_stock_id
-                
-                if not customer_location:
-                    errors.append(_('Contacto "%s" (ID: %s): No se encontró la ubicación del almacén "%s"') % (partner.name, partner.id, warehouse.name))
-                    error_count += 1
-                    continue
-                
-                # Actualizar las propiedades usando write() con el contexto de la compañía
-                partner.with_context(allowed_company_ids=[company.id]).write({
-                    'property_stock_customer': customer_location.id,
-                    'property_stock_supplier': supplier_location.id,
-                })
-                
-                updated_count += 1
-                
-            except Exception as e:
-                error_count += 1
-                error_msg = str(e)
-                if partner.name:
-                    errors.append(_('Contacto "%s" (ID: %s): %s') % (partner.name, partner.id, error_msg))
-                else:
-                    errors.append(_('Contacto (ID: %s): %s') % (partner.id, error_msg))
-        
         # Preparar mensaje de resultado
         message_parts = []
         message_parts.append(_('Proceso completado:\n'))
@@ -1662,12 +1288,11 @@ class ResPartner(models.Model):
         
         if error_count > 0:
             message_parts.append(_('\n❌ Errores encontrados: %s') % error_count)
-            if errors:
-                message_parts.append(_('\n\nErrores detallados:'))
-                for error in errors[:10]:  # Mostrar máximo 10 errores
-                    message_parts.append(f'\n- {error}')
-                if len(errors) > 10:
-                    message_parts.append(_('\n... y %s errores más') % (len(errors) - 10))
+            message_parts.append(_('\n\nErrores detallados:'))
+            for error in errors[:10]:  # Mostrar máximo 10 errores
+                message_parts.append(f'\n- {error}')
+            if len(errors) > 10:
+                message_parts.append(_('\n... y %s errores más') % (len(errors) - 10))
         
         # Determinar el tipo de notificación
         notification_type = 'success' if error_count == 0 else 'warning' if updated_count > 0 else 'danger'
@@ -1682,4 +1307,3 @@ class ResPartner(models.Model):
                 'sticky': True,
             }
         }
-
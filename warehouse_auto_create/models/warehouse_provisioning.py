@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+import logging
+from odoo import models, api
+from odoo.exceptions import UserError
+from odoo.tools import frozendict, split_every
+from odoo.tools.translate import _
+
+_logger = logging.getLogger(__name__)
+
+# Compañía "Supplies de Colombia"
+SUPPLIES_COMPANY_ID = 1
+
+# Ubicaciones de Supp usadas por las reglas de las rutas de entrega
+ROUTE_LOCATION_NAMES = ('Supp/Existencias', 'Supp/Alistamiento', 'Supp/Salida', 'Supp/Transporte')
+# Ubicaciones de Supp usadas por las reglas de las rutas de devolución
+RETURN_ROUTE_LOCATION_NAMES = ('Supp/Transporte', 'Supp/Devolución', 'Supp/Verificación', 'Supp/Existencias')
+
+
+class WarehouseProvisioning(models.AbstractModel):
+    """
+    Motor de aprovisionamiento masivo de almacenes de clientes.
+
+    Calcula con un anti-join los clientes sin almacén, prepara los valores de
+    todos los almacenes a partir de una plantilla común y los crea por lotes,
+    cada lote dentro de su propio savepoint. El resultado se reporta por cliente.
+
+    También resuelve, una vez por ejecución, el contexto compartido con el que
+    se generan las rutas y reglas de los clientes.
+    """
+    _name = 'warehouse.provisioning'
+    _description = 'Aprovisionamiento Masivo de Almacenes de Clientes'
+
+    @api.model
+    def _get_company(self):
+        company = self.env['res.company'].browse(SUPPLIES_COMPANY_ID)
+        if not company.exists():
+            raise UserError(_(
+                'No se encontró la compañía "Supplies de Colombia" (ID=1).'
+            ))
+        return company
+
+    @api.model
+    def _get_partners_without_warehouse(self):
+        """
+        Devuelve los contactos empresa de tipo "cliente" o "ambos" que no tienen
+        almacén activo, con una sola consulta (NOT EXISTS).
+        """
+        self.env['res.partner'].flush_model(['is_company', 'tipo_contacto', 'active'])
+        self.env['stock.warehouse'].flush_model(['partner_id', 'active'])
+        self.env.cr.execute("""
+            SELECT p.id
+              FROM res_partner p
+             WHERE p.is_company
+               AND p.active
+               AND p.tipo_contacto IN ('cliente', 'ambos')
+               AND NOT EXISTS (
+                    SELECT 1
+                      FROM stock_warehouse w
+                     WHERE w.partner_id = p.id
+                       AND w.active
+               )
+          ORDER BY p.id
+        """)
+        return self.env['res.partner'].browse([row[0] for row in self.env.cr.fetchall()])
+
+    @api.model
+    def _get_warehouse_template(self, company):
+        """
+        Valores comunes a todos los almacenes de clientes. El almacén principal
+        de la compañía se usa para resupply_wh_ids.
+        """
+        main_warehouse = self.env['stock.warehouse'].search([
+            ('company_id', '=', company.id)
+        ], limit=1)
+        if not main_warehouse:
+            raise UserError(_(
+                'No se encontró un almacén principal para la compañía "Supplies de Colombia".'
+            ))
+        return {
+            'company_id': company.id,
+            'reception_steps': 'one_step',
+            'delivery_steps': 'ship_only',
+            'buy_to_resupply': False,
+            'resupply_wh_ids': [(6, 0, [main_warehouse.id])],
+        }
+
+    @api.model
+    def _allocate_warehouse_codes(self, partners, company):
+        """
+        Asigna un código único de almacén a cada contacto con una sola lectura
+        de los códigos existentes (incluye almacenes archivados, que también
+        ocupan el código).
+
+        Código: primeros 5 caracteres del nombre en mayúsculas; si está ocupado,
+        los 4 primeros más un sufijo numérico (1..99).
+
+        :return: ({partner_id: código}, {partner_id: mensaje de error})
+        """
+        used = {
+            code for code in self.env['stock.warehouse'].with_context(active_test=False).search([
+                ('company_id', '=', company.id),
+            ]).mapped('code') if code
+        }
+        codes = {}
+        errors = {}
+        for partner in partners:
+            if not partner.name:
+                errors[partner.id] = _('Contacto sin nombre')
+                continue
+            base_code = partner.name[:5].upper().strip()
+            if not base_code:
+                errors[partner.id] = _('No se pudo generar código válido')
+                continue
+            code = base_code
+            counter = 1
+            while code in used:
+                if counter > 99:  # Límite de seguridad
+                    code = False
+                    break
+                code = f"{base_code[:4]}{counter}"
+                counter += 1
+            if not code:
+                errors[partner.id] = _('No se pudo generar código único')
+                continue
+            used.add(code)
+            codes[partner.id] = code
+        return codes, errors
+
+    @api.model
+    def _prepare_warehouse_vals(self, partner, code, template):
+        return dict(template, name=partner.name, code=code, partner_id=partner.id)
+
+    @api.model
+    def provision_warehouses(self, partners=None, chunk_size=50):
+        """
+        Crea los almacenes que faltan para los contactos indicados (por defecto,
+        todos los clientes sin almacén).
+
+        Cada lote se crea con un solo create() dentro de un savepoint; si el lote
+        falla, se reintenta cliente por cliente para aislar el error.
+
+        :return: diccionario con 'created' ({partner_id: almacén}) y
+            'errors' ({partner_id: mensaje})
+        """
+        if partners is None:
+            partners = self._get_partners_without_warehouse()
+        result = {'created': {}, 'errors': {}}
+        if not partners:
+            return result
+
+        company = self._get_company()
+        template = self._get_warehouse_template(company)
+        codes, result['errors'] = self._allocate_warehouse_codes(partners, company)
+
+        Warehouse = self.env['stock.warehouse']
+        pending = [
+            (partner, self._prepare_warehouse_vals(partner, codes[partner.id], template))
+            for partner in partners if partner.id in codes
+        ]
+        for chunk in split_every(chunk_size, pending, list):
+            try:
+                with self.env.cr.savepoint():
+                    warehouses = Warehouse.create([vals for _partner, vals in chunk])
+                for (partner, _vals), warehouse in zip(chunk, warehouses):
+                    result['created'][partner.id] = warehouse
+                continue
+            except Exception as e:
+                _logger.warning("Lote de %s almacenes falló (%s); reintentando cliente por cliente", len(chunk), e)
+            for partner, vals in chunk:
+                try:
+                    with self.env.cr.savepoint():
+                        result['created'][partner.id] = Warehouse.create(vals)
+                except Exception as e:
+                    result['errors'][partner.id] = str(e)
+
+        _logger.info("Aprovisionamiento de almacenes: %s creados, %s errores",
+                     len(result['created']), len(result['errors']))
+        return result
+
+    # ------------------------------------------------------------
+    # Contexto de aprovisionamiento de rutas
+    # ------------------------------------------------------------
+
+    @api.model
+    def _get_route_locations(self, company):
+        """
+        Resuelve con una sola búsqueda las ubicaciones de Supp de las rutas.
+
+        :return: (ubicaciones de entrega, ubicaciones de devolución); las de
+            devolución admiten búsqueda por segmento (p. ej. sin tilde)
+        """
+        Location = self.env['stock.location'].sudo()
+        names = set(ROUTE_LOCATION_NAMES) | set(RETURN_ROUTE_LOCATION_NAMES)
+        found = {}
+        for location in Location.search([
+            ('complete_name', 'in', list(names)),
+            ('company_id', '=', company.id),
+        ], order='id'):
+            found.setdefault(location.complete_name, location)
+        locations = {name: found.get(name, Location) for name in ROUTE_LOCATION_NAMES}
+        return_locations = {}
+        for name in RETURN_ROUTE_LOCATION_NAMES:
+            location = found.get(name)
+            if not location:
+                location = Location.search([
+                    ('company_id', '=', company.id),
+                    ('complete_name', 'ilike', name.split('/')[-1]),
+                ], limit=1)
+            return_locations[name] = location
+        return locations, return_locations
+
+    @api.model
+    def _get_client_return_types(self, warehouses):
+        """
+        Tipos de operación de devolución propios de cada almacén de cliente,
+        con una sola búsqueda: {warehouse_id: stock.picking.type}.
+        """
+        result = {}
+        if not warehouses:
+            return result
+        picking_types = self.env['stock.picking.type'].sudo().search([
+            ('warehouse_id', 'in', warehouses.ids),
+            '|',
+            ('name', 'ilike', 'Devolución'),
+            ('name', 'ilike', 'Devoluciones'),
+        ])
+        # Preferir los que contienen "Devolución", como _get_client_return_picking_type
+        for picking_type in picking_types.sorted(lambda pt: 'devolución' not in (pt.name or '').lower()):
+            result.setdefault(picking_type.warehouse_id.id, picking_type)
+        return result
+
+    @api.model
+    def _get_return_sequences(self, warehouses, company):
+        """Secuencias de devolución existentes por código: {code: ir.sequence}."""
+        if not warehouses:
+            return {}
+        Partner = self.env['res.partner']
+        codes = ['stock.picking.devolucion.%s' % Partner._get_warehouse_return_code(warehouse) for warehouse in warehouses]
+        result = {}
+        for sequence in self.env['ir.sequence'].sudo().search([
+            ('code', 'in', codes),
+            ('company_id', 'in', [False, company.id]),
+        ]):
+            result.setdefault(sequence.code, sequence)
+        return result
+
+    @api.model
+    def _get_route_context(self, company, warehouses=None):
+        """
+        Resuelve una sola vez por ejecución los objetos compartidos por todas
+        las rutas de clientes: ubicaciones de Supp, almacén principal, tipos de
+        operación y, para los almacenes indicados, sus tipos de operación y
+        secuencias de devolución.
+
+        El contexto es inmutable; el número de consultas no depende del número
+        de clientes.
+        """
+        Partner = self.env['res.partner']
+        warehouses = warehouses or self.env['stock.warehouse']
+        locations, return_locations = self._get_route_locations(company)
+        main_warehouse = Partner._get_main_supp_warehouse(company)
+        return_picking_types = Partner._get_picking_types_for_return_rules(company) if main_warehouse else {}
+        return frozendict({
+            'company': company,
+            'main_warehouse': main_warehouse,
+            'locations': frozendict(locations),
+            'return_locations': frozendict(return_locations),
+            'picking_types': frozendict(Partner._get_picking_types_for_rules(company)),
+            'return_picking_types': frozendict(return_picking_types),
+            'prefetched_warehouse_ids': frozenset(warehouses.ids),
+            'client_return_types': frozendict(self._get_client_return_types(warehouses)),
+            'return_sequences': frozendict(self._get_return_sequences(warehouses, company)),
+        })
+
+    @api.model
+    def _reserve_route_sequences(self, company, count):
+        """
+        Reserva un bloque de `count` números de secuencia de ruta consecutivos,
+        a continuación de la última ruta de la compañía (empezando en 5).
+        """
+        last_route = self.env['stock.route'].sudo().search([
+            ('company_id', '=', company.id)
+        ], order='sequence desc', limit=1)
+        start = last_route.sequence + 1 if last_route and last_route.sequence >= 5 else 5
+        return iter(range(start, start + count))
@@ -2,10 +2,16 @@
 import logging
 from odoo import models, fields, api
 from odoo.exceptions import UserError
+from odoo.tools import split_every
 from odoo.tools.translate import _
 
 _logger = logging.getLogger(__name__)
 
+# Número de registros por lote en la limpieza
+CLEANUP_BATCH_SIZE = 200
+# Dependencias que impiden eliminar una ruta (las reglas son propias de la ruta)
+BLOCKING_DEPENDENCIES = ('products', 'sales', 'warehouses', 'pickings')
+
 
 class CleanupRoutesWizard(models.TransientModel):
     """
@@ -91,6 +97,11 @@ class CleanupRoutesWizard(models.TransientModel):
         readonly=True
     )
     
+    analysis_report = fields.Text(
+        string='Reporte',
+        readonly=True
+    )
+    
     # Modo de acción
     action_mode = fields.Selection([
         ('analyze', 'Solo Analizar'),
@@ -105,15 +116,97 @@ class CleanupRoutesWizard(models.TransientModel):
             wizard.rule_count = len(wizard.rule_ids)
             wizard.picking_type_count = len(wizard.picking_type_ids)
     
+    def _get_route_dependencies(self, routes):
+        """
+        Cuenta, para todas las rutas candidatas a la vez, los registros que las
+        referencian, con una consulta agrupada por tipo de dependencia.
+        
+        :return: {route_id: {'products', 'sales', 'warehouses', 'rules', 'pickings': n}}
+        """
+        keys = BLOCKING_DEPENDENCIES + ('rules',)
+        dependencies = {route_id: dict.fromkeys(keys, 0) for route_id in routes.ids}
+        if not routes:
+            return dependencies
+        
+        def _collect(key, groups):
+            for route, count in groups:
+                if route.id in dependencies:
+                    dependencies[route.id][key] = count
+        
+        if self.check_product_usage:
+            _collect('products', self.env['product.template']._read_group(
+                [('route_ids', 'in', routes.ids)], ['route_ids'], ['__count']))
+        if self.check_sale_usage and 'sale.order' in self.env and 'route_id' in self.env['sale.order']._fields:
+            _collect('sales', self.env['sale.order']._read_group(
+                [('route_id', 'in', routes.ids)], ['route_id'], ['__count']))
+        if self.check_warehouse_usage:
+            _collect('warehouses', self.env['stock.warehouse']._read_group(
+                [('route_ids', 'in', routes.ids)], ['route_ids'], ['__count']))
+        # Reglas activas e inactivas: las de una ruta archivada también están archivadas
+        _collect('rules', self.env['stock.rule'].with_context(active_test=False)._read_group(
+            [('route_id', 'in', routes.ids)], ['route_id'], ['__count']))
+        
+        # Albaranes abiertos con movimientos generados por reglas de la ruta
+        self.env['stock.move'].flush_model(['rule_id', 'picking_id', 'state'])
+        self.env['stock.rule'].flush_model(['route_id'])
+        self.env.cr.execute("""
+            SELECT r.route_id, count(DISTINCT m.picking_id)
+              FROM stock_move m
+              JOIN stock_rule r ON r.id = m.rule_id
+             WHERE r.route_id = ANY(%s)
+               AND m.picking_id IS NOT NULL
+               AND m.state NOT IN ('done', 'cancel')
+          GROUP BY r.route_id
+        """, [routes.ids])
+        for route_id, count in self.env.cr.fetchall():
+            dependencies[route_id]['pickings'] = count
+        return dependencies
+    
+    def _get_unused_picking_types(self):
+        """
+        Tipos de operación de la compañía que no están asociados a ningún almacén
+        ni tienen albaranes abiertos (una lectura de almacenes y un read_group).
+        """
+        picking_types = self.env['stock.picking.type'].search([
+            ('company_id', '=', self.company_id.id)
+        ])
+        if not picking_types:
+            return picking_types
+        
+        type_fields = ['in_type_id', 'out_type_id', 'pick_type_id', 'pack_type_id']
+        used_ids = set()
+        for warehouse in self.env['stock.warehouse'].search_read([], type_fields):
+            used_ids.update(warehouse[field][0] for field in type_fields if warehouse[field])
+        used_ids.update(picking_type.id for [picking_type] in self.env['stock.picking']._read_group(
+            [('picking_type_id', 'in', picking_types.ids), ('state', 'not in', ['done', 'cancel'])],
+            ['picking_type_id'],
+        ))
+        return picking_types.filtered(lambda pt: pt.id not in used_ids)
+    
+    def _format_dependency_report(self, routes, dependencies):
+        """Resumen legible de las rutas en uso y de qué las bloquea."""
+        labels = {
+            'products': _('productos'),
+            'sales': _('órdenes de venta'),
+            'warehouses': _('almacenes'),
+            'pickings': _('albaranes abiertos'),
+        }
+        lines = []
+        for route in routes:
+            counts = dependencies[route.id]
+            lines.append('%s: %s' % (route.name, ', '.join(
+                '%s %s' % (counts[key], labels[key]) for key in BLOCKING_DEPENDENCIES if counts[key]
+            )))
+        if len(lines) > 50:
+            lines = lines[:50] + [_('... y %s rutas más') % (len(lines) - 50)]
+        return '\n'.join(lines)
+    
     def action_analyze(self):
         """Analiza y encuentra rutas, reglas y tipos de operación no utilizados"""
         self.ensure_one()
         
-        _logger.info("=" * 80)
-        _logger.info("INICIO: Análisis de rutas y reglas no utilizadas")
-        _logger.info(f"Patrón: {self.route_name_pattern}")
-        _logger.info(f"Compañía: {self.company_id.name}")
-        _logger.info("=" * 80)
+        _logger.info("INICIO: Análisis de rutas y reglas no utilizadas - Patrón: %s, Compañía: %s",
+                     self.route_name_pattern, self.company_id.name)
         
         # Buscar rutas que coincidan con el patrón
         # El operador 'like' en Odoo usa '%' como comodín
@@ -129,93 +222,37 @@ class CleanupRoutesWizard(models.TransientModel):
         routes = self.env['stock.route'].search(domain)
         _logger.info(f"Rutas encontradas: {len(routes)}")
         
-        # Filtrar rutas no utilizadas
-        unused_routes = self.env['stock.route']
-        used_routes = self.env['stock.route']
-        
-        for route in routes:
-            is_used = False
-            
-            # Verificar uso en productos
-            if self.check_product_usage:
-                products = self.env['product.template'].search([
-                    ('route_ids', 'in', [route.id])
-                ], limit=1)
-                if products:
-                    is_used = True
-                    _logger.info(f"Ruta {route.name} está en uso: asignada a productos")
-            
-            # Verificar uso en órdenes de venta
-            if not is_used and self.check_sale_usage:
-                sales = self.env['sale.order'].search([
-                    ('route_id', '=', route.id)
-                ], limit=1)
-                if sales:
-                    is_used = True
-                    _logger.info(f"Ruta {route.name} está en uso: en órdenes de venta")
-            
-            # Verificar uso en almacenes
-            if not is_used and self.check_warehouse_usage:
-                warehouses = self.env['stock.warehouse'].search([
-                    ('route_ids', 'in', [route.id])
-                ], limit=1)
-                if warehouses:
-                    is_used = True
-                    _logger.info(f"Ruta {route.name} está en uso: asociada a almacenes")
-            
-            if is_used:
-                used_routes |= route
-            else:
-                unused_routes |= route
-        
+        dependencies = self._get_route_dependencies(routes)
+        used_routes = routes.filtered(
+            lambda route: any(dependencies[route.id][key] for key in BLOCKING_DEPENDENCIES)
+        )
+        unused_routes = routes - used_routes
         _logger.info(f"Rutas no utilizadas: {len(unused_routes)}")
         _logger.info(f"Rutas en uso: {len(used_routes)}")
         
-        # Buscar reglas de las rutas no utilizadas
-        rules = self.env['stock.rule'].search([
+        # Reglas de las rutas no utilizadas (se eliminan antes que las rutas)
+        rules = self.env['stock.rule'].with_context(active_test=False).search([
             ('route_id', 'in', unused_routes.ids)
         ])
         _logger.info(f"Reglas encontradas: {len(rules)}")
         
-        # Buscar tipos de operación no utilizados
-        # Solo tipos que no estén asociados a almacenes
-        picking_types = self.env['stock.picking.type'].search([
-            ('company_id', '=', self.company_id.id)
-        ])
-        
-        unused_picking_types = self.env['stock.picking.type']
-        for pt in picking_types:
-            # Verificar si está asociado a algún almacén
-            warehouses = self.env['stock.warehouse'].search([
-                '|', '|', '|',
-                ('in_type_id', '=', pt.id),
-                ('out_type_id', '=', pt.id),
-                ('pick_type_id', '=', pt.id),
-                ('pack_type_id', '=', pt.id)
-            ], limit=1)
-            
-            if not warehouses:
-                # Verificar si tiene pickings activos
-                pickings = self.env['stock.picking'].search([
-                    ('picking_type_id', '=', pt.id),
-                    ('state', 'not in', ['done', 'cancel'])
-                ], limit=1)
-                
-                if not pickings:
-                    unused_picking_types |= pt
-        
+        unused_picking_types = self._get_unused_picking_types()
         _logger.info(f"Tipos de operación no utilizados: {len(unused_picking_types)}")
         
+        report = [_('Rutas analizadas: %s (en uso: %s, sin uso: %s)') % (len(routes), len(used_routes), len(unused_routes))]
+        if used_routes:
+            report.append(_('\nRutas en uso (no se eliminarán):'))
+            report.append(self._format_dependency_report(used_routes, dependencies))
+        
         # Actualizar wizard
         self.write({
             'route_ids': [(6, 0, unused_routes.ids)],
             'rule_ids': [(6, 0, rules.ids)],
-            'picking_type_ids': [(6, 0, unused_picking_types.ids)]
+            'picking_type_ids': [(6, 0, unused_picking_types.ids)],
+            'analysis_report': '\n'.join(report),
         })
         
-        _logger.info("=" * 80)
         _logger.info("FIN: Análisis completado")
-        _logger.info("=" * 80)
         
         return {
             'type': 'ir.actions.client',
@@ -234,104 +271,101 @@ class CleanupRoutesWizard(models.TransientModel):
             }
         }
     
+    def _process_in_batches(self, records, operation, label, errors, progress):
+        """
+        Aplica `operation` a `records` por lotes de CLEANUP_BATCH_SIZE, cada lote
+        en su propio savepoint. Los lotes que fallan se registran en `errors` y
+        el avance de cada lote en `progress`.
+        
+        :return: número de registros procesados
+        """
+        done = 0
+        batches = list(split_every(CLEANUP_BATCH_SIZE, records.ids, list))
+        for index, ids in enumerate(batches, 1):
+            batch = records.browse(ids)
+            try:
+                with self.env.cr.savepoint():
+                    operation(batch)
+                done += len(batch)
+            except Exception as e:
+                error_msg = _('%s - lote %s/%s: %s') % (label, index, len(batches), str(e))
+                _logger.error(error_msg, exc_info=True)
+                errors.append(error_msg)
+            _logger.info("%s: lote %s/%s (%s/%s)", label, index, len(batches), done, len(records))
+        progress.append(_('%s: %s/%s en %s lote(s)') % (label, done, len(records), len(batches)))
+        return done
+    
     def action_execute_cleanup(self):
-        """Ejecuta la limpieza según el modo seleccionado"""
+        """
+        Ejecuta la limpieza según el modo seleccionado, en orden de dependencias:
+        reglas, luego rutas y por último tipos de operación (que solo se desactivan).
+        """
         self.ensure_one()
         
         if not self.route_ids and not self.rule_ids and not self.picking_type_ids:
             raise UserError(_('No hay elementos para procesar. Ejecuta primero el análisis.'))
+        if self.action_mode == 'analyze':
+            raise UserError(_('El modo "Solo Analizar" no modifica registros. Elige desactivar o eliminar.'))
         
-        _logger.info("=" * 80)
         _logger.info(f"INICIO: Ejecución de limpieza - Modo: {self.action_mode}")
-        _logger.info("=" * 80)
         
-        deleted_routes = 0
-        deleted_rules = 0
-        deactivated_routes = 0
-        deactivated_rules = 0
+        delete = self.action_mode == 'delete'
         errors = []
+        progress = []
+        
+        def _unlink(records):
+            records.unlink()
+        
+        def _deactivate(records):
+            records.write({'active': False})
+        
+        rules = self.rule_ids.with_context(active_test=False)
+        routes = self.route_ids.with_context(active_test=False)
+        processed_rules = self._process_in_batches(
+            rules, _unlink if delete else _deactivate, _('Reglas'), errors, progress)
+        processed_routes = self._process_in_batches(
+            routes, _unlink if delete else _deactivate, _('Rutas'), errors, progress)
+        # Tipos de operación: solo desactivar, nunca eliminar directamente (por seguridad)
+        processed_picking_types = self._process_in_batches(
+            self.picking_type_ids, _deactivate, _('Tipos de operación'), errors, progress)
+        
+        _logger.info("FIN: Limpieza completada")
         
-        try:
-            # Procesar reglas primero
-            if self.rule_ids:
-                if self.action_mode == 'delete':
-                    try:
-                        self.rule_ids.unlink()
-                        deleted_rules = len(self.rule_ids)
-                        _logger.info(f"Reglas eliminadas: {deleted_rules}")
-                    except Exception as e:
-                        error_msg = f"Error al eliminar reglas: {str(e)}"
-                        _logger.error(error_msg, exc_info=True)
-                        errors.append(error_msg)
-                elif self.action_mode == 'deactivate':
-                    self.rule_ids.write({'active': False})
-                    deactivated_rules = len(self.rule_ids)
-                    _logger.info(f"Reglas desactivadas: {deactivated_rules}")
-            
-            # Procesar rutas
-            if self.route_ids:
-                if self.action_mode == 'delete':
-                    try:
-                        self.route_ids.unlink()
-                        deleted_routes = len(self.route_ids)
-                        _logger.info(f"Rutas eliminadas: {deleted_routes}")
-                    except Exception as e:
-                        error_msg = f"Error al eliminar rutas: {str(e)}"
-                        _logger.error(error_msg, exc_info=True)
-                        errors.append(error_msg)
-                elif self.action_mode == 'deactivate':
-                    self.route_ids.write({'active': False})
-                    deactivated_routes = len(self.route_ids)
-                    _logger.info(f"Rutas desactivadas: {deactivated_routes}")
-            
-            # Procesar tipos de operación (solo desactivar, nunca eliminar directamente)
-            if self.picking_type_ids:
-                if self.action_mode == 'delete':
-                    # Para tipos de operación, solo desactivar por seguridad
-                    self.picking_type_ids.write({'active': False})
-                    _logger.warning("Tipos de operación desactivados (no eliminados por seguridad)")
-                elif self.action_mode == 'deactivate':
-                    self.picking_type_ids.write({'active': False})
-                    _logger.info(f"Tipos de operación desactivados: {len(self.picking_type_ids)}")
-            
-            _logger.info("=" * 80)
-            _logger.info("FIN: Limpieza completada")
-            _logger.info("=" * 80)
-            
-            # Mensaje de resultado
-            message_parts = []
-            if self.action_mode == 'delete':
-                message_parts.append(_('Limpieza completada:\n'))
-                if deleted_routes > 0:
-                    message_parts.append(_('✅ Rutas eliminadas: %s') % deleted_routes)
-                if deleted_rules > 0:
-                    message_parts.append(_('✅ Reglas eliminadas: %s') % deleted_rules)
-            elif self.action_mode == 'deactivate':
-                message_parts.append(_('Desactivación completada:\n'))
-                if deactivated_routes > 0:
-                    message_parts.append(_('✅ Rutas desactivadas: %s') % deactivated_routes)
-                if deactivated_rules > 0:
-                    message_parts.append(_('✅ Reglas desactivadas: %s') % deactivated_rules)
-                if self.picking_type_ids:
-                    message_parts.append(_('✅ Tipos de operación desactivados: %s') % len(self.picking_type_ids))
-            
-            if errors:
-                message_parts.append(_('\n❌ Errores: %s') % len(errors))
-                for error in errors[:5]:
-                    message_parts.append(f'\n- {error}')
-            
-            return {
-                'type': 'ir.actions.client',
-                'tag': 'display_notification',
-                'params': {
-                    'title': _('Limpieza Completada'),
-                    'message': '\n'.join(message_parts),
-                    'type': 'success' if not errors else 'warning',
-                    'sticky': True,
-                }
+        # Mensaje de resultado
+        message_parts = []
+        if delete:
+            message_parts.append(_('Limpieza completada:\n'))
+            if processed_routes > 0:
+                message_parts.append(_('✅ Rutas eliminadas: %s') % processed_routes)
+            if processed_rules > 0:
+                message_parts.append(_('✅ Reglas eliminadas: %s') % processed_rules)
+        else:
+            message_parts.append(_('Desactivación completada:\n'))
+            if processed_routes > 0:
+                message_parts.append(_('✅ Rutas desactivadas: %s') % processed_routes)
+            if processed_rules > 0:
+                message_parts.append(_('✅ Reglas desactivadas: %s') % processed_rules)
+        if processed_picking_types > 0:
+            message_parts.append(_('✅ Tipos de operación desactivados: %s') % processed_picking_types)
+        
+        if errors:
+            message_parts.append(_('\n❌ Errores: %s') % len(errors))
+            for error in errors[:5]:
+                message_parts.append(f'\n- {error}')
+        
+        self.analysis_report = '\n'.join(filter(None, [
+            self.analysis_report,
+            _('\nProgreso de la limpieza:'),
+            '\n'.join(progress),
+        ] + errors))
+        
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Limpieza Completada'),
+                'message': '\n'.join(message_parts),
+                'type': 'success' if not errors else 'warning',
+                'sticky': True,
             }
-            
-        except Exception as e:
-            _logger.error(f"Error crítico en limpieza: {str(e)}", exc_info=True)
-            raise UserError(_('Error al ejecutar la limpieza: %s') % str(e))
-
+        }